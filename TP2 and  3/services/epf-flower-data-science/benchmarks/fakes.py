@@ -0,0 +1,343 @@
+""" In-memory stand-ins for the external services, used by the tests and the
+    benchmarks to run the application without network access.
+"""
+import copy
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from google.api_core.exceptions import Aborted, NotFound
+
+
+class FakeDocumentSnapshot:
+    """ Content of a document at the time it was read """
+
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+
+class FakeWatch:
+    """ Subscription returned by `on_snapshot` """
+
+    def __init__(self, db: "FakeFirestore", key: tuple, callback: Callable):
+        self._db = db
+        self._key = key
+        self._callback = callback
+
+    def unsubscribe(self) -> None:
+        with self._db._lock:
+            listeners = self._db._listeners.get(self._key, [])
+            if self._callback in listeners:
+                listeners.remove(self._callback)
+
+
+class FakeDocumentReference:
+    """ Document of a FakeFirestore, with the methods of a Firestore document """
+
+    def __init__(self, db: "FakeFirestore", collection: str, document_id: str):
+        self._db = db
+        self.id = document_id
+        self._key = (collection, document_id)
+
+    def get(self, transaction: Optional["FakeTransaction"] = None, **kwargs) -> FakeDocumentSnapshot:
+        with self._db._lock:
+            self._db.reads += 1
+            if transaction is not None:
+                transaction._read_versions[self._key] = self._db._versions.get(self._key, 0)
+            return FakeDocumentSnapshot(self, self._db._documents.get(self._key))
+
+    def set(self, data: dict, merge: bool = False) -> None:
+        self._db._commit([("set", self, data, merge)])
+
+    def update(self, data: dict) -> None:
+        self._db._commit([("update", self, data, False)])
+
+    def delete(self) -> None:
+        self._db._commit([("delete", self, None, False)])
+
+    def on_snapshot(self, callback: Callable) -> FakeWatch:
+        """ Call `callback(snapshots, changes, read_time)` now and after each
+            change of the document, like a Firestore listener
+        """
+        with self._db._lock:
+            self._db._listeners.setdefault(self._key, []).append(callback)
+        callback([self.get()], [], datetime.now(timezone.utc))
+        return FakeWatch(self._db, self._key, callback)
+
+
+class FakeWriteBatch:
+    """ Writes applied together by `commit`, like a Firestore WriteBatch """
+
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._writes: list[tuple] = []
+
+    def set(self, reference: FakeDocumentReference, data: dict, merge: bool = False) -> None:
+        self._writes.append(("set", reference, data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: dict) -> None:
+        self._writes.append(("update", reference, data, False))
+
+    def delete(self, reference: FakeDocumentReference) -> None:
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self) -> list:
+        writes, self._writes = self._writes, []
+        self._db._commit(writes)
+        return writes
+
+
+class FakeTransaction(FakeWriteBatch):
+    """ Optimistic transaction, usable with `firestore.transactional`.
+
+        The commit fails with Aborted if a document read in the transaction
+        was written since, and `firestore.transactional` then runs the
+        function again.
+    """
+
+    def __init__(self, db: "FakeFirestore", max_attempts: int = 5, read_only: bool = False):
+        super().__init__(db)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._read_versions: dict[tuple, int] = {}
+        self._id = None
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._read_versions = {}
+        self._id = None
+
+    def _begin(self, retry_id: Optional[bytes] = None) -> None:
+        self._id = object()
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+    def _commit(self) -> list:
+        writes = self._writes
+        self._db._commit(writes, self._read_versions)
+        self._clean_up()
+        return writes
+
+
+class FakeCollectionReference:
+
+    def __init__(self, db: "FakeFirestore", name: str):
+        self._db = db
+        self.id = name
+
+    def document(self, document_id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self._db, self.id, document_id)
+
+
+class FakeFirestore:
+    """ In-memory Firestore database, to use in place of `firestore.client()`.
+
+        The real client also works against the Firestore emulator when the
+        FIRESTORE_EMULATOR_HOST environment variable is set.
+    """
+
+    def __init__(self, documents: Optional[dict[tuple[str, str], dict]] = None):
+        self._documents = copy.deepcopy(documents or {})
+        self._versions: dict[tuple[str, str], int] = {}
+        self._listeners: dict[tuple, list[Callable]] = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> FakeTransaction:
+        return FakeTransaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def _commit(self, writes: list[tuple], read_versions: Optional[dict] = None) -> None:
+        """ Apply writes atomically, if the documents in `read_versions` did
+            not change since they were read
+        """
+        with self._lock:
+            for key, version in (read_versions or {}).items():
+                if self._versions.get(key, 0) != version:
+                    raise Aborted(f"Document changed during the transaction: {'/'.join(key)}")
+            for operation, reference, _, _ in writes:
+                if operation == "update" and reference._key not in self._documents:
+                    raise NotFound(f"No document to update: {'/'.join(reference._key)}")
+            for operation, reference, data, merge in writes:
+                key = reference._key
+                if operation == "delete":
+                    self._documents.pop(key, None)
+                elif operation == "update" or merge:
+                    self._documents[key] = {**self._documents.get(key, {}), **copy.deepcopy(data)}
+                else:
+                    self._documents[key] = copy.deepcopy(data)
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self.writes += 1
+            self.commits += 1
+        for reference in {reference._key: reference for _, reference, _, _ in writes}.values():
+            self._notify(reference)
+
+    def _notify(self, reference: FakeDocumentReference) -> None:
+        with self._lock:
+            listeners = list(self._listeners.get(reference._key, []))
+        for callback in listeners:
+            callback([reference.get()], [], datetime.now(timezone.utc))
+
+
+class FakeUserRecord:
+    """ User of a FakeAuth, with the attributes of a Firebase UserRecord """
+
+    def __init__(self, uid: str, email: str, custom_claims: Optional[dict] = None):
+        self.uid = uid
+        self.email = email
+        self.custom_claims = custom_claims
+
+
+class FakeUsersPage:
+    """ Page of users returned by `FakeAuth.list_users` """
+
+    def __init__(self, auth: "FakeAuth", users: list[FakeUserRecord], next_page_token: str,
+                 max_results: int):
+        self._auth = auth
+        self.users = users
+        self.next_page_token = next_page_token
+        self._max_results = max_results
+
+    def iterate_all(self):
+        page = self
+        while True:
+            yield from page.users
+            if not page.next_page_token:
+                return
+            page = self._auth.list_users(page.next_page_token, self._max_results)
+
+
+class FakeAuth:
+    """ In-memory stand-in for the `firebase_admin.auth` module, to use in
+        place of `src.services.firebase.auth`.
+
+        Tokens made by `create_token` are verified without network access
+        and expire after an hour, like Firebase ID tokens.
+    """
+
+    class InvalidIdTokenError(ValueError):
+        pass
+
+    class ExpiredIdTokenError(InvalidIdTokenError):
+        pass
+
+    UserRecord = FakeUserRecord
+
+    def __init__(self, users: Optional[list[FakeUserRecord]] = None):
+        self._users = {user.uid: user for user in users or []}
+        self._tokens: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add_user(self, email: str, role: Optional[str] = None) -> FakeUserRecord:
+        user = FakeUserRecord(uuid.uuid4().hex, email, {"role": role} if role else None)
+        with self._lock:
+            self._users[user.uid] = user
+        return user
+
+    def create_token(self, uid: str, expires_in: float = 3600) -> str:
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._tokens[token] = (uid, time.time() + expires_in)
+        return token
+
+    def verify_id_token(self, token: str) -> dict:
+        with self._lock:
+            uid, expires_at = self._tokens.get(token, (None, 0))
+            user = self._users.get(uid)
+        if user is None:
+            raise self.InvalidIdTokenError("Unknown token")
+        if expires_at < time.time():
+            raise self.ExpiredIdTokenError("Token expired")
+        return {"email": user.email, "user_id": user.uid, "exp": expires_at,
+                **(user.custom_claims or {})}
+
+    def get_user(self, uid: str) -> FakeUserRecord:
+        with self._lock:
+            if uid not in self._users:
+                raise NotFound(f"No user with uid {uid}")
+            return self._users[uid]
+
+    def set_custom_user_claims(self, uid: str, custom_claims: Optional[dict]) -> None:
+        self.get_user(uid).custom_claims = custom_claims
+
+    def list_users(self, page_token: Optional[str] = None, max_results: int = 1000) -> FakeUsersPage:
+        with self._lock:
+            users = list(self._users.values())
+        start = int(page_token or 0)
+        end = start + max_results
+        return FakeUsersPage(self, users[start:end], str(end) if end < len(users) else "",
+                             max_results)
+
+
+def _identity_toolkit_error(message: str) -> JSONResponse:
+    return JSONResponse(status_code=400, content={
+        "error": {"code": 400, "message": message, "errors": [{"message": message}]}})
+
+
+def create_identity_toolkit_app(users: Optional[dict[str, str]] = None) -> FastAPI:
+    """ Local stand-in for the sign-up and sign-in endpoints of the
+        identity-toolkit API, to load-test the authentication routes offline.
+
+        Serve it with `uvicorn --factory benchmarks.fakes:create_identity_toolkit_app`
+        and point IDENTITY_TOOLKIT_URL to it, or pass it to
+        IdentityToolkitClient through `httpx.ASGITransport`.
+
+    Args:
+        users (dict, optional): Passwords of the existing accounts, by email
+
+    Returns:
+        FastAPI: The application
+    """
+    app = FastAPI(title="identity-toolkit stand-in")
+    app.state.users = {email: {"password": password, "localId": uuid.uuid4().hex}
+                       for email, password in (users or {}).items()}
+
+    def session(email: str, account: dict) -> dict:
+        return {"localId": account["localId"], "email": email,
+                "idToken": secrets.token_urlsafe(32), "refreshToken": secrets.token_urlsafe(32),
+                "expiresIn": "3600"}
+
+    @app.post("/v1/accounts:signUp")
+    async def sign_up(request: Request):
+        body = await request.json()
+        email, password = body.get("email"), body.get("password")
+        if not email:
+            return _identity_toolkit_error("MISSING_EMAIL")
+        if not password or len(password) < 6:
+            return _identity_toolkit_error("WEAK_PASSWORD : Password should be at least 6 characters")
+        if email in app.state.users:
+            return _identity_toolkit_error("EMAIL_EXISTS")
+        account = {"password": password, "localId": uuid.uuid4().hex}
+        app.state.users[email] = account
+        return session(email, account)
+
+    @app.post("/v1/accounts:signInWithPassword")
+    async def sign_in_with_password(request: Request):
+        body = await request.json()
+        account = app.state.users.get(body.get("email"))
+        if account is None:
+            return _identity_toolkit_error("EMAIL_NOT_FOUND")
+        if account["password"] != body.get("password"):
+            return _identity_toolkit_error("INVALID_PASSWORD")
+        return {**session(body["email"], account), "registered": True}
+
+    return app
@@ -0,0 +1,328 @@
+""" Load-test the routes of the application offline, and compare the
+    results with a baseline.
+
+    The application is built by get_application() in a server process, with
+    Firebase Auth, Firestore and the identity-toolkit API replaced by the
+    in-memory fakes of benchmarks/fakes.py, and a generated iris dataset. Each
+    route is then driven at a fixed concurrency; the throughput, latency
+    percentiles and server RSS are written to a JSON results file.
+
+    python benchmarks/load_test.py run [--concurrency 16] [--requests 500] [--routes iris_predict_one users] [--output load_test.json]
+    python benchmarks/load_test.py compare baseline.json load_test.json [--tolerance 0.15]
+    python benchmarks/load_test.py serve --port 8765 --workdir /tmp/load-test
+
+    The rate limiter is disabled, and the training routes are left out since
+    they replace the model artifact.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import numpy as np
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+EMAIL = "load-test@example.com"
+PASSWORD = "load-test-password"
+
+PARAMETERS = {
+    "n_estimators": 100, "max_depth": 10, "min_samples_split": 2, "min_samples_leaf": 1,
+    "max_features": "sqrt", "max_leaf_nodes": 20, "criterion": "gini",
+}
+
+# Mean sepal length, sepal width, petal length and petal width by species
+IRIS_MEANS = {
+    "Iris-setosa": (5.0, 3.4, 1.5, 0.2),
+    "Iris-versicolor": (5.9, 2.8, 4.3, 1.3),
+    "Iris-virginica": (6.6, 3.0, 5.6, 2.0),
+}
+
+# Requests sent to each route, "admin" ones with the token of an admin
+SCENARIOS = {
+    "iris_load": {"method": "GET", "url": "/iris/load", "params": {"limit": 50}},
+    "iris_process": {"method": "GET", "url": "/iris/process", "params": {"limit": 50}},
+    "iris_split": {"method": "GET", "url": "/iris/split"},
+    "iris_predict_split": {"method": "GET", "url": "/iris/predict"},
+    "iris_predict_one": {"method": "POST", "url": "/iris/predict",
+                         "json": {"rows": [[5.1, 3.5, 1.4, 0.2]]}},
+    "iris_predict_batch": {"method": "POST", "url": "/iris/predict",
+                           "json": {"rows": [[5.9, 3.0, 5.1, 1.8]] * 100}},
+    "iris_model": {"method": "GET", "url": "/iris/model"},
+    "dataset_get": {"method": "GET", "url": "/dataset/iris"},
+    "parameters_get": {"method": "GET", "url": "/parameters"},
+    "parameters_put": {"method": "PUT", "url": "/parameters", "json": {"n_estimators": 100}},
+    "token": {"method": "POST", "url": "/token", "data": {"username": EMAIL, "password": PASSWORD}},
+    "users": {"method": "GET", "url": "/users", "admin": True},
+    "users_page": {"method": "GET", "url": "/users", "params": {"page_size": 50}, "admin": True},
+}
+
+
+def write_iris_csv(path: Path, rows: int, seed: int = 0) -> None:
+    """ Write a dataset in the format of the Kaggle iris CSV file """
+    rng = np.random.default_rng(seed)
+    species = list(IRIS_MEANS)
+    lines = ["Id,SepalLengthCm,SepalWidthCm,PetalLengthCm,PetalWidthCm,Species"]
+    for i in range(rows):
+        name = species[i % len(species)]
+        values = np.round(np.asarray(IRIS_MEANS[name]) + rng.normal(0, 0.2, size=4), 1)
+        lines.append(",".join([str(i + 1), *map(str, np.abs(values)), name]))
+    path.write_text("\n".join(lines) + "\n")
+
+
+def create_offline_app(workdir: Path, rows: int = 150, users: int = 200):
+    """ Build the application with fakes in place of the external services.
+
+    Args:
+        workdir (Path): Directory of the generated dataset, of the model
+            trained on it and of a copy of the datasets catalogue
+        rows (int): Number of rows of the dataset
+        users (int): Number of Firebase users
+
+    Returns:
+        tuple: The application and the ID token of an admin
+    """
+    from src.app import get_application
+    from src.services import data, firebase
+    from benchmarks.fakes import FakeAuth, FakeFirestore, create_identity_toolkit_app
+    from src.services.firestore import FirestoreClient, ParametersCache
+    from src.services.identity_toolkit import IdentityToolkitClient
+    from src.services.model_store import model_holder
+    from src.services.train import train_and_evaluate_iris
+
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    write_iris_csv(workdir / "iris.csv", rows)
+    shutil.copy(data.JSON_CONFIG_PATH, workdir / "urls_config.json")
+    data.DATA_FILE_PATH = workdir
+    data.JSON_CONFIG_PATH = workdir / "urls_config.json"
+    # Served instead of the artifact of the repository
+    model_holder.path = workdir / "iris_model.joblib"
+    train_and_evaluate_iris()
+
+    fake_auth = FakeAuth()
+    admin = fake_auth.add_user("admin@example.com", role="admin")
+    for i in range(users):
+        fake_auth.add_user(f"user{i}@example.com", role="default")
+    firebase.auth = fake_auth
+    db = FakeFirestore({("parameters", "parameters"): PARAMETERS})
+
+    app = get_application()
+    # No credentials nor certificates to fetch
+    app.router.on_startup.remove(firebase.initialize_firebase)
+    app.state.rate_limiter.enabled = False
+    app.state.parameters_cache = ParametersCache(client_factory=lambda: FirestoreClient(db=db))
+    app.state.identity_toolkit = IdentityToolkitClient(
+        base_url="http://identity-toolkit", api_key="load-test",
+        transport=httpx.ASGITransport(app=create_identity_toolkit_app({EMAIL: PASSWORD})))
+    return app, fake_auth.create_token(admin.uid, expires_in=24 * 3600)
+
+
+def request_kwargs(scenario: dict, token: str) -> dict:
+    kwargs = {key: value for key, value in scenario.items() if key != "admin"}
+    if scenario.get("admin"):
+        kwargs["headers"] = {"Authorization": f"Bearer {token}"}
+    return kwargs
+
+
+def read_rss(pid: int) -> dict:
+    """ Return the current and peak RSS of a process, in kB """
+    rss = {}
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name in ("VmRSS", "VmHWM"):
+            rss["rss_kb" if name == "VmRSS" else "peak_rss_kb"] = int(value.split()[0])
+    return rss
+
+
+async def drive(client: httpx.AsyncClient, kwargs: dict, requests: int, concurrency: int) -> dict:
+    """ Send `requests` requests, `concurrency` at a time, and return the
+        throughput and latency percentiles
+    """
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(np.max(latencies)),
+    }
+
+
+def start_server(workdir: Path, rows: int) -> tuple[subprocess.Popen, str, str]:
+    """ Start the offline server and wait until it answers.
+
+    Returns:
+        tuple: The server process, its URL and the admin token
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "ACCESS_TOKEN_EXPIRE_MINUTES": os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")}
+    process = subprocess.Popen(
+        [sys.executable, __file__, "serve", "--port", str(port), "--workdir", str(workdir),
+         "--rows", str(rows)], cwd=SERVICE_ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    token_path = Path(workdir) / "admin_token"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            if token_path.exists() and httpx.get(f"{url}/hello/load-test").status_code == 200:
+                return process, url, token_path.read_text()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The server did not start within 60s")
+
+
+async def run_scenarios(url: str, token: str, pid: int, names: list[str], requests: int,
+                        concurrency: int, warmup: int) -> dict:
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        for name in names:
+            kwargs = request_kwargs(SCENARIOS[name], token)
+            await drive(client, kwargs, warmup, min(concurrency, max(warmup, 1)))
+            results[name] = {**await drive(client, kwargs, requests, concurrency), **read_rss(pid)}
+            print(f"{name:>20} {results[name]['throughput_rps']:>9.1f} rps "
+                  f"p50 {results[name]['p50_ms']:>8.2f} ms p95 {results[name]['p95_ms']:>8.2f} ms "
+                  f"p99 {results[name]['p99_ms']:>8.2f} ms errors {results[name]['errors']:>4} "
+                  f"rss {results[name]['rss_kb'] / 1024:>7.1f} MB", flush=True)
+    return results
+
+
+def run(names: list[str], requests: int, concurrency: int, warmup: int, rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        process, url, token = start_server(Path(workdir), rows)
+        try:
+            idle = read_rss(process.pid)
+            routes = asyncio.run(run_scenarios(url, token, process.pid, names, requests,
+                                               concurrency, warmup))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "concurrency": concurrency,
+        "requests": requests,
+        "rows": rows,
+        "idle_rss_kb": idle.get("rss_kb"),
+        "routes": routes,
+    }
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[dict]:
+    """ Return the regressions of `current` against `baseline`: a lower
+        throughput, higher latency percentiles or RSS by more than
+        `tolerance`, or more errors
+    """
+    checks = [("throughput_rps", -1), ("p50_ms", 1), ("p95_ms", 1), ("p99_ms", 1), ("rss_kb", 1)]
+    regressions = []
+    for name, result in current["routes"].items():
+        reference = baseline["routes"].get(name)
+        if reference is None:
+            continue
+        for metric, direction in checks:
+            before, after = reference.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change * direction > tolerance:
+                regressions.append({"route": name, "metric": metric, "baseline": before,
+                                    "current": after, "change": change})
+        if result["errors"] > reference["errors"]:
+            regressions.append({"route": name, "metric": "errors", "baseline": reference["errors"],
+                                "current": result["errors"], "change": None})
+    return regressions
+
+
+def serve(port: int, workdir: Path, rows: int) -> None:
+    import uvicorn
+
+    app, token = create_offline_app(workdir, rows=rows)
+    (Path(workdir) / "admin_token").write_text(token)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Load-test the routes")
+    run_parser.add_argument("--routes", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    run_parser.add_argument("--requests", type=int, default=500, help="Requests per route")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--warmup", type=int, default=20, help="Requests per route before measuring")
+    run_parser.add_argument("--rows", type=int, default=150, help="Rows of the generated dataset")
+    run_parser.add_argument("--output", type=Path, default=Path("load_test.json"))
+
+    compare_parser = commands.add_parser("compare", help="Flag the regressions against a baseline")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--tolerance", type=float, default=0.15,
+                                help="Relative change allowed before flagging a regression")
+
+    serve_parser = commands.add_parser("serve", help="Run the offline server")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--workdir", type=Path, default=Path(tempfile.gettempdir()) / "load-test")
+    serve_parser.add_argument("--rows", type=int, default=150)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.port, args.workdir, args.rows)
+    elif args.command == "run":
+        results = run(args.routes, args.requests, args.concurrency, args.warmup, args.rows)
+        args.output.write_text(json.dumps(results, indent=4))
+        print(f"Results written to {args.output}")
+    else:
+        regressions = compare(json.loads(args.baseline.read_text()),
+                              json.loads(args.current.read_text()), args.tolerance)
+        for regression in regressions:
+            change = "" if regression["change"] is None else f" ({regression['change']:+.0%})"
+            print(f"REGRESSION {regression['route']} {regression['metric']}: "
+                  f"{regression['baseline']:.6g} -> {regression['current']:.6g}{change}")
+        if not regressions:
+            print("No regression")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
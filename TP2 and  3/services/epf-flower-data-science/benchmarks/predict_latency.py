@@ -0,0 +1,81 @@
+""" Compare the prediction latency of the sklearn model and of the flat-array
+    evaluator, per call, at several batch sizes.
+
+    python benchmarks/predict_latency.py [--model PATH] [--batch-sizes 1 32 1024] [--json]
+"""
+import argparse
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.services.model_store import MODEL_PATH  # noqa: E402
+from src.services.predict import FlatForest  # noqa: E402
+
+
+def time_calls(function, repeat: int) -> dict:
+    """ Call a function `repeat` times and return its latency percentiles in ms """
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "mean_ms": float(np.mean(timings)),
+    }
+
+
+def run(model_path: Path, batch_sizes: list[int], repeat: int) -> list[dict]:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        model = joblib.load(model_path)
+    forest = FlatForest.from_model(model)
+    rng = np.random.default_rng(0)
+
+    results = []
+    for batch_size in batch_sizes:
+        X = rng.uniform(0, 8, size=(batch_size, model.n_features_in_))
+        features = pd.DataFrame(X, columns=model.feature_names_in_)
+        np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(features),
+                                   atol=1e-9)
+        sklearn_timing = time_calls(lambda: model.predict_proba(features), repeat)
+        flat_timing = time_calls(lambda: forest.predict_proba(X), repeat)
+        results.append({
+            "batch_size": batch_size,
+            "sklearn": sklearn_timing,
+            "flat": flat_timing,
+            "speedup": sklearn_timing["p50_ms"] / flat_timing["p50_ms"],
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--model", type=Path, default=MODEL_PATH)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 1024])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.model, args.batch_sizes, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print(f"{'batch':>6} {'sklearn p50 ms':>15} {'flat p50 ms':>12} {'speedup':>8}")
+    for result in results:
+        print(f"{result['batch_size']:>6} {result['sklearn']['p50_ms']:>15.3f} "
+              f"{result['flat']['p50_ms']:>12.3f} {result['speedup']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
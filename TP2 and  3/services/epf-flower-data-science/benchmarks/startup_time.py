@@ -0,0 +1,93 @@
+""" Measure the time to import the application and build it with
+    get_application(), in a fresh interpreter run with `-X importtime`, and
+    fail when it goes over the budget.
+
+    python benchmarks/startup_time.py [--budget 2.0] [--repeat 3] [--top 15] [--json]
+
+    The heavy dependencies (pandas, scikit-learn, firebase_admin...) are
+    imported by the first request that needs them, not at startup: the
+    imports that take the longest are listed to find the ones that crept back.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+
+# Seconds allowed to import src.app and call get_application()
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.0"))
+
+# Modules that must not be imported by get_application()
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "firebase_admin", "google.cloud.firestore", "requests"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from src.app import get_application
+get_application()
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds,
+                  "heavy_modules": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """ Parse the `-X importtime` report into the imports and their times, in ms """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                        "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return imports
+
+
+def measure_startup() -> dict:
+    """ Build the application in a new interpreter.
+
+    Returns:
+        dict: The seconds taken, the heavy modules that were imported and the
+            imports with their times
+    """
+    env = {**os.environ, "ACCESS_TOKEN_EXPIRE_MINUTES": os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE % HEAVY_MODULES],
+        cwd=SERVICE_ROOT, env=env, capture_output=True, text=True, check=True)
+    return {**json.loads(result.stdout.strip().splitlines()[-1]),
+            "imports": parse_importtime(result.stderr)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="Budget in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Keep the fastest of this many runs")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest packages to list")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    result = min((measure_startup() for _ in range(args.repeat)), key=lambda run: run["seconds"])
+    # Packages, wherever they were first imported from
+    slowest = sorted((i for i in result["imports"] if "." not in i["module"]),
+                     key=lambda i: i["cumulative_ms"], reverse=True)[:args.top]
+    over_budget = result["seconds"] > args.budget or bool(result["heavy_modules"])
+
+    if args.json:
+        print(json.dumps({"seconds": result["seconds"], "budget": args.budget,
+                          "heavy_modules": result["heavy_modules"], "slowest_packages": slowest,
+                          "over_budget": over_budget}, indent=4))
+    else:
+        print(f"get_application(): {result['seconds']:.3f}s (budget {args.budget:.3f}s)")
+        if result["heavy_modules"]:
+            print(f"heavy modules imported at startup: {', '.join(result['heavy_modules'])}")
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for i in slowest:
+            print(f"{i['cumulative_ms']:>14.1f} {i['self_ms']:>9.1f}  {i['module']}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+""" Measure the memory of the gunicorn workers, before and after serving
+    some predictions, from /proc/<pid>/smaps_rollup (Linux).
+
+    RSS counts the pages shared with the master in every worker, PSS splits
+    them between the processes sharing them: with the model preloaded in the
+    master, the PSS of a worker is well below its RSS.
+
+    gunicorn -c gunicorn.conf.py &
+    python benchmarks/worker_memory.py --pid <master pid> [--url http://localhost:8080] [--requests 200] [--json]
+
+    Run it once more against a server started with GUNICORN_PRELOAD=0 to
+    compare.
+"""
+import argparse
+import json
+from pathlib import Path
+
+import httpx
+
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def read_rollup(pid: int) -> dict:
+    """ Return the memory counters of a process, in kB """
+    counters = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name in FIELDS:
+            counters[name] = int(value.split()[0])
+    return counters
+
+
+def children(pid: int) -> list[int]:
+    """ Return the processes whose parent is `pid` """
+    pids = []
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # The command name, in parentheses, may contain spaces
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(stat.parent.name))
+    return sorted(pids)
+
+
+def snapshot(master: int) -> dict:
+    workers = {}
+    for pid in children(master):
+        try:
+            workers[pid] = read_rollup(pid)
+        except OSError:
+            pass
+    return {"master": read_rollup(master), "workers": workers}
+
+
+FLOWERS = [
+    {"id": 1, "sepal_length": 5.1, "sepal_width": 3.5, "petal_length": 1.4, "petal_width": 0.2},
+    {"id": 150, "sepal_length": 5.9, "sepal_width": 3.0, "petal_length": 5.1, "petal_width": 1.8},
+]
+
+
+def send_predictions(url: str, requests: int) -> None:
+    with httpx.Client(base_url=url, timeout=30) as client:
+        # The models trained before the id was dropped from the features expect it
+        features = client.get("/iris/model").json()["features"]
+        rows = [[flower[name] for name in features] for flower in FLOWERS]
+        for _ in range(requests):
+            client.post("/iris/predict", json={"rows": rows})
+
+
+def print_snapshot(title: str, measures: dict) -> None:
+    print(title)
+    print(f"{'process':>10}" + "".join(f"{field:>15}" for field in FIELDS))
+    rows = [("master", measures["master"])] + list(measures["workers"].items())
+    for name, counters in rows:
+        print(f"{name:>10}" + "".join(f"{counters.get(field, 0):>12} kB" for field in FIELDS))
+    workers = list(measures["workers"].values())
+    if workers:
+        print(f"{'workers':>10}" + "".join(
+            f"{sum(counters.get(field, 0) for counters in workers):>12} kB" for field in FIELDS))
+    print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, required=True, help="PID of the gunicorn master")
+    parser.add_argument("--url", help="Base URL of the server, to send predictions between the measures")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print the measures as JSON")
+    args = parser.parse_args()
+
+    measures = {"before": snapshot(args.pid)}
+    if args.url:
+        send_predictions(args.url, args.requests)
+        measures["after"] = snapshot(args.pid)
+
+    if args.json:
+        print(json.dumps(measures, indent=2))
+        return
+    for title, snapshot_measures in measures.items():
+        print_snapshot(title, snapshot_measures)
+
+
+if __name__ == "__main__":
+    main()
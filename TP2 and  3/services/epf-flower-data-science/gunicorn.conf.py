@@ -0,0 +1,81 @@
+""" Production server: gunicorn -c gunicorn.conf.py
+
+    Uvicorn workers, one per CPU (or WEB_CONCURRENCY), forked from a master
+    that imported the application and loaded the dataset and the model, see
+    src/services/serving.py. A new model artifact makes the master send itself
+    a HUP, reload the model and replace its workers gracefully, like
+    `kill -HUP <master pid>` does.
+    Set GUNICORN_PRELOAD=0 to load everything in each worker instead, e.g. to
+    compare the memory of the workers with benchmarks/worker_memory.py.
+"""
+import glob
+import os
+import signal
+import sys
+import tempfile
+
+# The workers count the rate limits together, in a file of the host
+os.environ.setdefault("RATE_LIMIT_STORAGE_URI", "sqlite:///" + os.path.join(
+    tempfile.gettempdir(), "epf-flower-data-science-rate-limits.db"))
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+# The preloading master watches the model artifact, its workers do not need
+# to. Without preloading, each worker watches it.
+if preload_app:
+    os.environ.setdefault("MODEL_RELOAD_INTERVAL", "inf")
+# The workers write their metrics to files that GET /metrics sums. The
+# files are deleted when the master starts, not when a HUP makes it run this
+# file again, so that the counters start from zero once per server.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(
+    tempfile.gettempdir(), "epf-flower-data-science-metrics"))
+if os.environ.get("METRICS_DIR_CLEARED_BY") != str(os.getpid()):
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+    os.environ["METRICS_DIR_CLEARED_BY"] = str(os.getpid())
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.services.serving import worker_count  # noqa: E402
+
+wsgi_app = "main:app"
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = worker_count()
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+
+def when_ready(server):
+    """ Runs in the master once the app is loaded, before the workers fork """
+    if not server.cfg.preload_app:
+        return
+    from src.services.serving import ArtifactWatcher, preload
+
+    preload()
+    server.artifact_watcher = ArtifactWatcher(on_change=lambda: os.kill(server.pid, signal.SIGHUP))
+    server.artifact_watcher.start()
+
+
+def on_reload(server):
+    """ Runs in the main loop of the master on a HUP, before the new workers fork """
+    watcher = getattr(server, "artifact_watcher", None)
+    if watcher is not None:
+        watcher.apply()
+
+
+def on_exit(server):
+    watcher = getattr(server, "artifact_watcher", None)
+    if watcher is not None:
+        watcher.stop()
+
+
+def child_exit(server, worker):
+    """ Drop the gauges of a worker that exited from the sums of /metrics """
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -5,4 +5,5 @@ from src.app import get_application
 app = get_application()
 
 if __name__ == "__main__":
+    # Development server, in production: gunicorn -c gunicorn.conf.py
     uvicorn.run("main:app", debug=True, reload=True, port=8080)
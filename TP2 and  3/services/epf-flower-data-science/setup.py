@@ -17,6 +17,7 @@ setup(
         "httpx",
         "scikit-learn",
         "pytest-asyncio",
-        "slowapi",
+        "limits",
+        "prometheus_client",
     ],
 )
@@ -1,19 +1,17 @@
 """API Router for Fast API."""
 from fastapi import APIRouter
 from fastapi.responses import RedirectResponse
-from src.services.firebase import FirebaseClient
-from src.api.routes import hello, dataset, iris, parameters, authentication
+from src.api.routes import hello, dataset, iris, parameters, authentication, metrics, profiles
 
 router = APIRouter()
 
-# Initialize Firebase client once for the whole app
-FirebaseClient()
-
 router.include_router(hello.router, tags=["Hello"])
 router.include_router(dataset.router, tags=["Dataset"])
 router.include_router(iris.router, tags=["Iris"])
 router.include_router(parameters.router, tags=["Parameters"])
 router.include_router(authentication.router, tags=["Authentication"])
+router.include_router(metrics.router, tags=["Metrics"])
+router.include_router(profiles.router, tags=["Profiles"])
 
 
 @router.get("/")
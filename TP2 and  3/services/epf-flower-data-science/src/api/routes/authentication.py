@@ -1,21 +1,28 @@
-from fastapi import APIRouter, status, Request, HTTPException, Depends
+import asyncio
+import itertools
+import json
+import logging
+from typing import Iterator, Optional
+from fastapi import APIRouter, status, Request, HTTPException, Depends, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
-import requests
+from fastapi.responses import JSONResponse, StreamingResponse
+from src.services.identity_toolkit import IdentityToolkitClient
+from src.services.rate_limit import RateLimiter, get_rate_limiter
 from src.services.firebase import (
     get_users,
+    iter_users,
+    list_users_page,
+    users_snapshot,
+    USERS_PAGE_SIZE,
     set_role,
     verify_firebase_token,
-    FIREBASE_SIGNUP_URL,
-    FIREBASE_AUTH_URL
+    cert_refresher,
+    token_cache,
 )
 
-from src.schemas.firebase import RegisterRequest, FirebaseUser
+from src.schemas.firebase import RegisterRequest, FirebaseUser, UsersFormat
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-
-limiter = Limiter(key_func=get_remote_address, default_limits=["5 per minute"])
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -35,22 +42,20 @@ def protected_route(token: str = Depends(oauth2_scheme)):
     )
 
 
-@router.post("/register")
-def register_user(request: RegisterRequest):
-    payload = {
-        "email": request.email,
-        "password": request.password,
-        "returnSecureToken": True
-    }
-    headers = {"Content-Type": "application/json"}
+def get_identity_toolkit(request: Request) -> IdentityToolkitClient:
+    """ Return the identity-toolkit client of the application """
+    return request.app.state.identity_toolkit
 
-    response = requests.post(
-        FIREBASE_SIGNUP_URL, headers=headers, json=payload)
+
+@router.post("/register")
+async def register_user(request: RegisterRequest,
+                        identity_toolkit: IdentityToolkitClient = Depends(get_identity_toolkit)):
+    response = await identity_toolkit.sign_up(request.email, request.password)
 
     if response.status_code == 200:
 
         if request.role:
-            set_role(response.json().get("localId"), role=request.role)
+            await asyncio.to_thread(set_role, response.json().get("localId"), role=request.role)
         return JSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={"message": "Registration successful", "user_id": response.json().get(
@@ -64,17 +69,12 @@ def register_user(request: RegisterRequest):
 
 
 @router.post("/token")
-def login_user(request: OAuth2PasswordRequestForm = Depends()):
+async def login_user(request: OAuth2PasswordRequestForm = Depends(),
+                     identity_toolkit: IdentityToolkitClient = Depends(get_identity_toolkit)):
     """
     Connexion d'un utilisateur via Firebase et génération d'un token JWT.
     """
-    payload = {
-        "email": request.username,
-        "password": request.password,
-        "returnSecureToken": True
-    }
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(FIREBASE_AUTH_URL, headers=headers, json=payload)
+    response = await identity_toolkit.sign_in_with_password(request.username, request.password)
 
     if response.status_code == 200:
         firebase_response = response.json()
@@ -110,14 +110,106 @@ def verify_admin(token: str = Depends(oauth2_scheme)):
     return payload
 
 
+def _user_dict(user: FirebaseUser) -> dict:
+    return {"email": user.email, "user_id": user.user_id, "role": user.role}
+
+
+def _ndjson_users(users: Iterator[FirebaseUser]) -> Iterator[str]:
+    """ Write the users as JSON lines. The status of the response is already
+        sent when a later page fails: the stream then ends with an error record.
+    """
+    try:
+        for user in users:
+            yield user.json(include={"email", "user_id", "role"}) + "\n"
+    except Exception as e:
+        logger.exception("The listing of the users stopped")
+        yield json.dumps({"error": f"The listing of the users stopped: {e}"}) + "\n"
+
+
 @router.get("/users",
             response_model=list[FirebaseUser],
             dependencies=[Depends(verify_admin)])
-@limiter.limit("5/minute")
-def get_firebase_users(request: Request):
+def get_firebase_users(
+    page_token: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=USERS_PAGE_SIZE),
+    output_format: UsersFormat = Query(UsersFormat.json, alias="format"),
+    snapshot: bool = False,
+):
+    """ List the Firebase users
+
+    Args:
+        page_token (str, optional): Start from this page, given by the
+            X-Next-Page-Token header of the previous one
+        page_size (int, optional): Return a single page of this many users,
+            or fetch the pages by this many users when streaming
+        output_format (UsersFormat): json (default), or ndjson to stream the
+            users while the next pages are fetched
+        snapshot (bool): Serve all the users from a listing shared by the
+            requests of the last USERS_SNAPSHOT_TTL seconds
+
+    Returns:
+        list[FirebaseUser]: The users
+    """
+    if snapshot and page_token is None and page_size is None:
+        users, age = users_snapshot.get()
+        headers = {"X-Snapshot-Age": f"{age:.3f}"}
+        if output_format == UsersFormat.ndjson:
+            return StreamingResponse(_ndjson_users(iter(users)),
+                                     media_type="application/x-ndjson", headers=headers)
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=[_user_dict(user) for user in users],
+            headers=headers
+        )
+
+    if output_format == UsersFormat.ndjson:
+        users = iter_users(page_token, page_size or USERS_PAGE_SIZE)
+        # The first page is fetched before the response starts, so that its
+        # errors get an error status
+        first_user = next(users, None)
+        if first_user is not None:
+            users = itertools.chain([first_user], users)
+        return StreamingResponse(_ndjson_users(users), media_type="application/x-ndjson")
+
+    if page_token is not None or page_size is not None:
+        users, next_page_token = list_users_page(page_token, page_size or USERS_PAGE_SIZE)
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=[_user_dict(user) for user in users],
+            headers={"X-Next-Page-Token": next_page_token} if next_page_token else None
+        )
+
     users: list[FirebaseUser] = get_users()
     return JSONResponse(
         status_code=status.HTTP_200_OK,
-        content=[{"email": user.email, "user_id": user.user_id,
-                  "role": user.role} for user in users]
+        content=[_user_dict(user) for user in users]
+    )
+
+
+@router.get("/token/cache", dependencies=[Depends(verify_admin)])
+def get_token_cache_stats():
+    """ Get the hit rate of the verified-token cache and the state of the
+        certificate refresher
+
+    Returns:
+        dict: The token cache counters, with the certificate refresher
+            counters under "certificates"
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={**token_cache.stats(), "certificates": cert_refresher.stats()}
+    )
+
+
+@router.get("/rate-limits", dependencies=[Depends(verify_admin)])
+def get_rate_limit_stats(rate_limiter: RateLimiter = Depends(get_rate_limiter)):
+    """ Get the requests allowed and rejected by the rate limiter
+
+    Returns:
+        dict: The counters of this worker, in total and by route, with the
+            limits and the storage shared by the workers
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=rate_limiter.stats()
     )
@@ -1,6 +1,7 @@
+from typing import Optional
 from fastapi.responses import JSONResponse
-from src.services.data import Dataset, get_dataset_infos, open_configs_file, write_configs_file, dump_configs_file
-from fastapi import APIRouter, HTTPException, status
+from src.services.data import Dataset, get_dataset_infos, add_dataset, save_dataset, remove_dataset, download_dataset
+from fastapi import APIRouter, status
 
 router = APIRouter()
 
@@ -37,12 +38,7 @@ async def post_dataset(dataset: Dataset):
         403: The dataset already exists
         500: The configuration file was not found / Error happened while reading it
     """
-    urls = open_configs_file()
-    if dataset.name in urls:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Dataset already exists: {dataset.name}. Use PUT if you wish to update it.")
-    write_configs_file(dataset)
+    add_dataset(dataset)
     return JSONResponse(
         content=get_dataset_infos(dataset.name).dict(),
         status_code=status.HTTP_201_CREATED
@@ -65,10 +61,7 @@ async def put_dataset(dataset: Dataset):
         201: The dataset was successfully added
         500: The configuration file was not found / Error happened while reading it / Error happened while writing it
     """
-    urls = open_configs_file()
-    ressource_exists = dataset.name in urls
-
-    write_configs_file(dataset)
+    ressource_exists = not save_dataset(dataset)
 
     updated_dataset_info = get_dataset_infos(dataset.name)
     if ressource_exists:
@@ -97,14 +90,32 @@ async def delete_dataset(dataset_id: str):
         404: The dataset was not found
         500: The configuration file was not found / Error happened while reading it / Error happened while writing it
     """
-    datasets = open_configs_file()
-    if dataset_id not in datasets:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Dataset not found: {dataset_id}")
-    del datasets[dataset_id]
-    dump_configs_file(datasets)
+    remove_dataset(dataset_id)
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={"message": f"Dataset {dataset_id} was successfully deleted"}
     )
+
+
+@router.post("/dataset/{dataset_id}/download")
+async def download_dataset_archive(dataset_id: str, sha256: Optional[str] = None):
+    """ Download the archive of a dataset to the data folder
+
+    Args:
+        dataset_id (str): The name of the dataset to download
+        sha256 (str, optional): Expected SHA-256 digest of the archive
+
+    Returns:
+        dict: The path and size of the downloaded archive
+
+    Raises:
+        400: Invalid URL
+        404: The dataset was not found
+        502: The download failed or the checksum does not match
+    """
+    dataset: Dataset = get_dataset_infos(dataset_id)
+    path = await download_dataset(dataset.url, dataset.name, sha256=sha256)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"path": str(path), "size": path.stat().st_size}
+    )
@@ -1,59 +1,104 @@
+from typing import Optional
 from fastapi.responses import JSONResponse
-from fastapi import APIRouter, HTTPException, status
-from src.services.train import train_and_save_iris, test_train_split_iris, process_iris_df, get_iris_local
-from src.services.predict import predict_iris
-import requests
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from src.services.train import train_and_evaluate_iris, train_incremental_iris, test_train_split_iris
+from src.services.jobs import training_jobs
+from src.services.sweep import expand_space, run_sweep
+from src.services.data import get_iris_local, get_processed_iris
+from src.services.predict import MicroBatcher, get_batcher, predict_iris, predict_rows
+from src.services.model_store import model_holder, read_manifest
+from src.services.cache import dataset_cache, split_cache
+from src.services.utils import dataframe_response
+from src.schemas.iris import OutputFormat, PredictRequest, SplitParameters
+from src.schemas.jobs import Job
+from src.schemas.parameters import SweepRequest
 
 router = APIRouter()
 
 
+def split_parameters(
+    test_size: float = Query(0.2, gt=0, lt=1),
+    random_state: int = 42,
+    stratify: bool = False,
+) -> SplitParameters:
+    """ Read the train/test split parameters from the query string """
+    return SplitParameters(test_size=test_size, random_state=random_state,
+                           stratify=stratify)
+
+
 @router.get("/iris/load")
-async def fetch_iris():
+async def fetch_iris(
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    columns: Optional[str] = None,
+    output_format: OutputFormat = Query(OutputFormat.json, alias="format"),
+):
     """ Fetch the iris dataset from the configuration file
 
+    Args:
+        limit (int, optional): Maximum number of rows to return
+        offset (int): Index of the first row to return
+        columns (str, optional): Comma-separated list of the columns to return
+        output_format (OutputFormat): json (default), or ndjson / csv to stream
+            the rows in chunks
+
     Returns:
         Dataset: Iris dataset
 
     Raises:
-        404: The dataset was not found
+        400: Unknown column requested
+        500: The dataset could not be read
     """
     try:
         df = get_iris_local()
-    except requests.exceptions.InvalidURL:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Invalid URL provided for the dataset")
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while fetching the dataset: {e}")
-    return df.to_dict(orient='records')
+    return dataframe_response(df, output_format, columns=columns,
+                              offset=offset, limit=limit)
 
 
 @router.get("/iris/process")
-async def process_iris():
+async def process_iris(
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    columns: Optional[str] = None,
+    output_format: OutputFormat = Query(OutputFormat.json, alias="format"),
+):
     """ Process the iris dataset
 
+    Args:
+        limit (int, optional): Maximum number of rows to return
+        offset (int): Index of the first row to return
+        columns (str, optional): Comma-separated list of the columns to return
+        output_format (OutputFormat): json (default), or ndjson / csv to stream
+            the rows in chunks
+
     Returns:
         dict: The processed iris dataset
 
     Raises:
+        400: Unknown column requested
         500: An error occurred while processing the dataset
     """
     try:
-        df = get_iris_local()
-        processed_df = process_iris_df(df)
+        processed_df = get_processed_iris()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while processing the dataset: {e}")
-    return processed_df.to_dict(orient='records')
+    return dataframe_response(processed_df, output_format, columns=columns,
+                              offset=offset, limit=limit)
 
 
 @router.get("/iris/split")
-async def split_iris():
+async def split_iris(split: SplitParameters = Depends(split_parameters)):
     """ Split the iris dataset into training and testing sets
 
+    Args:
+        split (SplitParameters): test_size, random_state and stratify
+
     Returns:
         dict: The training and testing sets
 
@@ -62,7 +107,7 @@ async def split_iris():
     """
     try:
         X_train, X_test, y_train, y_test = test_train_split_iris(
-            process_iris_df(get_iris_local()))
+            get_processed_iris(), **split.dict())
 
     except Exception as e:
         raise HTTPException(
@@ -79,24 +124,216 @@ async def split_iris():
     )
 
 
-@router.get('/iris/train')
-async def train_iris():
+@router.post('/iris/train', status_code=status.HTTP_202_ACCEPTED, operation_id="train_iris")
+async def train_iris(split: SplitParameters = Depends(split_parameters),
+                     incremental: bool = False):
+    """ Start training a model on the iris dataset in a background worker.
+        The model starts serving predictions as soon as the job succeeds.
+
+    Args:
+        split (SplitParameters): test_size, random_state and stratify
+        incremental (bool): Only add trees for the rows appended since the
+            last training, instead of retraining the whole forest
+
+    Returns:
+        dict: The id and state of the training job
 
-    model_path = train_and_save_iris()
+    Raises:
+        429: Too many training jobs are already running or queued
+    """
+    job = training_jobs.submit(
+        "training", train_incremental_iris if incremental else train_and_evaluate_iris,
+        params={**split.dict(), "reload_model": False},
+        on_success=lambda result: model_holder.reload())
     return JSONResponse(
-        status_code=status.HTTP_200_OK,
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "job_id": job["job_id"],
+            "state": job["state"],
+            "status_url": f"/iris/train/{job['job_id']}"
+        }
+    )
+
+
+@router.get('/iris/train', status_code=status.HTTP_202_ACCEPTED,
+            operation_id="train_iris_get", deprecated=True)
+async def train_iris_get(split: SplitParameters = Depends(split_parameters),
+                         incremental: bool = False):
+    """ Deprecated alias of POST /iris/train, kept for the existing clients """
+    return await train_iris(split, incremental)
+
+
+def _reload_if_promoted(result: dict) -> None:
+    if result["model_path"]:
+        model_holder.reload()
+
+
+@router.post('/iris/sweep', status_code=status.HTTP_202_ACCEPTED)
+async def sweep_iris(request: SweepRequest):
+    """ Start a hyperparameter sweep in a background worker.
+        The candidates are compared with successive halving, the leaderboard
+        is saved next to the model and the best candidate can replace the
+        serving model. The job is followed with GET /iris/train/{job_id}.
+
+    Args:
+        request (SweepRequest): The search space and the sweep settings
+
+    Returns:
+        dict: The id and state of the sweep job
+
+    Raises:
+        422: A candidate is not valid, or the space holds no candidate
+        429: Too many training jobs are already running or queued
+    """
+    try:
+        candidates = expand_space(request.space, request.max_candidates, request.random_state)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e))
+    if not candidates:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The search space holds no candidate")
+    job = training_jobs.submit(
+        "sweep", run_sweep, params=request.dict(),
+        on_success=_reload_if_promoted)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
         content={
-            "model_path": model_path
+            "job_id": job["job_id"],
+            "state": job["state"],
+            "candidates": len(candidates),
+            "status_url": f"/iris/train/{job['job_id']}"
         }
     )
 
 
+@router.get('/iris/train/{job_id}', response_model=Job)
+async def get_training_job(job_id: str):
+    """ Get the state of a training job
+
+    Args:
+        job_id (str): The id of the training job
+
+    Returns:
+        Job: The state, timings, metrics and model path of the job
+
+    Raises:
+        404: The job was not found
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=training_jobs.get(job_id)
+    )
+
+
 @router.get('/iris/predict')
-async def predict():
-    predicted_labels = predict_iris()
+async def predict(split: SplitParameters = Depends(split_parameters)):
+    predicted_labels = predict_iris(**split.dict())
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={
             "predicted_labels": predicted_labels.tolist()
         }
     )
+
+
+@router.post('/iris/predict')
+async def predict_batch(request: PredictRequest,
+                        batcher: MicroBatcher = Depends(get_batcher)):
+    """ Predict the species of one or many iris flowers.
+        Concurrent requests are scored together in a single model call.
+
+    Args:
+        request (PredictRequest): The feature rows to score
+        batcher (MicroBatcher): The micro-batcher of the application
+
+    Returns:
+        dict: The predicted species and class probabilities of each row, the
+            size of the batch they were scored in and the request latency
+
+    Raises:
+        404: No model artifact was found
+        422: The rows do not have the expected number of features
+    """
+    try:
+        content = await predict_rows(request.rows, batcher)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No model artifact found. Train a model first.")
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=content
+    )
+
+
+@router.get('/iris/predict/stats')
+async def get_batching_stats(batcher: MicroBatcher = Depends(get_batcher)):
+    """ Get the micro-batching counters of the prediction route
+
+    Returns:
+        dict: The batching window, number of batches and mean batch size
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=batcher.stats()
+    )
+
+
+@router.get('/iris/model')
+async def get_model_info():
+    """ Get the version and load time of the model used for predictions
+
+    Returns:
+        dict: The artifact path, version, load time and loading date
+
+    Raises:
+        404: No model artifact was found
+    """
+    try:
+        info = model_holder.info()
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No model artifact found. Train a model first.")
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=info
+    )
+
+
+@router.get('/iris/model/artifacts')
+async def get_model_artifacts():
+    """ Get the manifest of the variants of the model artifact
+
+    Returns:
+        dict: The size, load time and accuracy delta of each variant
+
+    Raises:
+        404: No manifest was found
+    """
+    manifest = read_manifest(model_holder.path)
+    if manifest is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No artifact manifest found. Train a model first.")
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={**manifest, "served_mode": model_holder.mode}
+    )
+
+
+@router.get('/iris/cache')
+async def get_cache_stats():
+    """ Get the hit/miss counters of the dataset and split caches
+
+    Returns:
+        dict: The number of hits, misses and cached datasets, with the same
+            counters for the train/test splits under "splits"
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={**dataset_cache.stats(), "splits": split_cache.stats()}
+    )
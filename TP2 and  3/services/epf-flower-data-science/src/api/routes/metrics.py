@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from src.services.metrics import render
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    """ Metrics of the service in the Prometheus text format, summed over the
+        gunicorn workers
+    """
+    content, media_type = render()
+    return Response(content=content, media_type=media_type)
@@ -1,34 +1,57 @@
+import asyncio
 from fastapi.responses import JSONResponse
-from fastapi import APIRouter, HTTPException, status
-from src.services.firestore import FirestoreClient
-from src.schemas.parameters import Parameters
+from fastapi import APIRouter, HTTPException, Request, status
+from src.services.firestore import ParametersCache
+from src.schemas.parameters import Parameters, ParametersBatch
 
 router = APIRouter()
 
 
+def get_parameters_cache(request: Request) -> ParametersCache:
+    """ Return the parameters cache of the application """
+    return request.app.state.parameters_cache
+
+
 @router.get("/parameters", response_model=Parameters)
-async def get_firestore_parameters():
-    try:
-        firestore_client = FirestoreClient()
-        params: Parameters = firestore_client.get(
-            collection_name='parameters', document_id='parameters')
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error while fetching parameters from Firestore: {e}"
-        )
+async def get_firestore_parameters(request: Request):
+    cache = get_parameters_cache(request)
+    params = cache.peek('parameters', 'parameters')
+    if params is None:
+        try:
+            params: Parameters = await asyncio.to_thread(
+                cache.get, collection_name='parameters', document_id='parameters')
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error while fetching parameters from Firestore: {e}"
+            )
     return JSONResponse(
         content=params.to_dict(),
         status_code=status.HTTP_200_OK
     )
 
 
+@router.get("/parameters/cache")
+async def get_parameters_cache_stats(request: Request):
+    """ Get the hit/miss counters of the parameters cache
+
+    Returns:
+        dict: The cache mode, TTL, hits, misses and cached documents
+    """
+    return JSONResponse(
+        content=get_parameters_cache(request).stats(),
+        status_code=status.HTTP_200_OK
+    )
+
+
 @router.put("/parameters", response_model=Parameters)
-async def put_firestore_parameters(model_params: Parameters):
+async def put_firestore_parameters(request: Request, model_params: Parameters):
     try:
-        firestore_client = FirestoreClient()
-        updated_params, status_code = firestore_client.put(
+        updated_params, status_code = await asyncio.to_thread(
+            get_parameters_cache(request).put,
             collection_name='parameters', document_id='parameters', data=model_params)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -42,3 +65,31 @@ async def put_firestore_parameters(model_params: Parameters):
     return JSONResponse(
         content=updated_params,
         status_code=status_code)
+
+
+@router.put("/parameters/batch")
+async def put_firestore_parameters_batch(request: Request, batch: ParametersBatch):
+    """ Merge many parameter documents of the parameters collection in
+        batched writes, creating the missing ones
+
+    Args:
+        batch (ParametersBatch): The fields to write, by document id
+
+    Returns:
+        dict: The ids of the written documents
+
+    Raises:
+        500: An error occurred while writing the documents
+    """
+    try:
+        document_ids = await asyncio.to_thread(
+            get_parameters_cache(request).put_many,
+            collection_name='parameters', documents=batch.documents)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error while updating parameters: {e}"
+        )
+    return JSONResponse(
+        content={"documents": document_ids},
+        status_code=status.HTTP_200_OK)
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, Query, status
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+
+from src.api.routes.authentication import verify_admin
+from src.services.profiling import ProfileStore, get_profile_store
+
+router = APIRouter()
+
+
+@router.get("/profiles", dependencies=[Depends(verify_admin)])
+def list_profiles(store: ProfileStore = Depends(get_profile_store)):
+    """ List the profiles recorded for the requests sent with `X-Profile: 1`
+        or `?profile=1`, the latest first
+
+    Returns:
+        list[dict]: The id, method, path, status, duration and size of each
+            profile kept
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=store.list()
+    )
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(verify_admin)])
+def download_profile(profile_id: str,
+                     output_format: str = Query("pstats", alias="format", regex="^(pstats|text)$"),
+                     sort: str = Query("cumulative", regex="^(cumulative|tottime|calls)$"),
+                     store: ProfileStore = Depends(get_profile_store)):
+    """ Download a profile
+
+    Args:
+        profile_id (str): Id of the profile, given by the X-Profile-Id header
+        output_format (str): pstats (default), the file to open with
+            `python -m pstats` or snakeviz, or text for the slowest functions
+        sort (str): Order of the functions of the text report
+
+    Raises:
+        404: The profile was not found
+    """
+    if output_format == "text":
+        return PlainTextResponse(store.report(profile_id, sort=sort))
+    return FileResponse(store.path(profile_id), media_type="application/octet-stream",
+                        filename=f"{profile_id}.prof")
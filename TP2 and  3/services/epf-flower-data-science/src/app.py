@@ -2,11 +2,16 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from src.api.router import router
-
-from slowapi.middleware import SlowAPIMiddleware
-
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from src.api.routes.authentication import verify_admin
+from src.services.model_store import warm_up_model
+from src.services.predict import MicroBatcher
+from src.services.jobs import training_jobs
+from src.services.firestore import ParametersCache
+from src.services.firebase import cert_refresher, initialize_firebase
+from src.services.identity_toolkit import IdentityToolkitClient
+from src.services.rate_limit import RateLimiter, RateLimitMiddleware
+from src.services.metrics import MetricsMiddleware
+from src.services.profiling import PROFILING_ENABLED, ProfileStore, ProfilingMiddleware
 
 
 def get_application() -> FastAPI:
@@ -25,10 +30,37 @@ def get_application() -> FastAPI:
         allow_headers=["*"],
     )
 
-    application.add_middleware(SlowAPIMiddleware)
-    limiter = Limiter(key_func=get_remote_address,
-                      default_limits=["5 per minute"])
-    application.state.limiter = limiter
+    # Admins profile a request with `X-Profile: 1`, inside the rate limiter
+    # and the metrics so that they stay out of the profile
+    application.state.profile_store = ProfileStore()
+    if PROFILING_ENABLED:
+        application.add_middleware(ProfilingMiddleware, store=application.state.profile_store,
+                                   authorize=verify_admin)
+
+    # Limits per route and client, counted in a storage shared by the workers
+    application.state.rate_limiter = RateLimiter()
+    application.add_middleware(RateLimitMiddleware, limiter=application.state.rate_limiter)
+    # Added last so that it also counts and times the rejected requests
+    application.add_middleware(MetricsMiddleware)
 
     application.include_router(router)
+
+    # One Firestore client and parameters cache per application
+    application.state.parameters_cache = ParametersCache()
+    application.add_event_handler("shutdown", application.state.parameters_cache.close)
+
+    # Connections to the identity-toolkit API are kept alive between requests
+    application.state.identity_toolkit = IdentityToolkitClient()
+    application.add_event_handler("shutdown", application.state.identity_toolkit.aclose)
+
+    # Concurrent predictions of the application are scored together
+    application.state.batcher = MicroBatcher()
+
+    # Unpickle the model once at startup instead of on the first prediction
+    application.add_event_handler("startup", warm_up_model)
+    application.add_event_handler("shutdown", training_jobs.shutdown)
+    # Firebase reads its credentials at startup rather than at import, then
+    # keeps the token signing certificates fresh so that no request downloads them
+    application.add_event_handler("startup", initialize_firebase)
+    application.add_event_handler("shutdown", cert_refresher.stop)
     return application
@@ -8,6 +8,12 @@ class RoleEnum(str, Enum):
     default = "default"
 
 
+class UsersFormat(str, Enum):
+    """Enum for the user listing formats."""
+    json = "json"
+    ndjson = "ndjson"
+
+
 class RegisterRequest(BaseModel):
     """ Firebase user credentials schema used for registration."""
     email: str
@@ -0,0 +1,45 @@
+from enum import Enum
+from pydantic import BaseModel, Field
+
+
+class OutputFormat(str, Enum):
+    """Enum for the dataset output formats."""
+    json = "json"
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class SplitParameters(BaseModel):
+    """Parameters of the train/test split."""
+    test_size: float = Field(
+        0.2,
+        description="Proportion of the dataset in the test set.",
+        gt=0,
+        lt=1
+    )
+    random_state: int = Field(
+        42,
+        description="Seed used to shuffle the dataset before splitting."
+    )
+    stratify: bool = Field(
+        False,
+        description="Keep the species proportions in both sets."
+    )
+
+
+class PredictRequest(BaseModel):
+    """Feature rows to score, in the order of the model features."""
+    rows: list[list[float]] = Field(
+        ...,
+        description="One row per flower: sepal length, sepal width, petal length "
+                    "and petal width, e.g. [[5.1, 3.5, 1.4, 0.2]].",
+        min_items=1,
+        max_items=10000
+    )
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "rows": [[5.1, 3.5, 1.4, 0.2], [5.9, 3.0, 5.1, 1.8]]
+            }
+        }
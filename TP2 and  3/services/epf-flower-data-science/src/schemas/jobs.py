@@ -0,0 +1,26 @@
+from enum import Enum
+from typing import Optional
+from pydantic import BaseModel
+
+
+class JobState(str, Enum):
+    """Enum for the states of a background job."""
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class Job(BaseModel):
+    """Background job schema."""
+    job_id: str
+    kind: str
+    state: JobState
+    params: dict
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    queue_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
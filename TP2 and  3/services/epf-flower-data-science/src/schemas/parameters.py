@@ -1,6 +1,6 @@
 from enum import Enum
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import Optional, Union
+from pydantic import BaseModel, Field, root_validator, validator
 
 
 class MaxFeaturesEnum(str, Enum):
@@ -62,3 +62,124 @@ class Parameters(BaseModel):
                 "criterion": "gini"
             }
         }
+
+
+class ParametersBatch(BaseModel):
+    """Parameter documents to write in a single batch, by document id."""
+    documents: dict[str, Parameters] = Field(
+        description="Fields to merge into each document, by document id."
+    )
+
+    @validator("documents")
+    def documents_must_not_be_empty(cls, documents: dict) -> dict:
+        if not documents:
+            raise ValueError("No documents to write")
+        return documents
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "documents": {
+                    "iris": {"n_estimators": 100, "max_depth": 10},
+                    "penguins": {"n_estimators": 200, "criterion": "entropy"}
+                }
+            }
+        }
+
+
+# Bounds of a sweep: values of a single parameter, and candidates of the full
+# grid before `max_candidates` are sampled from it
+SWEEP_MAX_VALUES = 1000
+SWEEP_MAX_GRID_SIZE = 1_000_000
+
+
+class SweepRange(BaseModel):
+    """Range of integer values, bounds included."""
+    min: int
+    max: int
+    step: int = Field(1, ge=1)
+
+    @root_validator(skip_on_failure=True)
+    def range_must_be_bounded(cls, values: dict) -> dict:
+        if values["max"] < values["min"]:
+            raise ValueError("max must be greater than or equal to min")
+        if (values["max"] - values["min"]) // values["step"] >= SWEEP_MAX_VALUES:
+            raise ValueError(f"A range may hold at most {SWEEP_MAX_VALUES} values")
+        return values
+
+    def __len__(self) -> int:
+        return (self.max - self.min) // self.step + 1
+
+    def __getitem__(self, index: int) -> int:
+        return self.min + int(index) * self.step
+
+    def values(self) -> list[int]:
+        return list(range(self.min, self.max + 1, self.step))
+
+
+class SweepRequest(BaseModel):
+    """Hyperparameter sweep over the fields of `Parameters`."""
+    space: dict[str, Union[SweepRange, list]] = Field(
+        description="Candidate values of each parameter, as a list or an integer range."
+    )
+    max_candidates: int = Field(
+        81,
+        description="Maximum number of candidates, sampled from the grid if it is larger.",
+        ge=1,
+        le=1000
+    )
+    eta: int = Field(
+        3,
+        description="Only the best 1/eta candidates are kept at each successive halving round.",
+        ge=2
+    )
+    min_rows: int = Field(
+        20,
+        description="Number of training rows used in the first round.",
+        ge=2
+    )
+    test_size: float = Field(0.2, gt=0, lt=1)
+    random_state: int = 42
+    promote: bool = Field(
+        True,
+        description="Replace the serving model with the best candidate."
+    )
+
+    @validator("space")
+    def grid_must_be_bounded(cls, space: dict) -> dict:
+        grid_size = 1
+        for name, spec in space.items():
+            if isinstance(spec, SweepRange) and spec.max < spec.min:
+                raise ValueError(f"The range of {name} is empty: max is below min")
+            if len(spec) == 0:
+                raise ValueError(f"{name} must take at least one value")
+            if len(spec) > SWEEP_MAX_VALUES:
+                raise ValueError(f"{name} may take at most {SWEEP_MAX_VALUES} values")
+            grid_size *= len(spec)
+        if grid_size > SWEEP_MAX_GRID_SIZE:
+            raise ValueError(
+                f"The search space holds {grid_size} candidates, at most "
+                f"{SWEEP_MAX_GRID_SIZE} are allowed: narrow it down")
+        return space
+
+    @validator("space")
+    def space_must_use_parameters(cls, space: dict) -> dict:
+        unknown = set(space) - set(Parameters.__fields__)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        if not space:
+            raise ValueError("The search space is empty")
+        return space
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "space": {
+                    "n_estimators": {"min": 50, "max": 200, "step": 50},
+                    "max_depth": [3, 5, 10],
+                    "criterion": ["gini", "entropy"]
+                },
+                "eta": 3,
+                "promote": True
+            }
+        }
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import weakref
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from src.services.lazy import LazyModule
+from src.services.metrics import CACHE_REQUESTS
+
+pd = LazyModule("pandas")
+
+
+class DatasetCache:
+    """ Process-wide cache of parsed datasets.
+
+        Each file is parsed once and the resulting DataFrame is kept in memory,
+        keyed by its path. The entry is invalidated as soon as the file's
+        modification time or size changes on disk.
+
+        The cached frames are shared between requests: callers must not modify
+        them in place.
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[Path, str], tuple[tuple[int, int], pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read_csv(self, path: Path) -> pd.DataFrame:
+        """ Return the parsed content of a CSV file, parsing it only if needed.
+
+        Args:
+            path (Path): Path of the CSV file
+
+        Raises:
+            FileNotFoundError: The file does not exist
+
+        Returns:
+            pd.DataFrame: The parsed dataset
+        """
+        return self.load(path, pd.read_csv, kind="csv")
+
+    def load(self, path: Path, loader: Callable[[Path], pd.DataFrame],
+             kind: str) -> pd.DataFrame:
+        """ Return the frame built by `loader` from a file, building it only if
+            the file changed since the last call.
+
+        Args:
+            path (Path): Path of the source file
+            loader (Callable): Function building the frame from the path
+            kind (str): Name of the representation, so that several frames
+                derived from the same file can be cached side by side
+
+        Raises:
+            FileNotFoundError: The file does not exist
+
+        Returns:
+            pd.DataFrame: The cached or freshly built frame
+        """
+        path = Path(path)
+        stat = path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (path, kind)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                CACHE_REQUESTS.labels(cache="dataset", result="hit").inc()
+                return entry[1]
+            self.misses += 1
+            CACHE_REQUESTS.labels(cache="dataset", result="miss").inc()
+
+        # Build outside of the lock so that other datasets stay available
+        df = loader(path)
+        with self._lock:
+            self._entries[key] = (stamp, df)
+        return df
+
+    def invalidate(self, path: Path = None) -> None:
+        """ Drop one entry from the cache, or all of them if no path is given """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == Path(path)]:
+                    del self._entries[key]
+
+    def stats(self) -> dict:
+        """ Return the hit/miss counters and the number of cached datasets """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+class SplitCache:
+    """ Cache of train/test splits.
+
+        Only the positional indices of the train and test rows are stored,
+        keyed by the content hash of the dataset and the split parameters. The
+        hash of a frame is computed once per frame object, so repeated splits
+        of a cached dataset are dictionary lookups.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._splits: dict[tuple, tuple[np.ndarray, np.ndarray]] = {}
+        self._fingerprints: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, df: pd.DataFrame) -> str:
+        """ Return the content hash of a frame, computed once per frame object """
+        with self._lock:
+            fingerprint = self._fingerprints.get(id(df))
+        if fingerprint is None:
+            hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+            fingerprint = hashlib.sha1(hashes.tobytes()).hexdigest()
+            with self._lock:
+                self._fingerprints[id(df)] = fingerprint
+            # Forget the hash when the frame is garbage collected, its id
+            # could be reused by another object
+            weakref.finalize(df, self._fingerprints.pop, id(df), None)
+        return fingerprint
+
+    def get_indices(self, df: pd.DataFrame, target: str, test_size: float,
+                    random_state: int, stratify: bool) -> tuple[np.ndarray, np.ndarray]:
+        """ Return the positional indices of the train and test rows.
+
+        Args:
+            df (pd.DataFrame): The dataset
+            target (str): Name of the target column, used to stratify
+            test_size (float): Proportion of the dataset in the test set
+            random_state (int): Seed of the shuffle
+            stratify (bool): Keep the class proportions in both sets
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The train and test row indices
+        """
+        key = (self.fingerprint(df), target, test_size, random_state, stratify)
+        with self._lock:
+            indices = self._splits.get(key)
+            if indices is not None:
+                self.hits += 1
+                CACHE_REQUESTS.labels(cache="split", result="hit").inc()
+                return indices
+            self.misses += 1
+            CACHE_REQUESTS.labels(cache="split", result="miss").inc()
+
+        from sklearn.model_selection import train_test_split
+
+        # Splitting the row numbers gives the same rows as splitting X and y
+        train_idx, test_idx = train_test_split(
+            np.arange(len(df)), test_size=test_size, random_state=random_state,
+            stratify=df[target] if stratify else None)
+        train_idx.setflags(write=False)
+        test_idx.setflags(write=False)
+        with self._lock:
+            if len(self._splits) >= self.max_entries:
+                self._splits.pop(next(iter(self._splits)))
+            self._splits[key] = (train_idx, test_idx)
+        return train_idx, test_idx
+
+    def stats(self) -> dict:
+        """ Return the hit/miss counters and the number of cached splits """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._splits),
+            }
+
+
+dataset_cache = DatasetCache()
+split_cache = SplitCache()
@@ -1,15 +1,131 @@
-import pandas as pd
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.services.lazy import LazyModule
+
+pd = LazyModule("pandas")
+
+# Bump this version whenever process_iris_df changes, so that the processed
+# datasets stored on disk are rebuilt
+CLEANING_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+
+# Columns of the raw dataset, and their names in the processed dataset
+IRIS_COLUMNS = {
+    "Id": "id",
+    "SepalLengthCm": "sepal_length",
+    "SepalWidthCm": "sepal_width",
+    "PetalLengthCm": "petal_length",
+    "PetalWidthCm": "petal_width",
+    "Species": "species"
+}
 
 
 def process_iris_df(iris: pd.DataFrame) -> pd.DataFrame:
-    COLUMNS = {
-        "Id": "id",
-        "SepalLengthCm": "sepal_length",
-        "SepalWidthCm": "sepal_width",
-        "PetalLengthCm": "petal_length",
-        "PetalWidthCm": "petal_width",
-        "Species": "species"
-    }
-    iris.rename(columns=COLUMNS, inplace=True)
-    iris.species = iris.species.str.replace("Iris-", "")
+    # The input frame may come from the dataset cache: work on a new frame
+    # instead of renaming it in place
+    iris = iris.rename(columns=IRIS_COLUMNS)
+    iris["species"] = iris["species"].str.replace("Iris-", "")
     return iris
+
+
+def _source_stamp(source: Path) -> dict:
+    stat = Path(source).stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+            "cleaning_version": CLEANING_VERSION}
+
+
+def save_columnar(df: pd.DataFrame, directory: Path, source: Path) -> None:
+    """ Save a processed dataset in a columnar binary format.
+        Numeric columns are stored as `.npy` arrays, other columns as
+        categorical codes plus the list of their categories. The manifest
+        records the raw file and the cleaning version the data comes from.
+
+    Args:
+        df (pd.DataFrame): The processed dataset
+        directory (Path): Directory of the columnar dataset
+        source (Path): Raw file the dataset was built from
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix=directory.name + "."))
+
+    columns = []
+    for i, (name, column) in enumerate(df.items()):
+        if pd.api.types.is_numeric_dtype(column) and not isinstance(column.dtype, pd.CategoricalDtype):
+            np.save(tmp_dir / f"{i}.npy", column.to_numpy())
+            columns.append({"name": name, "kind": "numeric"})
+        else:
+            categorical = column.astype("category")
+            np.save(tmp_dir / f"{i}.npy", categorical.cat.codes.to_numpy())
+            columns.append({"name": name, "kind": "categorical",
+                            "categories": categorical.cat.categories.tolist()})
+
+    manifest = {"source": _source_stamp(source), "columns": columns}
+    with open(tmp_dir / MANIFEST_FILE, "w") as file:
+        json.dump(manifest, file, indent=4)
+
+    # Swap the whole directory so that readers never see a half-written dataset
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, directory)
+    except OSError:
+        # Another process rebuilt the dataset in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_columnar(directory: Path, source: Path) -> pd.DataFrame:
+    """ Load a dataset saved by `save_columnar` by memory-mapping its arrays.
+
+    Args:
+        directory (Path): Directory of the columnar dataset
+        source (Path): Raw file the dataset must have been built from
+
+    Raises:
+        FileNotFoundError: No columnar dataset, or it is outdated
+
+    Returns:
+        pd.DataFrame: The dataset, backed by read-only memory maps
+    """
+    directory = Path(directory)
+    try:
+        with open(directory / MANIFEST_FILE) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        raise FileNotFoundError(f"No columnar dataset in {directory}")
+    if manifest["source"] != _source_stamp(source):
+        raise FileNotFoundError(f"Outdated columnar dataset in {directory}")
+
+    data = {}
+    for i, column in enumerate(manifest["columns"]):
+        values = np.load(directory / f"{i}.npy", mmap_mode="r")
+        if column["kind"] == "categorical":
+            values = pd.Categorical.from_codes(values, column["categories"])
+        data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def load_or_build_columnar(source: Path, directory: Path) -> pd.DataFrame:
+    """ Load the processed iris dataset from its columnar cache, rebuilding the
+        cache from the raw CSV file when it is missing or outdated.
+
+    Args:
+        source (Path): Raw CSV file
+        directory (Path): Directory of the columnar dataset
+
+    Returns:
+        pd.DataFrame: The processed dataset
+    """
+    try:
+        return load_columnar(directory, source)
+    except FileNotFoundError:
+        save_columnar(process_iris_df(pd.read_csv(source)), directory, source)
+        return load_columnar(directory, source)
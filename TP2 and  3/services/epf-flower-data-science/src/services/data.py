@@ -1,18 +1,36 @@
-from http.client import InvalidURL
-import io
+from __future__ import annotations
+
+import asyncio
+import tempfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException, status
 from pydantic import BaseModel, validator
-import requests
 from pathlib import Path
-import json
+from typing import Callable, Iterator, Optional, TypeVar
 import validators
-import pandas as pd
-from requests.exceptions import HTTPError
-from sklearn.model_selection import train_test_split
+
+from src.services.cache import dataset_cache, split_cache
+from src.services.cleaning import IRIS_COLUMNS, load_or_build_columnar
+from src.services.download import download_file
+from src.services.lazy import LazyModule
+from src.services.registry import DatasetRegistry, get_registry
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
 
 JSON_CONFIG_PATH = Path(__file__).parent.parent / "config/urls_config.json"
 DATA_FILE_PATH = Path(__file__).parent.parent / "data"
+CSV_CHUNK_SIZE = 10_000
+
+# Columns of the processed dataset the models are not trained on: the row
+# number of the source file, which follows the species, and the label
+NON_FEATURE_COLUMNS = ("id", "species")
+# Features of the processed iris dataset, in order
+IRIS_FEATURES = tuple(
+    column for column in IRIS_COLUMNS.values() if column not in NON_FEATURE_COLUMNS)
+
+T = TypeVar("T")
 
 
 class Dataset(BaseModel):
@@ -43,11 +61,17 @@ class Dataset(BaseModel):
         return name
 
 
+def _get_configs_registry() -> DatasetRegistry:
+    return get_registry(JSON_CONFIG_PATH)
+
+
 def open_configs_file() -> dict:
-    """ Open the configuration file and return its content as a dictionary """
+    """ Return the content of the configuration file as a dictionary.
+        The catalogue is kept in memory by the dataset registry, the file is
+        only read again when another worker changed it.
+    """
     try:
-        with open(JSON_CONFIG_PATH) as file:
-            datasets = json.load(file)
+        datasets = _get_configs_registry().get_all()
     except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -60,87 +84,263 @@ def open_configs_file() -> dict:
         return datasets
 
 
-def dump_configs_file(datasets: dict) -> None:
-    """ Dump the datasets dictionary to the configuration file """
+def update_configs_file(mutate: Callable[[dict], T]) -> T:
+    """ Apply a change to the datasets dictionary and save it to the
+        configuration file. The change is applied to the latest content of the
+        file under an inter-process lock, and the file is replaced atomically.
+
+    Args:
+        mutate (Callable): Function changing the datasets dictionary in place
+
+    Returns:
+        The value returned by `mutate`
+    """
     try:
-        with open(JSON_CONFIG_PATH, "w") as file:
-            json.dump(datasets, file, indent=4)
+        return _get_configs_registry().update(mutate)
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Configuration file not found: {JSON_CONFIG_PATH}")
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while writing the configuration file {e}")
 
 
+def dump_configs_file(datasets: dict) -> None:
+    """ Dump the datasets dictionary to the configuration file """
+    def replace(current: dict) -> None:
+        current.clear()
+        current.update(datasets)
+    update_configs_file(replace)
+
+
 def write_configs_file(dataset: Dataset) -> None:
     """ Take a dataset and write it to the configuration file """
+    def write(datasets: dict) -> None:
+        datasets[dataset.name] = dataset.dict()
+    update_configs_file(write)
 
-    # We put this line out of the try block since the exceptions are already
-    # handled in the open_configs_file function
-    datasets = open_configs_file()
-    try:
+
+def add_dataset(dataset: Dataset) -> None:
+    """ Add a new dataset to the configuration file
+
+    Raises:
+        HTTPException: The dataset already exists
+    """
+    def add(datasets: dict) -> None:
+        if dataset.name in datasets:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Dataset already exists: {dataset.name}. Use PUT if you wish to update it.")
         datasets[dataset.name] = dataset.dict()
-        with open(JSON_CONFIG_PATH, "w") as file:
-            json.dump(datasets, file, indent=4)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"An error occurred while writing the configuration file {e}")
+    update_configs_file(add)
+
+
+def save_dataset(dataset: Dataset) -> bool:
+    """ Create or update a dataset in the configuration file
+
+    Returns:
+        bool: True if the dataset was created, False if it was updated
+    """
+    def save(datasets: dict) -> bool:
+        created = dataset.name not in datasets
+        datasets[dataset.name] = dataset.dict()
+        return created
+    return update_configs_file(save)
+
+
+def remove_dataset(dataset_id: str) -> None:
+    """ Delete a dataset from the configuration file
+
+    Raises:
+        HTTPException: The dataset was not found
+    """
+    def remove(datasets: dict) -> None:
+        if dataset_id not in datasets:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Dataset not found: {dataset_id}")
+        del datasets[dataset_id]
+    update_configs_file(remove)
 
 
 def get_dataset_infos(dataset_id: str) -> Dataset:
     """ Get the information of a dataset from the configuration file """
     try:
-        datasets = open_configs_file()
-        return Dataset(**datasets[dataset_id])
+        return Dataset(**_get_configs_registry().get(dataset_id))
     except KeyError:
         raise HTTPException(
             status_code=404, detail=f"Dataset not found in configuration file: {dataset_id}")
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Configuration file not found: {JSON_CONFIG_PATH}")
 
 
-def download_dataset(dataset_url: str, dataset_name: str) -> None:
-    """ Download a dataset from a URL and save it to the data folder """
-    try:
-        response = requests.get(dataset_url)
-        output_file = DATA_FILE_PATH / f'{dataset_name}.zip'
-        with open(output_file, "wb") as file:
-            file.write(response.content)
-    except InvalidURL:
-        raise HTTPException(
-            status_code=400, detail=f"Invalid URL: {dataset_url}")
+async def download_dataset(dataset_url: str, dataset_name: str,
+                           sha256: Optional[str] = None) -> Path:
+    """ Download a dataset from a URL and save it to the data folder.
+        The body is streamed to disk in chunks and the download resumes after
+        a dropped connection, see `download_file`.
 
+    Args:
+        dataset_url (str): URL of the dataset archive
+        dataset_name (str): Name of the dataset, used as the file name
+        sha256 (str, optional): Expected SHA-256 digest of the archive
 
-def get_iris_web() -> pd.DataFrame:
-    """ Download the iris dataset from the URL and return it as a Pandas DataFrame """
-    iris_dataset = get_dataset_infos("iris")
-    response = requests.get(iris_dataset.url)
-    response.raise_for_status()
+    Returns:
+        Path: The path of the downloaded archive
+    """
+    return await download_file(
+        dataset_url, DATA_FILE_PATH / f'{dataset_name}.zip', sha256=sha256)
+
+
+def iter_zip_csv(archive_path: Path, member: Optional[str] = None,
+                 chunksize: int = CSV_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """ Read a CSV file stored in a zip archive chunk by chunk.
+        Only the central directory of the archive is read to find the member,
+        which is then decompressed on the fly while pandas parses it. Other
+        members are never read, and only one chunk is in memory at a time.
+
+    Args:
+        archive_path (Path): Path of the zip archive on disk
+        member (str, optional): Name of the CSV member. Defaults to the first
+            CSV file of the archive.
+        chunksize (int): Number of rows per chunk
+
+    Raises:
+        HTTPException: No CSV file found in the archive
 
-    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-        file_names = z.namelist()
-        csv_file_name = next(
-            (name for name in file_names if name.endswith('.csv')), None)
+    Yields:
+        pd.DataFrame: The successive chunks of the CSV file, or its header
+            alone if it has no row
+    """
+    with zipfile.ZipFile(archive_path) as z:
+        if member is None:
+            member = next(
+                (info.filename for info in z.infolist() if info.filename.endswith('.csv')), None)
 
-        if csv_file_name is None:
+        if member is None or member not in z.namelist():
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No CSV file found in the archive.")
 
-        with z.open(csv_file_name) as csv_file:
-            df = pd.read_csv(csv_file)
+        empty = True
+        with z.open(member) as csv_file:
+            with pd.read_csv(csv_file, chunksize=chunksize) as reader:
+                for chunk in reader:
+                    empty = False
+                    yield chunk
+        if empty:
+            with z.open(member) as csv_file:
+                yield pd.read_csv(csv_file, nrows=0)
 
-    return df
+
+def read_zip_csv(archive_path: Path, member: Optional[str] = None,
+                 chunksize: int = CSV_CHUNK_SIZE) -> pd.DataFrame:
+    """ Read a CSV file stored in a zip archive, see `iter_zip_csv`.
+        The values of each chunk are appended to one list per column and the
+        chunk is dropped; each column is then joined in turn, so that the
+        memory holds the rows once plus a single column being joined.
+
+    Raises:
+        HTTPException: No CSV file found in the archive
+
+    Returns:
+        pd.DataFrame: The content of the CSV file
+    """
+    columns: dict[str, list] = {}
+    for chunk in iter_zip_csv(archive_path, member, chunksize):
+        for name in chunk.columns:
+            columns.setdefault(name, []).append(chunk[name].to_numpy())
+        del chunk
+    rows = sum(len(part) for part in next(iter(columns.values()), []))
+    if not rows:
+        # A file without rows still has its header
+        return pd.DataFrame(columns=list(columns))
+    frame = pd.DataFrame(index=pd.RangeIndex(rows))
+    for name in list(columns):
+        frame[name] = np.concatenate(columns.pop(name))
+    return frame
+
+
+async def get_iris_web_async() -> pd.DataFrame:
+    """ Download the iris dataset from the URL and return it as a Pandas DataFrame.
+        The archive is spooled to a temporary file instead of being held in
+        memory, then the CSV member is parsed in chunks in a worker thread.
+    """
+    iris_dataset = get_dataset_infos("iris")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = await download_file(iris_dataset.url, Path(tmp_dir) / "iris.zip")
+        return await asyncio.to_thread(read_zip_csv, archive_path)
+
+
+def get_iris_web() -> pd.DataFrame:
+    """ Download the iris dataset, see `get_iris_web_async`.
+        Called from a running event loop, the download runs in its own loop
+        in a worker thread, and the caller is blocked until it is done:
+        coroutines should await `get_iris_web_async` instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(get_iris_web_async())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, get_iris_web_async()).result()
 
 
 def get_iris_local() -> pd.DataFrame:
-    """ Get the iris dataset from the data file """
-    return pd.read_csv(DATA_FILE_PATH / "iris.csv")
+    """ Get the iris dataset from the data file.
+        The file is parsed once and then served from the dataset cache until it
+        changes on disk. The returned frame is shared and must not be modified.
+    """
+    return dataset_cache.read_csv(DATA_FILE_PATH / "iris.csv")
+
+
+def get_processed_iris() -> pd.DataFrame:
+    """ Get the processed iris dataset.
+        The cleaned dataset is stored once in a columnar format next to the raw
+        CSV file and memory-mapped from there. It is rebuilt when the raw file
+        or the cleaning code version changes. The returned frame is shared and
+        must not be modified.
+    """
+    return dataset_cache.load(
+        DATA_FILE_PATH / "iris.csv",
+        lambda source: load_or_build_columnar(source, DATA_FILE_PATH / "iris.processed"),
+        kind="processed")
+
+
+def feature_columns(iris: pd.DataFrame) -> list[str]:
+    """ Return the columns of the processed dataset the models are trained on """
+    return [column for column in iris.columns if column not in NON_FEATURE_COLUMNS]
+
+
+def test_train_split_iris(iris: pd.DataFrame, test_size: float = 0.2, random_state: int = 42,
+                          stratify: bool = False) -> tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
+    """ Split the iris dataset into training and testing sets.
+        The row indices of each split are cached by dataset content and split
+        parameters, so only the selected rows are gathered on each call.
 
+    Args:
+        iris (pd.DataFrame): The processed iris dataset
+        test_size (float): Proportion of the dataset in the test set
+        random_state (int): Seed of the shuffle
+        stratify (bool): Keep the species proportions in both sets
 
-def test_train_split_iris(iris: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
-    """ Test the train/test split on the iris dataset and return the split as a dictionary """
+    Returns:
+        tuple: X_train, X_test, y_train, y_test, the features being the
+            columns of `feature_columns`
+    """
+    train_idx, test_idx = split_cache.get_indices(
+        iris, "species", test_size, random_state, stratify)
+    features = [iris.columns.get_loc(column) for column in feature_columns(iris)]
+    target = iris.columns.get_loc("species")
 
-    X = iris.drop(columns="species")
-    y = iris["species"]
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42)
+    X_train = iris.iloc[train_idx, features]
+    X_test = iris.iloc[test_idx, features]
+    y_train = iris.iloc[train_idx, target]
+    y_test = iris.iloc[test_idx, target]
     return X_train, X_test, y_train, y_test
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, status
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 30.0
+DOWNLOAD_MAX_RETRIES = 3
+DOWNLOAD_RETRY_DELAY = 0.5
+
+
+def file_sha256(path: Path, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    """ Compute the SHA-256 digest of a file without loading it in memory """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def _append_response(response: httpx.Response, path: Path, mode: str,
+                           chunk_size: int) -> None:
+    """ Write the body of a streamed response to a file, chunk by chunk """
+    file = await asyncio.to_thread(open, path, mode)
+    try:
+        async for chunk in response.aiter_bytes(chunk_size):
+            await asyncio.to_thread(file.write, chunk)
+    finally:
+        await asyncio.to_thread(file.close)
+
+
+async def download_file(url: str, output_file: Path, sha256: Optional[str] = None,
+                        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                        timeout: float = DOWNLOAD_TIMEOUT,
+                        max_retries: int = DOWNLOAD_MAX_RETRIES) -> Path:
+    """ Download a file to disk without holding its body in memory.
+
+        The body is streamed in chunks to a `.part` file next to the output
+        file. If the connection drops, the download resumes from the bytes
+        already written with an HTTP Range request. The file is only moved to
+        its final path once complete and, if a digest is given, verified.
+
+    Args:
+        url (str): URL of the file
+        output_file (Path): Where to save the file
+        sha256 (str, optional): Expected SHA-256 digest of the file
+        chunk_size (int): Size of the chunks read from the network
+        timeout (float): Timeout in seconds of each network operation
+        max_retries (int): Number of resumes attempted after a network error
+
+    Raises:
+        HTTPException: Invalid URL
+        HTTPException: The server answered with an error
+        HTTPException: The download failed after all retries
+        HTTPException: Checksum mismatch
+
+    Returns:
+        Path: The path of the downloaded file
+    """
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    partial_file = output_file.with_name(output_file.name + ".part")
+    partial_file.unlink(missing_ok=True)
+
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        for attempt in range(max_retries + 1):
+            offset = partial_file.stat().st_size if partial_file.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                async with client.stream("GET", url, headers=headers) as response:
+                    if offset and response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE:
+                        # Everything was received before the connection dropped
+                        break
+                    response.raise_for_status()
+                    # A server ignoring the Range header sends the whole file again
+                    resumed = offset and response.status_code == status.HTTP_206_PARTIAL_CONTENT
+                    await _append_response(
+                        response, partial_file, "ab" if resumed else "wb", chunk_size)
+                break
+            except (httpx.InvalidURL, httpx.UnsupportedProtocol):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid URL: {url}")
+            except httpx.HTTPStatusError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY,
+                    detail=f"Download failed with status {e.response.status_code}: {url}")
+            except httpx.TransportError as e:
+                if attempt == max_retries:
+                    raise HTTPException(
+                        status_code=status.HTTP_502_BAD_GATEWAY,
+                        detail=f"Download failed after {max_retries} retries: {e}")
+                await asyncio.sleep(DOWNLOAD_RETRY_DELAY * 2 ** attempt)
+
+    if sha256 is not None:
+        digest = await asyncio.to_thread(file_sha256, partial_file, chunk_size)
+        if digest != sha256.lower():
+            partial_file.unlink(missing_ok=True)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Checksum mismatch for {url}: expected {sha256}, got {digest}")
+
+    os.replace(partial_file, output_file)
+    return output_file
@@ -1,10 +1,21 @@
 from src.schemas.firebase import FirebaseUser, RoleEnum
+import hashlib
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+import httpx
 from dotenv import load_dotenv
 from fastapi import status, HTTPException
-from firebase_admin import credentials, initialize_app, _apps
 from pathlib import Path
-from firebase_admin import auth
+from src.services.lazy import LazyModule
+from src.services.metrics import CACHE_REQUESTS, FIREBASE_CALL_DURATION, timed
+
+# firebase_admin and the Google libraries are imported by the first call
+auth = LazyModule("firebase_admin.auth")
 
 CREDENTIALS_PATH = Path(__file__).parents[4] / "creds/credentials.json"
 ENV_PATH = Path(__file__).parents[2] / ".env"
@@ -17,8 +28,25 @@ ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 FIREBASE_WEB_API_KEY = os.getenv("FIREBASE_WEB_API_KEY")
 
-FIREBASE_AUTH_URL = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={FIREBASE_WEB_API_KEY}"
-FIREBASE_SIGNUP_URL = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={FIREBASE_WEB_API_KEY}"
+# Number of verified tokens kept in memory
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Seconds between two downloads of the certificates signing the ID tokens.
+# Google publishes them with a max-age of several hours.
+CERT_REFRESH_INTERVAL = float(os.getenv("FIREBASE_CERT_REFRESH_INTERVAL", "3600"))
+CERT_RETRY_INTERVAL = 60.0
+CERT_TIMEOUT = 10.0
+CERT_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+# Issuer of the ID tokens, followed by the project ID
+TOKEN_ISSUER = "https://securetoken.google.com/"
+
+# Maximum number of users of a page, the limit of the Firebase API
+USERS_PAGE_SIZE = 1000
+
+# Seconds during which the snapshot of all the users is served again
+USERS_SNAPSHOT_TTL = float(os.getenv("USERS_SNAPSHOT_TTL", "10"))
+
+logger = logging.getLogger(__name__)
 
 
 class FirebaseClient:
@@ -27,27 +55,304 @@ class FirebaseClient:
     """
 
     def __init__(self):
+        from firebase_admin import credentials, initialize_app, _apps
+
         if not _apps:
             cred = credentials.Certificate(CREDENTIALS_PATH)
             initialize_app(cred)
 
 
+def initialize_firebase() -> None:
+    """ Initialize the Firebase app when the application starts, then keep
+        the certificates signing the ID tokens fresh
+    """
+    try:
+        FirebaseClient()
+    except Exception as e:
+        logger.warning("Could not initialize Firebase: %s", e)
+        return
+    cert_refresher.start()
+
+
 def get_users() -> list[FirebaseUser]:
     """ Get all users from Firebase.
 
     Returns:
         list[FirebaseUser]: List of Firebase users with email, user_id and role.
     """
-    users_list = auth.list_users()
     users = []
-    for user in users_list.iterate_all():
-        users.append(FirebaseUser(email=user.email, user_id=user.uid,
-                     role=user.custom_claims.get("role")))
+    with timed(FIREBASE_CALL_DURATION, operation="list_users"):
+        for user in auth.list_users().iterate_all():
+            users.append(_to_firebase_user(user))
     return users
 
 
+class TokenCache:
+    """ LRU cache of the users of verified Firebase tokens.
+
+        Tokens are keyed by their SHA-256 digest, so the cache never holds the
+        tokens themselves, and kept until their `exp` claim. Tokens without
+        an expiration are not cached.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[FirebaseUser, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[FirebaseUser]:
+        """ Return the user of a token verified before, if it has not expired """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                CACHE_REQUESTS.labels(cache="token", result="miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_REQUESTS.labels(cache="token", result="hit").inc()
+            return entry[0]
+
+    def put(self, token: str, user: FirebaseUser, expires_at: Optional[float]) -> None:
+        """ Keep the user of a verified token until `expires_at` """
+        if not expires_at or expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[self._key(token)] = (user, float(expires_at))
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Return the hit rate and the number of cached tokens """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+class CertificateRefresher:
+    """ Download the certificates signing the ID tokens in a background thread.
+
+        `auth.verify_id_token` downloads the certificates again once they
+        expired, during a request. The refresher downloads them ahead of time,
+        and every `interval` seconds after that, so that the tokens they sign
+        are verified in memory. Tokens they cannot verify, e.g. signed with a
+        key published since the last refresh, are verified by Firebase.
+    """
+
+    def __init__(self, interval: float = CERT_REFRESH_INTERVAL,
+                 transport: Optional[httpx.BaseTransport] = None):
+        self.interval = interval
+        self._transport = transport
+        self.certificates: dict[str, str] = {}
+        self.project_id: Optional[str] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """ Download the certificates, keyed by the ID of their key """
+        from firebase_admin import get_app
+
+        project_id = get_app().project_id
+        with httpx.Client(timeout=CERT_TIMEOUT, transport=self._transport) as client:
+            response = client.get(CERT_URL)
+        response.raise_for_status()
+        self.certificates, self.project_id = response.json(), project_id
+        self.refreshes += 1
+        self.last_refresh = time.time()
+
+    def decode(self, token: str) -> Optional[dict]:
+        """ Verify a token with the downloaded certificates, with the checks
+            of `auth.verify_id_token`.
+
+        Args:
+            token (str): Firebase token
+
+        Raises:
+            auth.ExpiredIdTokenError: The token has expired
+            auth.InvalidIdTokenError: The token is not valid
+
+        Returns:
+            dict: The claims of the token, or None if the certificates cannot
+                verify it
+        """
+        from google.auth import jwt
+
+        certificates, project_id = self.certificates, self.project_id
+        if not certificates or not project_id or os.getenv("FIREBASE_AUTH_EMULATOR_HOST"):
+            return None
+        try:
+            header = jwt.decode_header(token)
+        except ValueError:
+            return None
+        if header.get("alg") != "RS256" or header.get("kid") not in certificates:
+            return None
+        try:
+            claims = jwt.decode(token, certs=certificates, audience=project_id)
+        except ValueError as e:
+            if "Token expired" in str(e):
+                raise auth.ExpiredIdTokenError(str(e), e)
+            raise auth.InvalidIdTokenError(str(e), e)
+        subject = claims.get("sub")
+        if claims.get("iss") != TOKEN_ISSUER + project_id:
+            raise auth.InvalidIdTokenError('Firebase ID token has incorrect "iss" (issuer) claim')
+        if not isinstance(subject, str) or not 0 < len(subject) <= 128:
+            raise auth.InvalidIdTokenError('Firebase ID token has an invalid "sub" (subject) claim')
+        claims["uid"] = subject
+        return claims
+
+    def _run(self) -> None:
+        wait = 0.0
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                wait = self.interval
+            except Exception as e:
+                self.failures += 1
+                logger.warning("Could not refresh the Firebase certificates: %s", e)
+                wait = min(CERT_RETRY_INTERVAL, self.interval)
+
+    def start(self) -> None:
+        """ Start refreshing the certificates, if it is not already running """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="firebase-cert-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_refresh": self.last_refresh,
+            "interval": self.interval,
+            "certificates": len(self.certificates),
+        }
+
+
+token_cache = TokenCache()
+cert_refresher = CertificateRefresher()
+
+
+def _to_firebase_user(user: "auth.UserRecord") -> FirebaseUser:
+    role = (user.custom_claims or {}).get("role", RoleEnum.default)
+    return FirebaseUser(email=user.email, user_id=user.uid, role=role)
+
+
+def list_users_page(page_token: Optional[str] = None,
+                    page_size: int = USERS_PAGE_SIZE) -> tuple[list[FirebaseUser], Optional[str]]:
+    """ Get one page of users from Firebase.
+        Users without a role get the default role.
+
+    Args:
+        page_token (str, optional): Token of the page, the first page by default
+        page_size (int): Maximum number of users of the page
+
+    Returns:
+        tuple: The users of the page, and the token of the next page or None
+            if it is the last one
+    """
+    with timed(FIREBASE_CALL_DURATION, operation="list_users_page"):
+        page = auth.list_users(page_token=page_token, max_results=page_size)
+    return [_to_firebase_user(user) for user in page.users], page.next_page_token or None
+
+
+def iter_users(page_token: Optional[str] = None,
+               page_size: int = USERS_PAGE_SIZE) -> Iterator[FirebaseUser]:
+    """ Iterate over the users from Firebase, page by page.
+        The next page is fetched in a background thread while the users of
+        the current page are consumed.
+
+    Args:
+        page_token (str, optional): Token of the first page to fetch
+        page_size (int): Number of users fetched per request
+
+    Yields:
+        FirebaseUser: The users
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(list_users_page, page_token, page_size)
+        while future is not None:
+            users, next_page_token = future.result()
+            future = (executor.submit(list_users_page, next_page_token, page_size)
+                      if next_page_token else None)
+            yield from users
+
+
+class UsersSnapshot:
+    """ List of all the users, fetched again once it is older than `ttl`
+        seconds. Concurrent requests wait for a single listing.
+    """
+
+    def __init__(self, ttl: float = USERS_SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._users: Optional[list[FirebaseUser]] = None
+        self._taken_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> Optional[list[FirebaseUser]]:
+        if self._users is not None and time.monotonic() - self._taken_at < self.ttl:
+            return self._users
+        return None
+
+    def get(self) -> tuple[list[FirebaseUser], float]:
+        """ Return the users and the age of the snapshot in seconds """
+        users = self._fresh()
+        if users is None:
+            with self._lock:
+                users = self._fresh()
+                if users is None:
+                    users = list(iter_users())
+                    self._users, self._taken_at = users, time.monotonic()
+        return users, time.monotonic() - self._taken_at
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users = None
+
+
+users_snapshot = UsersSnapshot()
+
+
 def verify_firebase_token(token: str) -> FirebaseUser:
     """ Verify the Firebase token and return the user.
+        The users of verified tokens are cached until the tokens expire.
 
     Args:
         token (str): Firebase token
@@ -60,8 +365,14 @@ def verify_firebase_token(token: str) -> FirebaseUser:
     Returns:
         FirebaseUser: User with email, user_id and role.
     """
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
     try:
-        decoded_token = auth.verify_id_token(token)
+        with timed(FIREBASE_CALL_DURATION, operation="verify_id_token"):
+            decoded_token = cert_refresher.decode(token)
+            if decoded_token is None:
+                decoded_token = auth.verify_id_token(token)
         email = decoded_token.get("email")
         user_id = decoded_token.get("user_id")
         role = decoded_token.get("role")
@@ -72,7 +383,9 @@ def verify_firebase_token(token: str) -> FirebaseUser:
                 detail="Invalid token: missing required fields"
             )
 
-        return FirebaseUser(email=email, user_id=user_id, role=role)
+        user = FirebaseUser(email=email, user_id=user_id, role=role)
+        token_cache.put(token, user, decoded_token.get("exp"))
+        return user
 
     except auth.InvalidIdTokenError:
         raise HTTPException(
@@ -104,7 +417,8 @@ def set_role(uid: int, role: str) -> None:
         )
     custom_clains = {"role": role}
     try:
-        auth.set_custom_user_claims(uid, custom_clains)
+        with timed(FIREBASE_CALL_DURATION, operation="set_custom_user_claims"):
+            auth.set_custom_user_claims(uid, custom_clains)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -125,7 +439,8 @@ def get_role(uid: int) -> str:
         str: Role
     """
     try:
-        user = auth.get_user(uid)
+        with timed(FIREBASE_CALL_DURATION, operation="get_user"):
+            user = auth.get_user(uid)
         return user.custom_claims.get("role")
     except Exception as e:
         raise HTTPException(
@@ -1,18 +1,49 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
 from fastapi import status
 from fastapi.exceptions import HTTPException
 
 from src.services.firebase import FirebaseClient
 from src.schemas.parameters import Parameters
-from firebase_admin import firestore
+from src.services.lazy import LazyModule
+from src.services.metrics import CACHE_REQUESTS, FIREBASE_CALL_DURATION
+
+firestore = LazyModule("firebase_admin.firestore")
+
+# Seconds during which cached parameters are served without reading Firestore
+PARAMETERS_CACHE_TTL = float(os.getenv("PARAMETERS_CACHE_TTL", "30"))
+
+# "ttl" reads the document again once the TTL expired, "listen" keeps it up
+# to date with a snapshot listener
+PARAMETERS_CACHE_MODE = os.getenv("PARAMETERS_CACHE_MODE", "ttl")
+
+# Maximum time to wait for the first snapshot of a listener
+SNAPSHOT_TIMEOUT = 5.0
+
+# Maximum number of writes in a Firestore batch
+BATCH_MAX_WRITES = 500
 
 
 class FirestoreClient(FirebaseClient):
     """Wrapper around a database"""
 
-    def __init__(self) -> None:
-        """Init the client."""
-        super().__init__()
-        self.db = firestore.client()
+    def __init__(self, db: Optional[Any] = None) -> None:
+        """Init the client.
+        Args:
+            db: The database, a `firestore.client()` by default. The
+                FIRESTORE_EMULATOR_HOST environment variable points it to the
+                emulator, and `benchmarks.fakes.FakeFirestore` replaces it
+                with an in-memory database.
+        """
+        if db is None:
+            super().__init__()
+            db = firestore.client()
+        self.db = db
+        self._stats: dict[str, dict] = {}
+        self._stats_lock = threading.Lock()
 
     def get(self, collection_name: str, document_id: str) -> dict:
         """Find one document by ID.
@@ -32,33 +63,282 @@ class FirestoreClient(FirebaseClient):
             f"No document found at {collection_name} with the id {document_id}"
         )
 
-    def put(self, collection_name: str, document_id: str, data: Parameters) -> status:
-        """Add a document to a collection.
+    def put(self, collection_name: str, document_id: str, data: Parameters) -> tuple[dict, int]:
+        """Update a document in a transaction.
+        The document is read and written in one transaction, which Firestore
+        runs again if another writer changed the document in between. Only
+        the given fields are sent when they are all already in the document.
         Args:
             collection_name: The collection name
             document_id: The document id
             data: The data to add
+        Raises:
+            HTTPException: The document does not exist, or it kept changing
+                during the transaction
+        Return:
+            The updated document and the status code: 201 if the data was
+            merged into the document, 200 if it replaced it.
         """
-        existing_doc = self.db.collection(
-            collection_name).document(document_id).get()
-        if existing_doc.exists:
+        reference = self.db.collection(collection_name).document(document_id)
+        attempts = 0
+
+        @firestore.transactional
+        def merge(transaction) -> tuple[dict, int]:
+            nonlocal attempts
+            attempts += 1
+            existing_doc = reference.get(transaction=transaction)
+            if not existing_doc.exists:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"No document found at {collection_name} with the id {document_id}"
+                )
             existing_data = existing_doc.to_dict()
             if set(data.dict().keys()).issubset(existing_data.keys()):
-                status_code = status.HTTP_201_CREATED
-                updated_data = {**existing_data, **data.to_dict()}
-            else:
-                status_code = status.HTTP_200_OK
-                updated_data = data.to_dict()
+                if data.to_dict():
+                    transaction.update(reference, data.to_dict())
+                return {**existing_data, **data.to_dict()}, status.HTTP_201_CREATED
+            transaction.set(reference, data.to_dict())
+            return data.to_dict(), status.HTTP_200_OK
 
-        else:
+        start = time.perf_counter()
+        try:
+            return merge(self.db.transaction())
+        except ValueError as e:
+            # Raised by firestore.transactional once all the attempts failed
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No document found at {collection_name} with the id {document_id}"
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"The document {collection_name}/{document_id} kept changing: {e}"
             )
-        self.db.collection(collection_name).document(
-            document_id).set(updated_data)
+        finally:
+            self._record("put", time.perf_counter() - start, conflicts=max(attempts - 1, 0))
+
+    def put_many(self, collection_name: str, documents: dict[str, Parameters]) -> list[str]:
+        """Merge many documents into a collection in batched writes.
+        Each batch is committed in one round trip. Documents are created if
+        they do not exist, and only the given fields are written.
+        Args:
+            collection_name: The collection name
+            documents: The data of each document, by document id
+        Return:
+            The ids of the written documents.
+        """
+        start = time.perf_counter()
+        document_ids = list(documents)
+        for first in range(0, len(document_ids), BATCH_MAX_WRITES):
+            batch = self.db.batch()
+            for document_id in document_ids[first:first + BATCH_MAX_WRITES]:
+                reference = self.db.collection(collection_name).document(document_id)
+                batch.set(reference, documents[document_id].to_dict(), merge=True)
+            batch.commit()
+        self._record("put_many", time.perf_counter() - start, documents=len(document_ids))
+        return document_ids
+
+    def _record(self, operation: str, seconds: float, conflicts: int = 0,
+                documents: int = 1) -> None:
+        FIREBASE_CALL_DURATION.labels(operation=f"firestore_{operation}").observe(seconds)
+        with self._stats_lock:
+            stats = self._stats.setdefault(operation, {
+                "calls": 0, "documents": 0, "conflicts": 0,
+                "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["documents"] += documents
+            stats["conflicts"] += conflicts
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def stats(self) -> dict:
+        """Return the number of calls, latency and transaction conflicts of
+        each write operation.
+        """
+        with self._stats_lock:
+            return {
+                operation: {**stats, "mean_seconds": stats["total_seconds"] / stats["calls"]}
+                for operation, stats in self._stats.items()
+            }
+
+
+def _unsubscribe(watch: Any) -> None:
+    try:
+        watch.unsubscribe()
+    except Exception:
+        # The listener already stopped on an error
+        pass
+
+
+class ParametersCache:
+    """ Serve Firestore parameter documents from memory.
+
+        A single FirestoreClient is created on first use and kept for the
+        life of the cache. In "ttl" mode, a document is read again once it is
+        older than `ttl` seconds; concurrent misses wait for a single read.
+        In "listen" mode, a snapshot listener pushes each change of the
+        document to the cache, which then never reads it again. Writes go
+        through the cache, which keeps the written document.
+    """
+
+    def __init__(self, client_factory: Callable[[], FirestoreClient] = FirestoreClient,
+                 ttl: float = PARAMETERS_CACHE_TTL, mode: str = PARAMETERS_CACHE_MODE):
+        if mode not in ("ttl", "listen"):
+            raise ValueError(f"Unknown parameters cache mode: {mode}")
+        self.ttl = ttl
+        self.mode = mode
+        self._client_factory = client_factory
+        self._client: Optional[FirestoreClient] = None
+        self._entries: dict[tuple[str, str], tuple[Parameters, float]] = {}
+        self._watches: dict[tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple[str, str], threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self) -> FirestoreClient:
+        """ The long-lived Firestore client """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def _fresh(self, key: tuple[str, str]) -> Optional[Parameters]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if key in self._watches or time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def peek(self, collection_name: str, document_id: str) -> Optional[Parameters]:
+        """ Return the cached document if it is fresh, without reading Firestore """
+        params = self._fresh((collection_name, document_id))
+        if params is not None:
+            self.hits += 1
+            CACHE_REQUESTS.labels(cache="parameters", result="hit").inc()
+        return params
+
+    def get(self, collection_name: str, document_id: str) -> Parameters:
+        """ Return a document, from memory when it is fresh.
+
+        Raises:
+            FileExistsError: The document does not exist
+        """
+        key = (collection_name, document_id)
+        params = self.peek(*key)
+        if params is not None:
+            return params
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another request may have read the document while this one waited
+            params = self.peek(*key)
+            if params is not None:
+                return params
+            self.misses += 1
+            CACHE_REQUESTS.labels(cache="parameters", result="miss").inc()
+            # A watched document that is not cached was deleted: read it
+            # rather than starting a second listener on it
+            if self.mode == "listen" and key not in self._watches and self._subscribe(key):
+                params = self._fresh(key)
+                if params is not None:
+                    return params
+            params = self.client.get(collection_name, document_id)
+            self._entries[key] = (params, time.monotonic())
+            return params
+
+    def _subscribe(self, key: tuple[str, str]) -> bool:
+        """ Start a snapshot listener on a document and wait for its first
+            snapshot. Return False, and leave no listener behind, if the
+            listener could not be started, its first snapshot did not come in
+            time or could not be read.
+        """
+        received = threading.Event()
+        failed = threading.Event()
+
+        def on_snapshot(snapshots, changes, read_time) -> None:
+            try:
+                for snapshot in snapshots:
+                    if snapshot.exists:
+                        params = Parameters(**{k: v for k, v in snapshot.to_dict().items()
+                                               if v is not None})
+                        self._entries[key] = (params, time.monotonic())
+                    else:
+                        self._entries.pop(key, None)
+            except Exception:
+                # The document is no longer kept up to date: read it again
+                failed.set()
+                self._entries.pop(key, None)
+                self._unwatch(key, in_background=True)
+            finally:
+                received.set()
+
+        try:
+            reference = self.client.db.collection(key[0]).document(key[1])
+            self._watches[key] = reference.on_snapshot(on_snapshot)
+        except Exception:
+            return False
+        if not received.wait(SNAPSHOT_TIMEOUT) or failed.is_set():
+            self._unwatch(key)
+            return False
+        return True
+
+    def _unwatch(self, key: tuple[str, str], in_background: bool = False) -> None:
+        """ Stop the listener of a document, if any. `in_background` stops it
+            from another thread, for a listener stopping itself from its callback.
+        """
+        watch = self._watches.pop(key, None)
+        if watch is None:
+            return
+        if in_background:
+            threading.Thread(target=_unsubscribe, args=(watch,), daemon=True).start()
+        else:
+            _unsubscribe(watch)
+
+    def put(self, collection_name: str, document_id: str, data: Parameters) -> tuple[dict, int]:
+        """ Update a document in Firestore and in the cache, see `FirestoreClient.put` """
+        key = (collection_name, document_id)
+        try:
+            updated_data, status_code = self.client.put(collection_name, document_id, data)
+        except Exception:
+            self.invalidate(collection_name, document_id)
+            raise
+        self._entries[key] = (Parameters(**{k: v for k, v in updated_data.items()
+                                            if v is not None}), time.monotonic())
         return updated_data, status_code
 
+    def put_many(self, collection_name: str, documents: dict[str, Parameters]) -> list[str]:
+        """ Merge many documents in batched writes, see `FirestoreClient.put_many`,
+            and drop them from the cache
+        """
+        try:
+            return self.client.put_many(collection_name, documents)
+        finally:
+            for document_id in documents:
+                self.invalidate(collection_name, document_id)
+
+    def invalidate(self, collection_name: str, document_id: str) -> None:
+        """ Drop a document from the cache, unless a listener keeps it up to date """
+        key = (collection_name, document_id)
+        if key not in self._watches:
+            self._entries.pop(key, None)
+
+    def close(self) -> None:
+        """ Stop the snapshot listeners """
+        for key in list(self._watches):
+            self._unwatch(key)
+
+    def stats(self) -> dict:
+        """ Return the hit/miss counters of the cache """
+        return {
+            "mode": self.mode,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "listeners": len(self._watches),
+            "firestore": self._client.stats() if self._client is not None else {},
+        }
+
 
 if __name__ == "__main__":
     firestore = FirestoreClient()
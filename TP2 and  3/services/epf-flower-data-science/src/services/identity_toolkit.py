@@ -0,0 +1,142 @@
+import asyncio
+import os
+import random
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, status
+
+from src.services.firebase import FIREBASE_WEB_API_KEY
+from src.services.metrics import FIREBASE_CALL_DURATION, timed
+
+# Base URL of the identity-toolkit API, e.g. the Firebase Auth emulator or
+# the local stand-in of benchmarks/fakes.py
+IDENTITY_TOOLKIT_URL = os.getenv("IDENTITY_TOOLKIT_URL", "https://identitytoolkit.googleapis.com")
+IDENTITY_TOOLKIT_TIMEOUT = float(os.getenv("IDENTITY_TOOLKIT_TIMEOUT", "10"))
+IDENTITY_TOOLKIT_MAX_RETRIES = int(os.getenv("IDENTITY_TOOLKIT_MAX_RETRIES", "2"))
+IDENTITY_TOOLKIT_MAX_CONNECTIONS = int(os.getenv("IDENTITY_TOOLKIT_MAX_CONNECTIONS", "100"))
+
+# Base delay of the exponential backoff between two attempts, in seconds
+RETRY_BACKOFF = 0.2
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+async def _close_client(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except RuntimeError:
+        # The connections belong to an event loop that is closed
+        pass
+
+
+class IdentityToolkitClient:
+    """ Async client of the Firebase identity-toolkit API.
+
+        A single httpx.AsyncClient keeps its connections alive between
+        requests, up to `max_connections`. It is created on first use in the
+        running event loop, and again if it is used from another loop, the
+        client of the previous loop being closed. Failed requests are retried
+        with an exponential backoff: sign-ins on connection errors, timeouts
+        and 429/5xx responses, sign-ups only when the request could not be
+        sent, so that an account is never created twice. A request that still
+        fails raises a 504 HTTPException on a timeout and a 502 otherwise.
+    """
+
+    def __init__(self, base_url: str = IDENTITY_TOOLKIT_URL,
+                 api_key: Optional[str] = FIREBASE_WEB_API_KEY,
+                 timeout: float = IDENTITY_TOOLKIT_TIMEOUT,
+                 max_retries: int = IDENTITY_TOOLKIT_MAX_RETRIES,
+                 max_connections: int = IDENTITY_TOOLKIT_MAX_CONNECTIONS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Tasks closing the clients of previous event loops
+        self._closing: set[asyncio.Task] = set()
+        self.requests = 0
+        self.retries = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._close_later(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self._transport)
+            self._loop = loop
+        return self._client
+
+    def _close_later(self, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        """ Close the client of another event loop, in that loop if it still runs """
+        if loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(_close_client(client), loop)
+            return
+        task = asyncio.get_running_loop().create_task(_close_client(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _post(self, endpoint: str, payload: dict, idempotent: bool) -> httpx.Response:
+        client = self._get_client()
+        retry_on = (httpx.TransportError,) if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random()))
+            self.requests += 1
+            try:
+                with timed(FIREBASE_CALL_DURATION, operation=endpoint.rsplit(":", 1)[-1]):
+                    response = await client.post(endpoint, params={"key": self.api_key}, json=payload)
+            except httpx.TransportError as e:
+                if isinstance(e, retry_on) and attempt < self.max_retries:
+                    continue
+                if isinstance(e, httpx.TimeoutException):
+                    raise HTTPException(
+                        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                        detail="The identity provider did not answer in time") from e
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY,
+                    detail="The identity provider could not be reached") from e
+            if not (idempotent and response.status_code in RETRY_STATUS_CODES) \
+                    or attempt == self.max_retries:
+                return response
+
+    async def sign_up(self, email: str, password: str) -> httpx.Response:
+        """ Create an account with an email and a password
+
+        Raises:
+            HTTPException: The identity-toolkit API could not be reached (502)
+                or timed out (504)
+        """
+        return await self._post("/v1/accounts:signUp", {
+            "email": email, "password": password, "returnSecureToken": True},
+            idempotent=False)
+
+    async def sign_in_with_password(self, email: str, password: str) -> httpx.Response:
+        """ Sign in with an email and a password, the response holds the ID token
+
+        Raises:
+            HTTPException: The identity-toolkit API could not be reached (502)
+                or timed out (504)
+        """
+        return await self._post("/v1/accounts:signInWithPassword", {
+            "email": email, "password": password, "returnSecureToken": True},
+            idempotent=True)
+
+    async def aclose(self) -> None:
+        """ Close the pooled connections """
+        if self._client is not None:
+            client, self._client = self._client, None
+            await _close_client(client)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "retries": self.retries}
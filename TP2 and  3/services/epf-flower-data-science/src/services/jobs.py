@@ -0,0 +1,229 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+
+from src.schemas.jobs import Job, JobState
+from src.services.model_store import MODEL_DIR
+
+JOBS_DIR = MODEL_DIR / "jobs"
+
+# Number of jobs running at the same time, and of jobs waiting for a slot
+TRAINING_MAX_JOBS = int(os.getenv("TRAINING_MAX_JOBS", "1"))
+TRAINING_MAX_QUEUED = int(os.getenv("TRAINING_MAX_QUEUED", "4"))
+# Number of finished job records kept, the oldest are deleted
+TRAINING_JOBS_KEPT = int(os.getenv("TRAINING_JOBS_KEPT", "100"))
+
+
+def write_job(jobs_dir: Path, record: dict) -> None:
+    """ Save a job record atomically, so that any worker can read it """
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    path = jobs_dir / f"{record['job_id']}.json"
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(record, file)
+    os.replace(tmp_path, path)
+
+
+def read_job(jobs_dir: Path, job_id: str) -> Optional[dict]:
+    """ Read a job record, or return None if it does not exist """
+    try:
+        with open(jobs_dir / f"{job_id}.json") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def active_jobs(jobs_dir: Path = JOBS_DIR) -> list[dict]:
+    """ Return the records of the jobs queued or running, in any worker """
+    records = []
+    for path in Path(jobs_dir).glob("*.json"):
+        try:
+            with open(path) as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if record.get("state") in (JobState.queued.value, JobState.running.value):
+            records.append(record)
+    return records
+
+
+def prune_jobs(jobs_dir: Path, keep: int = TRAINING_JOBS_KEPT) -> int:
+    """ Delete the records of the finished jobs but the `keep` latest ones.
+        The records of the jobs queued or running are never deleted.
+
+    Returns:
+        int: Number of records deleted
+    """
+    finished = []
+    for path in Path(jobs_dir).glob("*.json"):
+        try:
+            with open(path) as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if record.get("state") in (JobState.succeeded.value, JobState.failed.value):
+            finished.append((record.get("finished_at") or record["submitted_at"], path))
+    finished.sort()
+    stale = finished[:max(len(finished) - keep, 0)]
+    for _, path in stale:
+        path.unlink(missing_ok=True)
+    return len(stale)
+
+
+def run_job(jobs_dir: Path, job_id: str, target: Callable[..., dict], params: dict) -> dict:
+    """ Run a job in a worker process and record its progress.
+
+    Args:
+        jobs_dir (Path): Directory of the job records
+        job_id (str): Id of the job
+        target (Callable): Top-level function doing the work, returning a
+            JSON-serializable dictionary
+        params (dict): Keyword arguments of the target
+
+    Returns:
+        dict: The result of the target
+    """
+    record = read_job(jobs_dir, job_id)
+    record["state"] = JobState.running.value
+    record["started_at"] = time.time()
+    record["queue_seconds"] = record["started_at"] - record["submitted_at"]
+    write_job(jobs_dir, record)
+
+    try:
+        result = target(**params)
+    except Exception as e:
+        record["state"] = JobState.failed.value
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    else:
+        record["state"] = JobState.succeeded.value
+        record["result"] = result
+        return result
+    finally:
+        record["finished_at"] = time.time()
+        record["run_seconds"] = record["finished_at"] - record["started_at"]
+        write_job(jobs_dir, record)
+
+
+class JobManager:
+    """ Run long jobs such as model training outside of the event loop.
+
+        Jobs are submitted to a process pool of `max_jobs` workers, created on
+        first use. Their records are stored as JSON files, so that the state of
+        a job can be queried from any worker of the application. The records
+        of the finished jobs past the `keep` latest are deleted on submission.
+    """
+
+    def __init__(self, jobs_dir: Path = JOBS_DIR, max_jobs: int = TRAINING_MAX_JOBS,
+                 max_queued: int = TRAINING_MAX_QUEUED, keep: int = TRAINING_JOBS_KEPT,
+                 executor_factory: Optional[Callable[[int], Executor]] = None):
+        self.jobs_dir = Path(jobs_dir)
+        self.max_jobs = max_jobs
+        self.max_queued = max_queued
+        self.keep = keep
+        self._executor_factory = executor_factory or self._process_pool
+        self._executor: Optional[Executor] = None
+        self._futures: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _process_pool(max_workers: int) -> Executor:
+        # spawn: forking a process running an event loop and threads is unsafe
+        return ProcessPoolExecutor(max_workers=max_workers,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, kind: str, target: Callable[..., dict], params: dict,
+               on_success: Optional[Callable[[dict], None]] = None) -> dict:
+        """ Submit a job.
+
+        Args:
+            kind (str): Type of job, e.g. "training"
+            target (Callable): Top-level function doing the work
+            params (dict): Keyword arguments of the target
+            on_success (Callable, optional): Called in this process with the
+                result of the target once the job succeeded
+
+        Raises:
+            HTTPException: Too many jobs are already running or queued
+
+        Returns:
+            dict: The record of the queued job
+        """
+        with self._lock:
+            self._futures = {job_id: future for job_id, future in self._futures.items()
+                             if not future.done()}
+            if len(self._futures) >= self.max_jobs + self.max_queued:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Too many {kind} jobs in progress, try again later.")
+            if self._executor is None:
+                self._executor = self._executor_factory(self.max_jobs)
+            prune_jobs(self.jobs_dir, self.keep)
+
+            record = Job(job_id=uuid.uuid4().hex, kind=kind, state=JobState.queued,
+                         params=params, submitted_at=time.time()).dict()
+            write_job(self.jobs_dir, record)
+
+            future = self._executor.submit(
+                run_job, self.jobs_dir, record["job_id"], target, params)
+            self._futures[record["job_id"]] = future
+        future.add_done_callback(partial(self._on_done, record["job_id"], on_success))
+        return record
+
+    def _on_done(self, job_id: str, on_success: Optional[Callable[[dict], None]],
+                 future: Future) -> None:
+        if future.cancelled():
+            # Still queued when the manager shut down, it will never run
+            record = read_job(self.jobs_dir, job_id)
+            if record is not None:
+                record["state"] = JobState.failed.value
+                record["error"] = "Cancelled: the server shut down before the job started"
+                record["finished_at"] = time.time()
+                write_job(self.jobs_dir, record)
+            return
+        error = future.exception()
+        if error is None:
+            if on_success is not None:
+                on_success(future.result())
+            return
+        record = read_job(self.jobs_dir, job_id)
+        if record is not None and record["state"] != JobState.failed.value:
+            # The worker died before it could record the failure
+            record["state"] = JobState.failed.value
+            record["error"] = f"{type(error).__name__}: {error}"
+            record["finished_at"] = time.time()
+            write_job(self.jobs_dir, record)
+
+    def get(self, job_id: str) -> dict:
+        """ Return the record of a job
+
+        Raises:
+            HTTPException: The job was not found
+        """
+        record = read_job(self.jobs_dir, job_id) if job_id.isalnum() else None
+        if record is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job not found: {job_id}")
+        return record
+
+    def shutdown(self) -> None:
+        """ Stop the workers once the running jobs are done, the queued jobs
+            are cancelled and recorded as failed
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+training_jobs = JobManager()
@@ -0,0 +1,32 @@
+""" Deferred imports of the heavy dependencies, so that importing the
+    application stays fast and they are only loaded by the first request
+    that needs them.
+"""
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """ Stand-in for a module, imported on the first access to one of its
+        attributes.
+
+        `auth = LazyModule("firebase_admin.auth")` then `auth.get_user(uid)`
+        behaves like `from firebase_admin import auth`, and
+        `patch("src.services.firebase.auth.get_user")` still works.
+    """
+
+    def __init__(self, name: str):
+        self.__name = name
+        self.__module = None
+
+    def _load(self) -> ModuleType:
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return self.__module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__module is not None else "not loaded"
+        return f"<lazy module {self.__name!r} ({state})>"
@@ -0,0 +1,128 @@
+""" Prometheus metrics of the service, served by GET /metrics.
+
+    Under gunicorn, each worker writes its metrics to files in the
+    PROMETHEUS_MULTIPROC_DIR directory, set by gunicorn.conf.py, and the
+    worker answering /metrics aggregates the files of all the workers. The
+    variable must be set before prometheus_client is imported.
+"""
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest)
+from prometheus_client import multiprocess
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Buckets of the request and call latencies, in seconds
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter(
+    "http_requests_total", "Requests by route template and status code",
+    ["method", "route", "status"])
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to answer a request, by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being answered, by route template",
+    ["method", "route"], multiprocess_mode="livesum")
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Lookups of the in-memory caches: dataset, split, token, parameters",
+    ["cache", "result"])
+
+MODEL_LOAD_DURATION = Histogram(
+    "model_load_seconds", "Time to load a model artifact",
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+MODEL_INFERENCE_DURATION = Histogram(
+    "model_inference_seconds", "Time to score a batch of rows, by engine",
+    ["engine"], buckets=LATENCY_BUCKETS)
+MODEL_INFERENCE_ROWS = Counter(
+    "model_inference_rows_total", "Rows scored, by engine", ["engine"])
+
+FIREBASE_CALL_DURATION = Histogram(
+    "firebase_call_duration_seconds",
+    "Time of the calls to Firebase Auth, Firestore and the identity-toolkit API",
+    ["operation"], buckets=LATENCY_BUCKETS)
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter, by route template",
+    ["method", "route"])
+
+# Label of the requests matching no route, so that unknown paths do not
+# each create a time series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class timed:
+    """ Observe the duration of a block in a histogram:
+        `with timed(FIREBASE_CALL_DURATION, operation="list_users"): ...`
+    """
+
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram.labels(**labels) if labels else histogram
+
+    def __enter__(self) -> "timed":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.seconds = time.perf_counter() - self.start
+        self.histogram.observe(self.seconds)
+
+
+def registry() -> CollectorRegistry:
+    """ Registry of the metrics to expose, those of all the workers when
+        PROMETHEUS_MULTIPROC_DIR is set
+    """
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def render() -> tuple[bytes, str]:
+    """ Return the metrics in the Prometheus text format, with its content type """
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def route_template(scope: Scope) -> Optional[str]:
+    """ Path template of the route of a request, e.g. /iris/{model_id}, None if no route matches """
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return None
+
+
+class MetricsMiddleware:
+    """ Count the requests and time them, by route template """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = route_template(scope) or UNMATCHED_ROUTE
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method=method, route=route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.labels(method=method, route=route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method=method, route=route, status=str(status_code)).inc()
+            in_progress.dec()
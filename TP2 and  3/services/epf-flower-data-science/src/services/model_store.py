@@ -0,0 +1,328 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import joblib
+from fastapi import HTTPException, status
+
+from src.services.data import IRIS_FEATURES
+from src.services.metrics import MODEL_LOAD_DURATION
+
+MODEL_DIR = Path(__file__).parent.parent / "models"
+MODEL_PATH = MODEL_DIR / "iris_model.joblib"
+
+# Maximum time during which a worker serves its model without checking
+# whether a new artifact was written by another process, "inf" to never check
+# (under gunicorn, the master reloads the model and replaces its workers)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "2.0"))
+
+# Set to "r" to memory-map the numpy arrays of uncompressed artifacts
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE") or None
+
+# Loads of an artifact replaced while it was being loaded
+MODEL_LOAD_ATTEMPTS = 3
+
+# Variants of the model artifact written after each training, with the
+# name of their file relative to the artifact:
+# - raw: the joblib artifact itself, uncompressed and mmap-friendly
+# - zlib / lz4: compressed joblib artifacts, lz4 needs the lz4 package
+# - quantized: the flattened trees with float32 thresholds and the smallest
+#   integer types for node indices, loaded as a FlatForest
+ARTIFACT_SUFFIXES = {
+    "raw": ".joblib",
+    "zlib": ".zlib.joblib",
+    "lz4": ".lz4.joblib",
+    "quantized": ".quantized.npz",
+}
+
+# Variant served by the model holder, the raw artifact is used if it is missing
+MODEL_ARTIFACT_MODE = os.getenv("MODEL_ARTIFACT_MODE", "raw")
+
+logger = logging.getLogger(__name__)
+
+
+def file_stamp(path: Path) -> tuple:
+    """ Return the inode, modification time and size of a file: an artifact
+        replaced atomically gets a new stamp
+    """
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def artifact_version(stamp: tuple) -> str:
+    """ Return the version of an artifact from its stamp, without reading it,
+        which a memory-mapped load would do for nothing
+    """
+    return hashlib.sha256(repr(tuple(stamp)).encode()).hexdigest()[:12]
+
+
+class LoadedModel:
+    """ A model together with the information about the artifact it comes from """
+
+    def __init__(self, model: Any, path: Path, stamp: tuple, version: str,
+                 load_seconds: float):
+        self.model = model
+        self.path = path
+        self.stamp = stamp
+        self.version = version
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now(timezone.utc)
+
+
+def artifact_path(path: Path, mode: str) -> Path:
+    """ Return the path of a variant of a model artifact, see ARTIFACT_SUFFIXES """
+    path = Path(path)
+    if mode not in ARTIFACT_SUFFIXES:
+        raise ValueError(f"Unknown artifact mode: {mode}")
+    return path if mode == "raw" else path.with_name(path.stem + ARTIFACT_SUFFIXES[mode])
+
+
+def load_artifact(path: Path, mmap_mode: Optional[str] = None) -> Any:
+    """ Load a model artifact written by `save_model` or one of its variants """
+    path = Path(path)
+    if path.suffix == ".npz":
+        # Imported here, the predict service depends on this module
+        from src.services.predict import FlatForest
+        return FlatForest.load(path)
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+class ModelHolder:
+    """ Keep a model in memory and swap it when its artifact changes.
+
+        The model is loaded once and shared by all requests. Every
+        MODEL_RELOAD_INTERVAL seconds, the artifact's mtime and size are
+        checked; if they changed, the new model is loaded while the old one
+        keeps serving, then the reference is swapped in one assignment.
+        `path` is the raw artifact, `mode` selects the variant to serve. An
+        artifact that was not trained on `features` is rejected: the model
+        in memory keeps serving, or the requests get a 503 if there is none.
+    """
+
+    def __init__(self, path: Path = MODEL_PATH, mmap_mode: Optional[str] = MODEL_MMAP_MODE,
+                 mode: str = MODEL_ARTIFACT_MODE, features: Optional[Sequence[str]] = None):
+        self.path = Path(path)
+        self.mmap_mode = mmap_mode
+        self.mode = mode
+        # Features the artifacts must be trained on, in order, None for any
+        self.features = list(features) if features is not None else None
+        self._current: Optional[LoadedModel] = None
+        # Stamp of the last artifact rejected by `_check_features`, and why,
+        # so that it is not loaded again by every request
+        self._rejected: Optional[tuple[tuple, str]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def served_path(self) -> Path:
+        """ Return the path of the artifact variant to serve """
+        variant = artifact_path(self.path, self.mode)
+        return variant if variant.exists() else self.path
+
+    def _file_stamp(self) -> tuple:
+        return file_stamp(self.served_path())
+
+    def _check_features(self, model: Any) -> Optional[str]:
+        """ Return why a model cannot be served, None if it was trained on
+            the expected features
+        """
+        if self.features is None:
+            return None
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None:
+            if [str(name) for name in names] == self.features:
+                return None
+            trained_on = ", ".join(str(name) for name in names)
+        else:
+            n_features = getattr(model, "n_features_in_", None)
+            if n_features is None or n_features == len(self.features):
+                return None
+            trained_on = f"{n_features} features"
+        return (f"The model artifact was trained on {trained_on} instead of "
+                f"{', '.join(self.features)}. Train a model again.")
+
+    def _load(self) -> LoadedModel:
+        """ Load the artifact to serve.
+
+        Raises:
+            FileNotFoundError: The artifact does not exist
+            HTTPException: The artifact was not trained on the expected features (503)
+        """
+        path = self.served_path()
+        rejected = self._rejected
+        if rejected is not None and rejected[0] == file_stamp(path):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=rejected[1])
+        for _ in range(MODEL_LOAD_ATTEMPTS):
+            stamp = file_stamp(path)
+            start = time.perf_counter()
+            model = load_artifact(path, mmap_mode=self.mmap_mode)
+            load_seconds = time.perf_counter() - start
+            # The artifact was not replaced while it was loaded. Otherwise the
+            # stamp of the previous file makes the model stale if all the
+            # attempts fail, and it is loaded again at the next check.
+            if file_stamp(path) == stamp:
+                break
+        reason = self._check_features(model)
+        if reason is not None:
+            self._rejected = (stamp, reason)
+            logger.warning("Rejected model %s: %s", path, reason)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=reason)
+        MODEL_LOAD_DURATION.observe(load_seconds)
+        version = artifact_version(stamp)
+        logger.info("Loaded model %s version %s in %.3fs",
+                    path, version, load_seconds)
+        return LoadedModel(model, path, stamp, version, load_seconds)
+
+    def reload(self) -> LoadedModel:
+        """ Load the artifact from disk and make it the current model.
+
+        Raises:
+            FileNotFoundError: The artifact does not exist
+            HTTPException: The artifact was not trained on the expected features (503)
+
+        Returns:
+            LoadedModel: The newly loaded model
+        """
+        with self._lock:
+            self._current = self._load()
+            self._checked_at = time.monotonic()
+            return self._current
+
+    def current(self) -> LoadedModel:
+        """ Return the current model, loading it or picking up a new artifact
+            if needed.
+        """
+        loaded = self._current
+        if loaded is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self._load()
+                    self._checked_at = time.monotonic()
+                return self._current
+        if time.monotonic() - self._checked_at > MODEL_RELOAD_INTERVAL:
+            self._checked_at = time.monotonic()
+            if self.is_stale():
+                try:
+                    return self.reload()
+                except HTTPException:
+                    return loaded
+        return loaded
+
+    def is_stale(self) -> bool:
+        """ Return whether the artifact on disk is not the one of the model
+            in memory
+        """
+        loaded = self._current
+        try:
+            return loaded is None or self._file_stamp() != loaded.stamp
+        except FileNotFoundError:
+            # Keep serving the model in memory
+            return False
+
+    def get(self) -> Any:
+        """ Return the current model """
+        return self.current().model
+
+    def info(self) -> dict:
+        """ Return the version, features and load time of the current model """
+        loaded = self.current()
+        return {
+            "path": str(loaded.path),
+            "version": loaded.version,
+            "features": [str(name) for name in getattr(loaded.model, "feature_names_in_", [])],
+            "load_seconds": loaded.load_seconds,
+            "loaded_at": loaded.loaded_at.isoformat(),
+            "mmap_mode": self.mmap_mode,
+            "artifact_mode": self.mode,
+        }
+
+
+def metadata_path(path: Path) -> Path:
+    """ Return the path of the metadata file of a model artifact """
+    path = Path(path)
+    return path.with_name(path.stem + ".meta.json")
+
+
+def flat_forest_path(path: Path) -> Path:
+    """ Return the path of the flat-array export of a model artifact """
+    path = Path(path)
+    return path.with_name(path.stem + ".forest.npz")
+
+
+def manifest_path(path: Path) -> Path:
+    """ Return the path of the manifest of the variants of a model artifact """
+    path = Path(path)
+    return path.with_name(path.stem + ".manifest.json")
+
+
+def read_manifest(path: Path = MODEL_PATH) -> Optional[dict]:
+    """ Read the manifest of the variants of a model artifact, or return None
+        if it has none
+    """
+    try:
+        with open(manifest_path(path)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def read_model_metadata(path: Path = MODEL_PATH) -> Optional[dict]:
+    """ Read the metadata of a model artifact, or return None if it has none """
+    try:
+        with open(metadata_path(path)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_model(model: Any, path: Path = MODEL_PATH, metadata: Optional[dict] = None,
+               **dump_kwargs) -> str:
+    """ Write a model artifact atomically, so that readers never load a
+        partially written file. Its metadata is replaced right after it: the
+        metadata on disk never describes a model newer than the artifact.
+
+    Args:
+        model: The model to save
+        path (Path): Path of the artifact
+        metadata (dict, optional): Saved next to the artifact, see
+            `read_model_metadata`
+        **dump_kwargs: Extra arguments of joblib.dump
+
+    Returns:
+        str: The path of the artifact
+    """
+    path = Path(path)
+    meta_path = metadata_path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_meta_path = meta_path.with_name(f".{meta_path.name}.{os.getpid()}.tmp")
+    try:
+        # Both files are written before either is replaced, so that the
+        # window between the two replacements is as short as possible
+        joblib.dump(model, tmp_path, **dump_kwargs)
+        if metadata is not None:
+            with open(tmp_meta_path, "w") as file:
+                json.dump(metadata, file, indent=4)
+        os.replace(tmp_path, path)
+        if metadata is not None:
+            os.replace(tmp_meta_path, meta_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        tmp_meta_path.unlink(missing_ok=True)
+    return str(path)
+
+
+def warm_up_model() -> None:
+    """ Load the serving model ahead of the first request """
+    try:
+        model_holder.current()
+    except Exception as e:
+        logger.warning("Could not load the model at startup: %s", e)
+
+
+model_holder = ModelHolder(features=IRIS_FEATURES)
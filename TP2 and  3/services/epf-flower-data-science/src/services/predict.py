@@ -1,23 +1,315 @@
-from pathlib import Path
-import joblib
-from sklearn.metrics import accuracy_score
+from __future__ import annotations
 
-from src.services.train import test_train_split_iris, process_iris_df, get_iris_local
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
 
-MODEL_DIR = Path(__file__).parent.parent / "models"
+import numpy as np
+from fastapi import HTTPException, Request, status
 
+from src.services.train import export_flat_forest, test_train_split_iris, get_processed_iris
+from src.services.model_store import LoadedModel, flat_forest_path, model_holder
+from src.services.lazy import LazyModule
+from src.services.metrics import MODEL_INFERENCE_DURATION, MODEL_INFERENCE_ROWS, timed
 
-def predict_iris() -> list[str]:
-    """ Predict the species of an iris flower
+pd = LazyModule("pandas")
+
+# Requests arriving within this window are scored in a single model call
+PREDICT_BATCH_WINDOW = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5")) / 1000
+PREDICT_MAX_BATCH_ROWS = int(os.getenv("PREDICT_MAX_BATCH_ROWS", "1024"))
+
+# "flat" scores rows with the flat-array evaluator, "sklearn" with the model.
+# The flat evaluator saves the per-call overhead of sklearn, which only
+# matters for small batches: larger ones are scored by the model.
+PREDICT_ENGINE = os.getenv("PREDICT_ENGINE", "flat")
+PREDICT_FLAT_MAX_ROWS = int(os.getenv("PREDICT_FLAT_MAX_ROWS", "256"))
+
+
+def predict_iris(test_size: float = 0.2, random_state: int = 42,
+                 stratify: bool = False) -> list[str]:
+    """ Predict the species of the iris flowers of the test set
 
     Args:
-        iris (pd.DataFrame): The iris flower to predict
+        test_size (float): Proportion of the dataset in the test set
+        random_state (int): Seed of the train/test split
+        stratify (bool): Keep the species proportions in both sets
 
     Returns:
         list[str]: The predicted species
     """
+    iris = get_processed_iris()
     X_train, X_test, y_train, y_test = test_train_split_iris(
-        process_iris_df(get_iris_local()))
-    model = joblib.load(MODEL_DIR / "iris_model.joblib")
+        iris, test_size=test_size, random_state=random_state, stratify=stratify)
+    model = model_holder.get()
     y_pred = model.predict(X_test)
     return y_pred
+
+
+class FlatForest:
+    """ Score rows against a forest flattened by `export_flat_forest`.
+
+        All the trees are walked at once: each step gathers the feature and
+        threshold of the current node of every (row, tree) pair and moves to
+        the left or right child. Like sklearn, the rows are cast to float32
+        before being compared to the thresholds, and the class probabilities
+        are averaged over the trees.
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        # The version of the model artifact the forest was exported from, if recorded
+        self.model_version = str(arrays["model_version"]) if "model_version" in arrays else None
+        if "value" not in arrays:
+            # Quantized forest, see `quantize_flat_forest`
+            value = np.zeros((len(arrays["feature"]), arrays["leaf_value"].shape[1]))
+            value[arrays["leaves"]] = arrays["leaf_value"]
+            arrays = {**arrays, "value": value}
+        self.feature = np.ascontiguousarray(arrays["feature"], dtype=np.intp)
+        self.threshold = np.ascontiguousarray(arrays["threshold"], dtype=np.float64)
+        # children[2 * node] is the left child of a node, children[2 * node + 1]
+        # its right child, so that a step is a single gather
+        self.children = np.stack([arrays["left"], arrays["right"]], axis=1).astype(np.intp).ravel()
+        self.value = np.ascontiguousarray(arrays["value"], dtype=np.float64)
+        self.roots = np.ascontiguousarray(arrays["roots"], dtype=np.intp)
+        self.max_depth = int(arrays["max_depth"])
+        self.classes_ = np.asarray(arrays["classes"], dtype=object)
+        self.feature_names_in_ = np.asarray(arrays["feature_names"], dtype=object)
+
+    @classmethod
+    def from_model(cls, model) -> "FlatForest":
+        """ Flatten a fitted RandomForestClassifier """
+        return cls(export_flat_forest(model))
+
+    @classmethod
+    def load(cls, path) -> "FlatForest":
+        """ Load a forest saved by `save_flat_forest`, quantized or not """
+        with np.load(path) as arrays:
+            return cls(dict(arrays))
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """ Return the index of the leaf reached by each row in each tree """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        values = X.ravel()
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_right = ~(values[row_offsets + self.feature[nodes]] <= self.threshold[nodes])
+            nodes = self.children[2 * nodes + go_right]
+        return nodes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """ Return the class probabilities of each row """
+        return self.value[self.apply(X)].mean(axis=1)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """ Return the predicted class of each row """
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+# The model last flattened, and its flat forest
+_compiled: Optional[tuple[LoadedModel, FlatForest]] = None
+_compile_lock = threading.Lock()
+
+
+def _exported_forest(loaded: LoadedModel) -> Optional[FlatForest]:
+    """ Return the flat forest exported along with the loaded artifact by
+        `save_iris_model`, None if there is none or it is from another version
+    """
+    if loaded.path != model_holder.path:
+        return None
+    try:
+        forest = FlatForest.load(flat_forest_path(loaded.path))
+    except (OSError, ValueError, KeyError):
+        return None
+    return forest if forest.model_version == loaded.version else None
+
+
+def get_flat_forest() -> Optional[FlatForest]:
+    """ Return the flat forest of the current model, or None if the model is
+        not a forest. The export written with the artifact is used when it
+        matches the loaded version, otherwise the model is flattened, once
+        per loaded model.
+    """
+    global _compiled
+    loaded = model_holder.current()
+    if isinstance(loaded.model, FlatForest):
+        return loaded.model
+    compiled = _compiled
+    if compiled is not None and compiled[0] is loaded:
+        return compiled[1]
+    with _compile_lock:
+        if _compiled is None or _compiled[0] is not loaded:
+            forest = None
+            if hasattr(loaded.model, "estimators_"):
+                forest = _exported_forest(loaded) or FlatForest.from_model(loaded.model)
+            _compiled = (loaded, forest)
+        return _compiled[1]
+
+
+class BatchResult:
+    """ Predictions of the rows of one request, and how they were computed """
+
+    def __init__(self, labels: np.ndarray, probabilities: np.ndarray,
+                 classes: np.ndarray, batch_rows: int, batch_requests: int):
+        self.labels = labels
+        self.probabilities = probabilities
+        self.classes = classes
+        self.batch_rows = batch_rows
+        self.batch_requests = batch_requests
+
+
+class MicroBatcher:
+    """ Gather concurrent prediction requests into vectorized model calls.
+
+        The first request of a batch opens a window of `window` seconds. All
+        the requests arriving during this window, up to `max_batch_rows` rows,
+        are concatenated and scored with one `predict_proba` call run in a
+        worker thread, then each request gets back its own slice.
+
+        Each application has its own batcher, see `get_batcher`. The pending
+        requests belong to the event loop they were made in: a batcher used
+        from another loop starts over with an empty batch.
+    """
+
+    def __init__(self, window: float = PREDICT_BATCH_WINDOW,
+                 max_batch_rows: int = PREDICT_MAX_BATCH_ROWS):
+        self.window = window
+        self.max_batch_rows = max_batch_rows
+        self._pending: list[tuple[np.ndarray, asyncio.Future]] = []
+        self._pending_rows = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Batches being scored, referenced until they are done
+        self._tasks: set[asyncio.Task] = set()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_batch_seen = 0
+
+    async def predict(self, rows: np.ndarray) -> BatchResult:
+        """ Score feature rows, batched with the other pending requests """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending, self._pending_rows, self._flush_handle = [], 0, None
+            self._tasks = set()
+        future = loop.create_future()
+        self._pending.append((rows, future))
+        self._pending_rows += len(rows)
+
+        if self._pending_rows >= self.max_batch_rows:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_rows = self._pending, [], 0
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[np.ndarray, asyncio.Future]]) -> None:
+        X = np.concatenate([rows for rows, _ in batch])
+        try:
+            labels, probabilities, classes = await asyncio.to_thread(_score, X)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += len(X)
+            self.max_batch_seen = max(self.max_batch_seen, len(X))
+
+        start = 0
+        for rows, future in batch:
+            stop = start + len(rows)
+            if not future.done():
+                future.set_result(BatchResult(
+                    labels[start:stop], probabilities[start:stop], classes,
+                    batch_rows=len(X), batch_requests=len(batch)))
+            start = stop
+
+    def stats(self) -> dict:
+        """ Return the number of batches and their average size """
+        with self._stats_lock:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch_rows": self.max_batch_rows,
+                "batches": self.batches,
+                "requests": self.requests,
+                "rows": self.rows,
+                "mean_batch_rows": self.rows / self.batches if self.batches else 0,
+                "mean_batch_requests": self.requests / self.batches if self.batches else 0,
+                "max_batch_rows_seen": self.max_batch_seen,
+            }
+
+
+def _score(X: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    use_flat = PREDICT_ENGINE == "flat" and len(X) <= PREDICT_FLAT_MAX_ROWS
+    forest = get_flat_forest() if use_flat else None
+    if forest is not None:
+        with timed(MODEL_INFERENCE_DURATION, engine="flat"):
+            probabilities = forest.predict_proba(X)
+        MODEL_INFERENCE_ROWS.labels(engine="flat").inc(len(X))
+        return forest.classes_[probabilities.argmax(axis=1)], probabilities, forest.classes_
+    model = model_holder.get()
+    features = pd.DataFrame(X, columns=model.feature_names_in_)
+    with timed(MODEL_INFERENCE_DURATION, engine="sklearn"):
+        probabilities = model.predict_proba(features)
+    MODEL_INFERENCE_ROWS.labels(engine="sklearn").inc(len(X))
+    labels = model.classes_[probabilities.argmax(axis=1)]
+    return labels, probabilities, model.classes_
+
+
+def get_feature_names() -> list[str]:
+    """ Return the names of the features expected by the model, in order """
+    return list(model_holder.get().feature_names_in_)
+
+
+async def predict_rows(rows: list[list[float]], batcher: MicroBatcher) -> dict:
+    """ Predict the species of iris flowers given as feature rows
+
+    Args:
+        rows (list[list[float]]): Feature rows, in the order of the model features
+        batcher (MicroBatcher): Batcher of the application, see `get_batcher`
+
+    Raises:
+        HTTPException: The rows do not have the expected number of features
+
+    Returns:
+        dict: The predicted species and class probabilities, with the size of
+            the batch the rows were scored in and the request latency
+    """
+    start = time.perf_counter()
+    features = await asyncio.to_thread(get_feature_names)
+    X = np.asarray(rows, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(features):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Each row must have {len(features)} values: {', '.join(features)}")
+
+    result = await batcher.predict(X)
+    return {
+        "predicted_labels": result.labels.tolist(),
+        "probabilities": result.probabilities.round(6).tolist(),
+        "classes": result.classes.tolist(),
+        "batch_rows": result.batch_rows,
+        "batch_requests": result.batch_requests,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def get_batcher(request: Request) -> MicroBatcher:
+    """ Micro-batcher of the application serving the request """
+    return request.app.state.batcher
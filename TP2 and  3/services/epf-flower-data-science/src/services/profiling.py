@@ -0,0 +1,224 @@
+""" Profiling of single requests, on demand of an admin.
+
+    A request sent with the header `X-Profile: 1` or the query parameter
+    `profile=1`, and the token of an admin, runs under cProfile. The profile
+    is written to PROFILE_DIR, where only the last PROFILE_MAX_FILES are
+    kept, and its id is returned in the X-Profile-Id header of the response:
+    GET /profiles lists the profiles and GET /profiles/{profile_id} downloads
+    one, to open with `python -m pstats` or snakeviz.
+
+    cProfile records the thread of the event loop: the work that a route
+    hands to a thread pool shows as the time spent awaiting it. Other
+    requests served while the profile is recorded show in it too, so a
+    single request is profiled at a time per worker.
+
+    The requests without the switch go straight through, and none of this
+    is installed when PROFILING_ENABLED is false.
+"""
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException, status
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() not in {"0", "false", "no"}
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", os.path.join(
+    tempfile.gettempdir(), "epf-flower-data-science-profiles")))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "20"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY = "profile"
+
+# <UTC time>-<random suffix>, so that the names sort by age across workers
+PROFILE_ID_PATTERN = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{8}$")
+
+
+def _is_on(value: str) -> bool:
+    return value.strip().lower() not in {"", "0", "false", "no", "off"}
+
+
+def profiling_requested(scope: Scope) -> bool:
+    """ Whether a request asks to be profiled, by header or query parameter """
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return _is_on(value.decode("latin-1"))
+    query_string = scope.get("query_string", b"")
+    if PROFILE_QUERY.encode() not in query_string:
+        return False
+    values = parse_qs(query_string.decode("latin-1"), keep_blank_values=True).get(PROFILE_QUERY)
+    return bool(values) and _is_on(values[-1] or "1")
+
+
+class ProfileStore:
+    """ Profiles on disk, the oldest dropped past `max_files`.
+
+    Each profile is a pstats file, <id>.prof, with the request it recorded
+    in <id>.json. The directory can be shared by the workers of a host.
+
+    Args:
+        directory (Path): Where the profiles are written
+        max_files (int): Number of profiles kept
+    """
+
+    def __init__(self, directory: Path = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now % 1 * 1e6):06d}"
+        return f"{stamp}-{uuid.uuid4().hex[:8]}"
+
+    def save(self, profile_id: str, profiler: cProfile.Profile, info: dict) -> dict:
+        """ Write a profile and drop the oldest ones past max_files.
+
+        Args:
+            profile_id (str): Id given by new_id
+            profiler (cProfile.Profile): The stopped profiler
+            info (dict): The request that was profiled: method, path, status...
+
+        Returns:
+            dict: The metadata of the profile
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.directory / f"{profile_id}.prof")
+        metadata = {"id": profile_id, **info,
+                    "size": (self.directory / f"{profile_id}.prof").stat().st_size}
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(metadata))
+        with self._lock:
+            ids = self._ids()
+            for old in ids[:max(len(ids) - self.max_files, 0)]:
+                for suffix in (".prof", ".json"):
+                    (self.directory / f"{old}{suffix}").unlink(missing_ok=True)
+        return metadata
+
+    def _ids(self) -> list[str]:
+        if not self.directory.is_dir():
+            return []
+        return sorted(path.stem for path in self.directory.glob("*.prof")
+                      if PROFILE_ID_PATTERN.match(path.stem))
+
+    def list(self) -> list[dict]:
+        """ Return the metadata of the profiles, the latest first """
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                profiles.append(json.loads((self.directory / f"{profile_id}.json").read_text()))
+            except (OSError, ValueError):
+                # Dropped, or still being written, by another worker
+                continue
+        return profiles
+
+    def path(self, profile_id: str) -> Path:
+        """ Return the pstats file of a profile.
+
+        Raises:
+            HTTPException: The profile was not found
+        """
+        path = self.directory / f"{profile_id}.prof"
+        if not PROFILE_ID_PATTERN.match(profile_id) or not path.is_file():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Profile {profile_id} not found")
+        return path
+
+    def report(self, profile_id: str, sort: str = "cumulative", limit: int = 50) -> str:
+        """ Return the functions of a profile that took the longest, as text
+
+        Raises:
+            HTTPException: The profile was not found
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(str(self.path(profile_id)), stream=stream)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+class ProfilingMiddleware:
+    """ Run the requests that ask for it under cProfile, for admins only.
+
+    Args:
+        app (ASGIApp): The application
+        store (ProfileStore): Where the profiles are written
+        authorize (Callable): Called with the bearer token of the request,
+            raises HTTPException when it may not be profiled
+    """
+
+    def __init__(self, app: ASGIApp, store: ProfileStore, authorize: Callable[[str], object]):
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+        self._busy = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        error = await self._check(scope)
+        if error is not None:
+            await error(scope, receive, send)
+            return
+
+        profile_id = self.store.new_id()
+        status_code = 500
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []),
+                                      (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self._busy = True
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            self._busy = False
+            await asyncio.to_thread(self.store.save, profile_id, profiler, {
+                "method": scope["method"], "path": scope["path"], "status": status_code,
+                "seconds": seconds, "created": time.time()})
+
+    async def _check(self, scope: Scope) -> Optional[JSONResponse]:
+        """ Return the error response of a request that may not be profiled """
+        authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED,
+                                content={"detail": "Not authenticated"},
+                                headers={"WWW-Authenticate": "Bearer"})
+        try:
+            await asyncio.to_thread(self.authorize, token)
+        except HTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+        if self._busy:
+            return JSONResponse(status_code=status.HTTP_409_CONFLICT,
+                                content={"detail": "Another request is being profiled"})
+        return None
+
+
+def get_profile_store(request: Request) -> ProfileStore:
+    """ Profile store of the application serving the request """
+    return request.app.state.profile_store
@@ -0,0 +1,325 @@
+""" Rate limiting of the API, shared by the workers of a deployment.
+
+    Each route has a limit, e.g. "5/minute", counted per client address with
+    a sliding window counter: the count of the current window plus the count
+    of the previous one, weighted by how much of it is still in the sliding
+    window. Each request reads and writes a single record, whatever the limit.
+
+    The counters live in a storage given by RATE_LIMIT_STORAGE_URI:
+    - memory:// keeps them in the process, for a single worker
+    - sqlite:///path/to/file.db keeps them in a SQLite file shared by all the
+      workers of the host, so that N workers still allow "5/minute" and not
+      N times that. gunicorn.conf.py uses one by default.
+
+    The SQLite transactions may wait for the other workers, so they run in a
+    thread rather than on the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional, Sequence
+from urllib.parse import urlparse
+
+from limits import parse
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.services.metrics import RATE_LIMIT_REJECTIONS, UNMATCHED_ROUTE, route_template
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in {"0", "false", "no"}
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "5/minute")
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+# Limits of single routes, by path template or by "METHOD path template",
+# e.g. '{"POST /iris/predict": "100/second", "/docs": "none"}'. The scrapes of
+# the metrics are not limited unless RATE_LIMITS says otherwise.
+RATE_LIMITS: dict[str, str] = {"GET /metrics": "none", **json.loads(os.getenv("RATE_LIMITS", "{}"))}
+
+# Counters of the windows that ended are dropped every this many requests
+PRUNE_INTERVAL = 1000
+SQLITE_BUSY_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def _slide(window: int, previous: int, current: int, now: float, period: int) -> tuple[int, int, int]:
+    """ Move the counters of `window` to the window of `now` """
+    index = int(now // period)
+    if window == index:
+        return index, previous, current
+    if window == index - 1:
+        return index, current, 0
+    return index, 0, 0
+
+
+def sliding_window_hit(state: Optional[tuple[int, int, int]], limit: int, period: int,
+                       now: float) -> tuple[tuple[int, int, int], bool, int, float]:
+    """ Count a request in a sliding window counter.
+
+    Args:
+        state (tuple, optional): Window index, previous and current counts,
+            None for a new counter
+        limit (int): Requests allowed per period
+        period (int): Length of the window, in seconds
+        now (float): Time of the request
+
+    Returns:
+        tuple: The new state, whether the request is allowed, the requests
+            remaining and the seconds to wait before the next one is allowed
+    """
+    window, previous, current = _slide(*(state or (0, 0, 0)), now, period)
+    elapsed = (now % period) / period
+    weighted = previous * (1 - elapsed) + current
+    if weighted + 1 <= limit:
+        current += 1
+        return (window, previous, current), True, int(limit - weighted - 1), 0.0
+    if current + 1 > limit or previous == 0:
+        retry_after = period - now % period
+    else:
+        # Wait for the previous window to weigh less than one free request
+        retry_after = ((1 - (limit - current - 1) / previous) - elapsed) * period
+    return (window, previous, current), False, 0, max(retry_after, 0.0)
+
+
+class MemoryStorage:
+    """ Counters of a single process """
+
+    scheme = "memory"
+    blocking = False
+
+    def __init__(self):
+        self._counters: dict[str, tuple[int, int, int, float]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key: str, limit: int, period: int) -> tuple[bool, int, float]:
+        now = time.time()
+        with self._lock:
+            self._hits += 1
+            if self._hits % PRUNE_INTERVAL == 0:
+                self._counters = {k: v for k, v in self._counters.items() if v[3] > now}
+            state = self._counters.get(key)
+            state, allowed, remaining, retry_after = sliding_window_hit(
+                state and state[:3], limit, period, now)
+            self._counters[key] = (*state, (state[0] + 2) * period)
+        return allowed, remaining, retry_after
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+class SQLiteStorage:
+    """ Counters in a SQLite file, shared by the processes of the host.
+
+        A request runs one immediate transaction on one row, which SQLite
+        serializes between the processes. Each thread of each process opens
+        its own connection.
+    """
+
+    scheme = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    window INTEGER NOT NULL,
+                    previous INTEGER NOT NULL,
+                    current INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are not shared with the processes forked by gunicorn
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def hit(self, key: str, limit: int, period: int) -> tuple[bool, int, float]:
+        connection = self._connect()
+        now = time.time()
+        self._hits += 1
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self._hits % PRUNE_INTERVAL == 0:
+                connection.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+            row = connection.execute(
+                "SELECT window, previous, current FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            state, allowed, remaining, retry_after = sliding_window_hit(row, limit, period, now)
+            if state != row:
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)",
+                    (key, *state, (state[0] + 2) * period))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, remaining, retry_after
+
+    def reset(self) -> None:
+        self._connect().execute("DELETE FROM rate_limits")
+
+
+def server_workers(argv: Optional[Sequence[str]] = None) -> int:
+    """ Number of worker processes the server was started with: the -w or
+        --workers option of gunicorn and uvicorn, whose workers keep the
+        command line of the master, or WEB_CONCURRENCY
+    """
+    argv = list(sys.argv if argv is None else argv)
+    for i, arg in enumerate(argv):
+        value = None
+        if arg in ("-w", "--workers") and i + 1 < len(argv):
+            value = argv[i + 1]
+        elif arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+        elif arg.startswith("-w") and arg[2:].isdigit():
+            value = arg[2:]
+        if value is not None and value.isdigit():
+            return int(value)
+    value = os.getenv("WEB_CONCURRENCY", "")
+    return int(value) if value.isdigit() else 1
+
+
+def storage_from_uri(uri: str):
+    """ Build the storage of the counters from RATE_LIMIT_STORAGE_URI
+
+    Raises:
+        ValueError: Unknown storage
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme == MemoryStorage.scheme:
+        return MemoryStorage()
+    if parsed.scheme == SQLiteStorage.scheme:
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return SQLiteStorage(parsed.path[1:] if parsed.path.startswith("/") else parsed.path)
+    raise ValueError(f"Unknown rate limit storage: {uri}")
+
+
+class RateLimiter:
+    """ Limits of the routes of an application, with their counters.
+
+    Args:
+        storage_uri (str): Where the counters are kept, see storage_from_uri
+        default (str): Limit of the routes without their own, e.g. "5/minute"
+        limits (dict): Limits by path template or by "METHOD path template",
+            "none" for no limit
+        enabled (bool): Let every request through when False
+    """
+
+    def __init__(self, storage_uri: str = RATE_LIMIT_STORAGE_URI,
+                 default: str = RATE_LIMIT_DEFAULT,
+                 limits: Optional[dict[str, str]] = None,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.storage = storage_from_uri(storage_uri)
+        self.default = default
+        self.limits = dict(RATE_LIMITS if limits is None else limits)
+        self.enabled = enabled
+        self._parsed = {}
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if self.enabled and self.storage.scheme == MemoryStorage.scheme and server_workers() > 1:
+            logger.warning(
+                "Rate limits are counted in memory by each of the %d workers, which together "
+                "allow %d times the limits: set RATE_LIMIT_STORAGE_URI=sqlite:///<file> to share "
+                "the counters", server_workers(), server_workers())
+
+    def limit_for(self, method: str, path: str) -> Optional[str]:
+        """ Limit of a route, None when it has none """
+        limit = self.limits.get(f"{method} {path}", self.limits.get(path, self.default))
+        return None if not limit or limit.lower() == "none" else limit
+
+    def _parse(self, limit: str):
+        if limit not in self._parsed:
+            self._parsed[limit] = parse(limit)
+        return self._parsed[limit]
+
+    def hit(self, method: str, path: str, client: str) -> tuple[bool, Optional[str], int, float]:
+        """ Count a request of `client` to a route.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path template of the route
+            client (str): Address of the client
+
+        Returns:
+            tuple: Whether the request is allowed, the limit of the route,
+                the requests remaining and the seconds before a retry
+        """
+        limit = self.limit_for(method, path) if self.enabled else None
+        if limit is None:
+            return True, None, 0, 0.0
+        item = self._parse(limit)
+        allowed, remaining, retry_after = self.storage.hit(
+            f"{method} {path}:{client}", item.amount, item.get_expiry())
+        route = f"{method} {path}"
+        with self._lock:
+            counters = self._stats.setdefault(route, {"limit": limit, "allowed": 0, "rejected": 0})
+            counters["allowed" if allowed else "rejected"] += 1
+        return allowed, limit, remaining, retry_after
+
+    def reset(self) -> None:
+        """ Clear the counters of the storage """
+        self.storage.reset()
+
+    def stats(self) -> dict:
+        """ Requests allowed and rejected by route since the process started """
+        with self._lock:
+            routes = {route: dict(counters) for route, counters in self._stats.items()}
+        return {
+            "enabled": self.enabled,
+            "storage": self.storage.scheme,
+            "default": self.default,
+            "allowed": sum(counters["allowed"] for counters in routes.values()),
+            "rejected": sum(counters["rejected"] for counters in routes.values()),
+            "routes": routes,
+        }
+
+
+class RateLimitMiddleware:
+    """ Answer 429 Too Many Requests to the clients over the limit of a route """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        client = scope["client"][0] if scope.get("client") else "127.0.0.1"
+        route = route_template(scope)
+        path = route or scope["path"]
+        if self.limiter.storage.blocking:
+            allowed, limit, _, retry_after = await asyncio.to_thread(
+                self.limiter.hit, scope["method"], path, client)
+        else:
+            allowed, limit, _, retry_after = self.limiter.hit(scope["method"], path, client)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+        RATE_LIMIT_REJECTIONS.labels(method=scope["method"], route=route or UNMATCHED_ROUTE).inc()
+        response = JSONResponse(
+            status_code=429,
+            content={"error": f"Rate limit exceeded: {limit}"},
+            headers={"Retry-After": str(max(1, round(retry_after)))})
+        await response(scope, receive, send)
+
+
+def get_rate_limiter(request: Request) -> RateLimiter:
+    """ Rate limiter of the application serving the request """
+    return request.app.state.rate_limiter
@@ -0,0 +1,140 @@
+import contextlib
+import copy
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock is available
+    fcntl = None
+
+T = TypeVar("T")
+
+# Maximum time during which a worker serves its in-memory catalogue without
+# checking whether another worker changed the file
+REGISTRY_REFRESH_INTERVAL = 1.0
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: Path):
+    """ Hold an exclusive inter-process lock on a lock file """
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class DatasetRegistry:
+    """ In-memory catalogue of the datasets stored in a JSON file.
+
+        Reads are served from memory. The file's version stamp (inode, mtime
+        and size) is checked at most every REGISTRY_REFRESH_INTERVAL seconds to
+        pick up changes made by other workers. Writes re-read the file and
+        replace it atomically while holding an inter-process lock, so that
+        concurrent updates from several workers are never lost.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self._lock = threading.RLock()
+        self._datasets = None
+        self._stamp = None
+        self._checked_at = 0.0
+
+    def _file_stamp(self) -> tuple:
+        stat = os.stat(self.path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self) -> None:
+        stamp = self._file_stamp()
+        with open(self.path) as file:
+            self._datasets = json.load(file)
+        self._stamp = stamp
+        self._checked_at = time.monotonic()
+
+    def _refresh(self) -> None:
+        if self._datasets is None:
+            self._load()
+        elif time.monotonic() - self._checked_at > REGISTRY_REFRESH_INTERVAL:
+            if self._file_stamp() != self._stamp:
+                self._load()
+            self._checked_at = time.monotonic()
+
+    def _dump(self, datasets: dict) -> None:
+        try:
+            mode = stat.S_IMODE(os.stat(self.path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name + ".")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(datasets, file, indent=4)
+                file.flush()
+                # mkstemp creates the file readable by its owner only
+                os.fchmod(file.fileno(), mode)
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+            raise
+
+    def get_all(self) -> dict:
+        """ Return a copy of the catalogue """
+        with self._lock:
+            self._refresh()
+            return copy.deepcopy(self._datasets)
+
+    def get(self, dataset_id: str) -> dict:
+        """ Return a copy of one entry of the catalogue
+
+        Raises:
+            KeyError: The dataset is not in the catalogue
+        """
+        with self._lock:
+            self._refresh()
+            return dict(self._datasets[dataset_id])
+
+    def update(self, mutate: Callable[[dict], T]) -> T:
+        """ Apply a change to the catalogue and persist it.
+
+        Args:
+            mutate (Callable): Function changing the catalogue in place. It
+                receives the latest content of the file.
+
+        Returns:
+            The value returned by `mutate`
+        """
+        with self._lock, file_lock(self.lock_path):
+            self._load()
+            datasets = copy.deepcopy(self._datasets)
+            result = mutate(datasets)
+            self._dump(datasets)
+            self._datasets = datasets
+            self._stamp = self._file_stamp()
+            return result
+
+
+_registries: dict[Path, DatasetRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path: Path) -> DatasetRegistry:
+    """ Return the process-wide registry of a configuration file """
+    path = Path(path)
+    with _registries_lock:
+        if path not in _registries:
+            _registries[path] = DatasetRegistry(path)
+        return _registries[path]
@@ -0,0 +1,173 @@
+""" Production serving with gunicorn, see gunicorn.conf.py.
+
+    The application is imported once in the gunicorn master, which also
+    loads the dataset and the model before forking its workers: the workers
+    share those memory pages copy-on-write instead of holding a copy each.
+    The loaded objects are then moved out of the reach of the garbage
+    collector, whose bookkeeping would otherwise write to the shared pages
+    and copy them into every worker.
+
+    When a new model artifact is written, a thread of the master sends it a
+    HUP. The master loads the model while it handles the HUP in its main
+    loop, where no worker is being forked, then replaces its workers
+    gracefully: new workers are forked with the new model while the old
+    ones finish their requests. Replacing a worker would cancel the
+    training jobs it queued and stop those it runs, so the replacement waits
+    for the jobs of all the workers to finish.
+"""
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from src.services.jobs import active_jobs
+from src.services.model_store import ModelHolder, file_stamp, model_holder
+
+# Time between two checks of the model artifact by the gunicorn master
+ARTIFACT_WATCH_INTERVAL = float(os.getenv("ARTIFACT_WATCH_INTERVAL", "2"))
+# Longest wait for the training jobs before the workers are replaced anyway,
+# e.g. when the record of a job killed with its worker says it still runs
+ARTIFACT_RELOAD_MAX_DEFER = float(os.getenv("ARTIFACT_RELOAD_MAX_DEFER", "900"))
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    """ Return the number of workers: WEB_CONCURRENCY if set, else one per
+        CPU available to the process. Predictions are CPU-bound, so more
+        workers than CPUs only add memory.
+    """
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def preload() -> None:
+    """ Load what the workers share, then freeze it for the garbage collector.
+        Called in the gunicorn master before the workers are forked.
+    """
+    from src.services.data import get_processed_iris
+    from src.services.predict import get_flat_forest
+
+    gc.unfreeze()
+    for name, load in (("model", model_holder.current), ("flat forest", get_flat_forest),
+                       ("dataset", get_processed_iris)):
+        try:
+            load()
+        except Exception as e:
+            logger.warning("Could not preload the %s: %s", name, e)
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded the model and the dataset, %d objects frozen", gc.get_freeze_count())
+
+
+class ArtifactWatcher:
+    """ Watch the artifact of the model in a thread and call `on_change` when
+        it changes, e.g. to send a HUP to the gunicorn master. The thread
+        only requests the reload: the model is loaded by `apply`, from the
+        thread that forks the workers, so that no worker is forked while the
+        model is half loaded or the garbage collector half frozen.
+
+    Args:
+        on_change (Callable): Called when a reload is requested
+        holder (ModelHolder): Holder of the model to watch
+        interval (float): Seconds between two checks
+        busy (Callable): Whether jobs are in progress, which defers the
+            reload; the training jobs of all the workers by default
+        max_defer (float): Seconds after which the reload is no longer deferred
+    """
+
+    def __init__(self, on_change: Callable[[], None], holder: ModelHolder = model_holder,
+                 interval: float = ARTIFACT_WATCH_INTERVAL,
+                 busy: Callable[[], bool] = lambda: bool(active_jobs()),
+                 max_defer: float = ARTIFACT_RELOAD_MAX_DEFER):
+        self.on_change = on_change
+        self.holder = holder
+        self.interval = interval
+        self.busy = busy
+        self.max_defer = max_defer
+        self.reloads = 0
+        self._deferred_since: Optional[float] = None
+        self._pending = threading.Event()
+        # Stamp of an artifact that could not be loaded, not requested again
+        self._failed_stamp: Optional[tuple] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """ Request a reload of the model if its artifact changed.
+
+        Returns:
+            bool: Whether a reload was requested
+        """
+        if self._pending.is_set() or not self.holder.is_stale():
+            return False
+        if self._failed_stamp is not None and self._artifact_stamp() == self._failed_stamp:
+            return False
+        if self.busy():
+            now = time.monotonic()
+            if self._deferred_since is None:
+                self._deferred_since = now
+                logger.info("New model artifact, reload deferred until the training jobs finish")
+            if now - self._deferred_since < self.max_defer:
+                return False
+            logger.warning("Training jobs still in progress after %.0fs, reloading anyway",
+                           now - self._deferred_since)
+        self._deferred_since = None
+        self._pending.set()
+        self.on_change()
+        return True
+
+    def apply(self) -> bool:
+        """ Load the model whose reload was requested, and freeze it for the
+            garbage collector. Called by the gunicorn master in its main loop
+            when it handles the HUP, before it forks the new workers.
+
+        Returns:
+            bool: Whether the model was reloaded
+        """
+        if not self._pending.is_set():
+            return False
+        try:
+            loaded = self.holder.reload()
+            if self.holder is model_holder:
+                preload()
+        except Exception as e:
+            logger.warning("Could not reload the model: %s", e)
+            self._failed_stamp = self._artifact_stamp()
+            return False
+        finally:
+            self._pending.clear()
+        self._failed_stamp = None
+        self.reloads += 1
+        logger.info("New model artifact %s version %s", loaded.path, loaded.version)
+        return True
+
+    def _artifact_stamp(self) -> Optional[tuple]:
+        try:
+            return file_stamp(self.holder.served_path())
+        except FileNotFoundError:
+            return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning("Could not check the model artifact: %s", e)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="artifact-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
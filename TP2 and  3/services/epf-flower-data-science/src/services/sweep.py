@@ -0,0 +1,221 @@
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+from pydantic import ValidationError
+
+from src.schemas.parameters import Parameters, SweepRange
+from src.services.data import get_processed_iris, test_train_split_iris
+from src.services.model_store import MODEL_DIR
+from src.services.train import load_model_config, row_positions, save_iris_model, training_metadata
+
+LEADERBOARD_PATH = MODEL_DIR / "sweep_leaderboard.json"
+SWEEP_MAX_WORKERS = int(os.getenv("SWEEP_MAX_WORKERS", "0")) or os.cpu_count()
+
+# Read-only training data of a sweep worker, sent once when the worker starts
+_worker_data: Optional[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+
+
+def expand_space(space: dict, max_candidates: int, random_state: int) -> list[dict]:
+    """ Expand a search space into the list of candidate parameters.
+
+    Args:
+        space (dict): Candidate values of each parameter, as a list or a range
+        max_candidates (int): Maximum number of candidates, sampled from the
+            grid if it is larger
+        random_state (int): Seed of the sampling
+
+    Raises:
+        ValueError: A candidate is not valid for the `Parameters` schema
+
+    Returns:
+        list[dict]: The candidates
+    """
+    names = list(space)
+    # Ranges are indexed without listing their values, and the grid is never
+    # built: only the indices of the candidates kept are drawn
+    values = [spec if isinstance(spec, SweepRange) else list(spec) for spec in space.values()]
+    shape = tuple(len(spec) for spec in values)
+    grid_size = math.prod(shape)
+    if grid_size > max_candidates:
+        indices = random.Random(random_state).sample(range(grid_size), max_candidates)
+    else:
+        indices = range(grid_size)
+    positions = np.unravel_index(np.asarray(indices, dtype=np.int64), shape) if shape else []
+    grid = [{name: spec[position[i]] for name, spec, position in zip(names, values, positions)}
+            for i in range(len(indices))]
+
+    candidates = []
+    for candidate in grid:
+        try:
+            candidates.append(Parameters(**candidate).to_dict())
+        except ValidationError as e:
+            raise ValueError(f"Invalid candidate {candidate}: {e}")
+    # Enum members are not JSON serializable in worker results
+    return [{name: getattr(value, "value", value) for name, value in candidate.items()}
+            for candidate in candidates]
+
+
+def _init_worker(X_fit: np.ndarray, y_fit: np.ndarray, X_val: np.ndarray, y_val: np.ndarray) -> None:
+    global _worker_data
+    _worker_data = (X_fit, y_fit, X_val, y_val)
+
+
+def _evaluate(params: dict, rows: int, random_state: int) -> tuple[Optional[float], Optional[str]]:
+    """ Fit a candidate on the first `rows` training rows and score it on the
+        validation set. Runs in a sweep worker.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score
+
+    X_fit, y_fit, X_val, y_val = _worker_data
+    try:
+        model = RandomForestClassifier(**params, random_state=random_state, n_jobs=1)
+        model.fit(X_fit[:rows], y_fit[:rows])
+        return accuracy_score(y_val, model.predict(X_val)), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def halving_rounds(n_candidates: int, eta: int) -> int:
+    """ Number of rounds after the first one to keep a single candidate out of
+        `n_candidates`, counted in integers: math.log(125, 5) is above 3
+    """
+    rounds, survivors = 0, 1
+    while survivors < n_candidates:
+        survivors *= eta
+        rounds += 1
+    return rounds
+
+
+def successive_halving(candidates: list[dict], X_fit: np.ndarray, y_fit: np.ndarray,
+                       X_val: np.ndarray, y_val: np.ndarray, eta: int, min_rows: int,
+                       random_state: int, max_workers: int = SWEEP_MAX_WORKERS) -> list[dict]:
+    """ Evaluate candidates with successive halving.
+
+        All the candidates are first trained on a small share of the training
+        rows. Only the best 1/eta of them go to the next round, which uses eta
+        times more rows, until one candidate is trained on all the rows.
+        Candidates of a round are evaluated in parallel in a process pool; the
+        data is sent once to each worker.
+
+    Returns:
+        list[dict]: The leaderboard, one entry per candidate with the score of
+            the last round it reached, best first
+    """
+    n_rounds = halving_rounds(len(candidates), eta)
+    results = {i: {"params": params, "round": 0, "rows": 0, "score": None, "error": None}
+               for i, params in enumerate(candidates)}
+    alive = list(results)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(X_fit, y_fit, X_val, y_val)) as executor:
+        round_number = 0
+        while True:
+            rows = min(len(X_fit), max(min_rows, int(len(X_fit) / eta ** (n_rounds - round_number))))
+            scores = executor.map(_evaluate, [results[i]["params"] for i in alive],
+                                  itertools.repeat(rows), itertools.repeat(random_state))
+            for i, (score, error) in zip(alive, scores):
+                results[i].update(round=round_number, rows=rows, score=score, error=error)
+            if round_number >= n_rounds:
+                break
+
+            alive = [i for i in alive if results[i]["score"] is not None]
+            alive.sort(key=lambda i: results[i]["score"], reverse=True)
+            alive = alive[:math.ceil(len(alive) / eta)]
+            if not alive:
+                break
+            # A single survivor goes straight to the last round, on all the rows
+            round_number = n_rounds if len(alive) == 1 else round_number + 1
+
+    return sorted(results.values(), key=lambda entry: (
+        entry["round"], -1 if entry["score"] is None else entry["score"]), reverse=True)
+
+
+def run_sweep(space: dict, max_candidates: int = 81, eta: int = 3, min_rows: int = 20,
+              test_size: float = 0.2, random_state: int = 42, promote: bool = True) -> dict:
+    """ Run a hyperparameter sweep on the iris dataset.
+
+        The leaderboard is saved next to the model. If `promote` is set, the
+        best candidate is trained on the whole training set and replaces the
+        serving model.
+
+    Args:
+        space (dict): Candidate values of each field of `Parameters`
+        max_candidates (int): Maximum number of candidates
+        eta (int): Halving factor of the successive halving rounds
+        min_rows (int): Number of training rows of the first round
+        test_size (float): Proportion of the dataset in the test set
+        random_state (int): Seed of the split, sampling and models
+        promote (bool): Replace the serving model with the best candidate
+
+    Returns:
+        dict: The best parameters, their test accuracy, the leaderboard path
+            and the model path if the model was promoted
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score
+
+    space = {name: SweepRange(**spec) if isinstance(spec, dict) else spec
+             for name, spec in space.items()}
+    base_config = load_model_config()
+    candidates = [{**base_config, **candidate}
+                  for candidate in expand_space(space, max_candidates, random_state)]
+
+    iris = get_processed_iris()
+    X_train, X_test, y_train, y_test = test_train_split_iris(
+        iris, test_size=test_size, random_state=random_state)
+    # Hold out part of the training set to compare the candidates, the test
+    # set is only used to report the accuracy of the best one
+    rng = np.random.default_rng(random_state)
+    order = rng.permutation(len(X_train))
+    n_val = max(1, int(len(order) * test_size))
+    X = X_train.to_numpy(dtype=np.float64)
+    y = np.asarray(y_train, dtype=object)
+    X_val, y_val = X[order[:n_val]], y[order[:n_val]]
+    X_fit, y_fit = X[order[n_val:]], y[order[n_val:]]
+
+    start = time.perf_counter()
+    leaderboard = successive_halving(candidates, X_fit, y_fit, X_val, y_val,
+                                     eta=eta, min_rows=min_rows, random_state=random_state)
+    sweep_seconds = time.perf_counter() - start
+
+    best = leaderboard[0]
+    if best["score"] is None:
+        raise ValueError(f"No candidate could be trained: {best['error']}")
+
+    model = RandomForestClassifier(**best["params"], random_state=random_state)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    test_accuracy = accuracy_score(y_test, model.predict(X_test))
+
+    LEADERBOARD_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(LEADERBOARD_PATH, "w") as file:
+        json.dump({"candidates": len(candidates), "sweep_seconds": sweep_seconds,
+                   "test_accuracy": test_accuracy, "leaderboard": leaderboard},
+                  file, indent=4)
+
+    result = {
+        "best_params": best["params"],
+        "validation_accuracy": best["score"],
+        "test_accuracy": test_accuracy,
+        "candidates": len(candidates),
+        "sweep_seconds": sweep_seconds,
+        "leaderboard_path": str(LEADERBOARD_PATH),
+        "model_path": None,
+    }
+    if promote:
+        metadata = training_metadata(iris, model, "sweep", len(X_train), fit_seconds,
+                                     test_rows=row_positions(iris, X_test))
+        result["model_path"] = save_iris_model(model, metadata, X_test, y_test)
+    return result
@@ -1,14 +1,45 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
 from pathlib import Path
-from sklearn.ensemble import RandomForestClassifier
-from src.services.data import test_train_split_iris, get_iris_local
-from src.services.cleaning import process_iris_df
+from typing import TYPE_CHECKING, Optional
+import hashlib
+import importlib.util
+import math
 import os
-import json
 import joblib
+import numpy as np
+from src.services.data import feature_columns, test_train_split_iris, get_processed_iris
+from src.services.model_store import (
+    ARTIFACT_SUFFIXES, artifact_path, artifact_version, file_stamp, flat_forest_path,
+    load_artifact, manifest_path, model_holder, read_model_metadata, save_model)
+from src.services.lazy import LazyModule
+import json
+import time
+
+if TYPE_CHECKING:
+    # Imported by the functions that train or score, sklearn is slow to import
+    from sklearn.ensemble import RandomForestClassifier
+
+pd = LazyModule("pandas")
 
-MODEL_DIR = Path(__file__).parent.parent / "models"
 CONFIG_DIR = Path(__file__).parent.parent / "config"
 
+# Number of already trained rows mixed with the new rows of an incremental
+# training, so that the new trees do not only see the latest rows
+INCREMENTAL_HISTORY_ROWS = int(os.getenv("INCREMENTAL_HISTORY_ROWS", "1000"))
+
+# The forest is refitted from scratch once incremental trainings made it this
+# many times larger than a full training
+INCREMENTAL_MAX_GROWTH = int(os.getenv("INCREMENTAL_MAX_GROWTH", "4"))
+
+# Number of lineage entries kept in the model metadata
+LINEAGE_MAX_ENTRIES = 100
+
+# Artifact variants written after each training, see ARTIFACT_SUFFIXES
+MODEL_ARTIFACT_MODES = [mode.strip() for mode in os.getenv(
+    "MODEL_ARTIFACT_MODES", ",".join(ARTIFACT_SUFFIXES)).split(",") if mode.strip()]
+
 
 def load_model_config():
     """ Load the model configuration file """
@@ -16,18 +47,424 @@ def load_model_config():
         return json.load(file)
 
 
-def train_and_save_iris() -> str:
-    """ Train the iris dataset and save the model 
+def train_and_evaluate_iris(test_size: float = 0.2, random_state: int = 42,
+                            stratify: bool = False, reload_model: bool = True) -> dict:
+    """ Train the iris dataset, save the model and evaluate it on the test set
+
+    Args:
+        test_size (float): Proportion of the dataset kept out of the training set
+        random_state (int): Seed of the train/test split
+        stratify (bool): Keep the species proportions in both sets
+        reload_model (bool): Swap the new model in the model holder of this
+            process. Background jobs leave this to the process serving requests.
 
     Returns:
-        str: The path to the saved model+
+        dict: The path to the saved model and its metrics
     """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score
+
     config = load_model_config()
-    X_train, _, y_train, _ = test_train_split_iris(
-        process_iris_df(get_iris_local()))
+    iris = get_processed_iris()
+    X_train, X_test, y_train, y_test = test_train_split_iris(
+        iris, test_size=test_size, random_state=random_state, stratify=stratify)
     model = RandomForestClassifier(**config)
+    start = time.perf_counter()
     model.fit(X_train, y_train)
-    model_path = os.path.join(
-        MODEL_DIR, 'iris_model.joblib')
-    joblib.dump(model, model_path)
+    fit_seconds = time.perf_counter() - start
+
+    # The artifact is replaced atomically, then swapped in the model holder
+    # so that the next predictions use the new model
+    metadata = training_metadata(iris, model, "full", len(X_train), fit_seconds,
+                                 test_rows=row_positions(iris, X_test))
+    model_path = save_iris_model(model, metadata, X_test, y_test)
+    if reload_model:
+        model_holder.reload()
+    return {
+        "model_path": model_path,
+        "mode": "full",
+        "metrics": {
+            "accuracy": accuracy_score(y_test, model.predict(X_test)) if len(X_test) else None,
+            "train_rows": len(X_train),
+            "test_rows": len(X_test),
+            "fit_seconds": fit_seconds,
+        },
+    }
+
+
+def train_and_save_iris(test_size: float = 0.2, random_state: int = 42,
+                        stratify: bool = False) -> str:
+    """ Train the iris dataset and save the model
+
+    Args:
+        test_size (float): Proportion of the dataset kept out of the training set
+        random_state (int): Seed of the train/test split
+        stratify (bool): Keep the species proportions in both sets
+
+    Returns:
+        str: The path to the saved model
+    """
+    return train_and_evaluate_iris(test_size, random_state, stratify)["model_path"]
+
+
+def export_flat_forest(model: RandomForestClassifier) -> dict[str, np.ndarray]:
+    """ Flatten the trees of a forest into contiguous arrays.
+
+        The nodes of all the trees are concatenated, `roots` holds the index
+        of the first node of each tree. Child indices are absolute, and the
+        children of a leaf are the leaf itself, so that walking `max_depth`
+        steps from the roots ends on a leaf for every tree. `value` holds the
+        class probabilities of each node.
+
+    Args:
+        model (RandomForestClassifier): A fitted forest
+
+    Returns:
+        dict[str, np.ndarray]: feature, threshold, left, right, value, roots,
+            max_depth, classes and feature_names
+    """
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    feature, threshold, left, right, value = [], [], [], [], []
+    for offset, tree in zip(offsets, trees):
+        nodes = np.arange(offset, offset + tree.node_count, dtype=np.int32)
+        is_leaf = tree.children_left == -1
+        feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        left.append(np.where(is_leaf, nodes, tree.children_left + offset).astype(np.int32))
+        right.append(np.where(is_leaf, nodes, tree.children_right + offset).astype(np.int32))
+        counts = tree.value[:, 0, :]
+        value.append(counts / counts.sum(axis=1, keepdims=True))
+
+    return {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "value": np.concatenate(value),
+        "roots": offsets[:-1].astype(np.int32),
+        "max_depth": np.array(max(tree.max_depth for tree in trees)),
+        "classes": np.asarray(model.classes_).astype(str),
+        "feature_names": np.asarray(getattr(
+            model, "feature_names_in_", [f"x{i}" for i in range(model.n_features_in_)])).astype(str),
+    }
+
+
+def quantize_flat_forest(arrays: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """ Shrink a flat forest exported by `export_flat_forest`.
+
+        Thresholds are stored as float32, which is the precision features are
+        compared in, node and feature indices with the smallest unsigned
+        integer type that fits them, and class probabilities as float32 for
+        the leaves only.
+
+    Returns:
+        dict[str, np.ndarray]: The arrays of the quantized forest, loaded by
+            `FlatForest.load`
+    """
+    n_nodes = len(arrays["feature"])
+    node_type = np.min_scalar_type(n_nodes)
+    leaves = np.flatnonzero(arrays["left"] == np.arange(n_nodes))
+    return {
+        "feature": arrays["feature"].astype(np.min_scalar_type(arrays["feature"].max())),
+        "threshold": arrays["threshold"].astype(np.float32),
+        "left": arrays["left"].astype(node_type),
+        "right": arrays["right"].astype(node_type),
+        "leaves": leaves.astype(node_type),
+        "leaf_value": arrays["value"][leaves].astype(np.float32),
+        "roots": arrays["roots"].astype(node_type),
+        "max_depth": arrays["max_depth"],
+        "classes": arrays["classes"],
+        "feature_names": arrays["feature_names"],
+    }
+
+
+def save_flat_forest(model: RandomForestClassifier, path: Path, quantized: bool = False,
+                     model_version: Optional[str] = None) -> str:
+    """ Export a forest as flat arrays in a .npz file, see `export_flat_forest`
+
+    Args:
+        model (RandomForestClassifier): A fitted forest
+        path (Path): Path of the file
+        quantized (bool): Save the smaller arrays of `quantize_flat_forest`
+        model_version (str, optional): Version of the artifact of the model,
+            recorded so that the export is only served with that artifact
+
+    Returns:
+        str: The path of the file
+    """
+    path = Path(path)
+    arrays = export_flat_forest(model)
+    if quantized:
+        arrays = quantize_flat_forest(arrays)
+    if model_version is not None:
+        arrays["model_version"] = np.array(model_version)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp.npz")
+    try:
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return str(path)
+
+
+def save_artifacts(model: RandomForestClassifier, path: Path, X_eval: pd.DataFrame,
+                   y_eval: pd.Series, modes: list[str] = MODEL_ARTIFACT_MODES) -> dict:
+    """ Write the variants of a model artifact and their manifest.
+
+        Each variant is loaded back to measure its load time and its accuracy
+        on the evaluation rows. The manifest records them, with the size of
+        each file and its accuracy delta to the model in memory.
+
+    Args:
+        model (RandomForestClassifier): The model, already saved at `path`
+        path (Path): Path of the raw artifact
+        X_eval (pd.DataFrame): Features of the evaluation rows
+        y_eval (pd.Series): Species of the evaluation rows
+        modes (list[str]): Variants to write, see ARTIFACT_SUFFIXES
+
+    Returns:
+        dict: The manifest
+    """
+    from sklearn.metrics import accuracy_score
+
+    path = Path(path)
+    reference = accuracy_score(y_eval, model.predict(X_eval)) if len(X_eval) else None
+    artifacts = {}
+    for mode in ["raw", *[mode for mode in modes if mode != "raw"]]:
+        variant = artifact_path(path, mode)
+        if mode == "lz4" and importlib.util.find_spec("lz4") is None:
+            artifacts[mode] = {"error": "The lz4 package is not installed"}
+            continue
+        if mode in ("zlib", "lz4"):
+            save_model(model, variant, compress=(mode, 3))
+        elif mode == "quantized":
+            save_flat_forest(model, variant, quantized=True)
+
+        start = time.perf_counter()
+        loaded = load_artifact(variant)
+        load_seconds = time.perf_counter() - start
+        accuracy = accuracy_score(y_eval, loaded.predict(X_eval)) if len(X_eval) else None
+        artifacts[mode] = {
+            "path": str(variant),
+            "size_bytes": variant.stat().st_size,
+            "load_seconds": load_seconds,
+            "accuracy": accuracy,
+            "accuracy_delta": accuracy - reference if accuracy is not None else None,
+        }
+
+    manifest = {
+        "artifact": path.name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "evaluation_rows": len(X_eval),
+        "accuracy": reference,
+        "artifacts": artifacts,
+    }
+    target = manifest_path(path)
+    tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(tmp_path, target)
+    return manifest
+
+
+def save_iris_model(model: RandomForestClassifier, metadata: dict,
+                    X_eval: pd.DataFrame, y_eval: pd.Series) -> str:
+    """ Save the iris model, its flat-array export and its artifact variants
+
+    Args:
+        model (RandomForestClassifier): The trained model
+        metadata (dict): Its training metadata, see `training_metadata`
+        X_eval (pd.DataFrame): Features of the rows the variants are evaluated on
+        y_eval (pd.Series): Species of these rows
+
+    Returns:
+        str: The path of the raw artifact
+    """
+    model_path = save_model(model, model_holder.path, metadata=metadata)
+    # The export is tied to the artifact just written: the server flattens
+    # the model itself when they do not match
+    save_flat_forest(model, flat_forest_path(model_holder.path),
+                     model_version=artifact_version(file_stamp(model_path)))
+    save_artifacts(model, model_holder.path, X_eval, y_eval)
     return model_path
+
+
+def dataset_fingerprint(iris: pd.DataFrame, rows: Optional[int] = None) -> str:
+    """ Hash the content of the first rows of a dataset
+
+    Args:
+        iris (pd.DataFrame): The processed iris dataset
+        rows (int, optional): Number of rows to hash, all of them by default
+
+    Returns:
+        str: The hexadecimal digest
+    """
+    prefix = iris if rows is None else iris.iloc[:rows]
+    row_hashes = pd.util.hash_pandas_object(prefix, index=False).to_numpy()
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(",".join(map(str, prefix.columns)).encode())
+    return digest.hexdigest()
+
+
+def row_positions(iris: pd.DataFrame, rows: pd.DataFrame) -> list[int]:
+    """ Return the positions in the dataset of some of its rows, in order """
+    return sorted(int(position) for position in iris.index.get_indexer(rows.index))
+
+
+def training_metadata(iris: pd.DataFrame, model: RandomForestClassifier, mode: str,
+                      train_rows: int, fit_seconds: float, trees_added: Optional[int] = None,
+                      previous: Optional[dict] = None,
+                      test_rows: Optional[list[int]] = None) -> dict:
+    """ Build the metadata saved next to a model artifact.
+
+        The fingerprint of the dataset lets the next incremental training find
+        the rows appended since this one, and the positions of the held-out
+        rows keep them out of its training rows. The lineage lists the
+        trainings that led to the model, the last one first.
+
+    Args:
+        iris (pd.DataFrame): The dataset the model was trained on
+        model (RandomForestClassifier): The trained model
+        mode (str): "full", "incremental" or "sweep"
+        train_rows (int): Number of rows the model was fitted on
+        fit_seconds (float): Duration of the fit
+        trees_added (int, optional): Number of new trees, all of them by default
+        previous (dict, optional): Metadata of the model this one extends
+        test_rows (list[int], optional): Positions of the rows no tree of the
+            model was fitted on
+
+    Returns:
+        dict: The metadata
+    """
+    entry = {
+        "mode": mode,
+        "dataset_rows": len(iris),
+        "train_rows": train_rows,
+        "trees": len(model.estimators_),
+        "trees_added": len(model.estimators_) if trees_added is None else trees_added,
+        "fit_seconds": fit_seconds,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+    }
+    lineage = previous["lineage"] if previous is not None else []
+    return {
+        "dataset_rows": len(iris),
+        "dataset_fingerprint": dataset_fingerprint(iris),
+        "base_estimators": (previous["base_estimators"] if previous is not None
+                            else len(model.estimators_)),
+        "classes": [str(label) for label in model.classes_],
+        "test_rows": test_rows or [],
+        "lineage": [entry, *lineage][:LINEAGE_MAX_ENTRIES],
+    }
+
+
+def train_incremental_iris(test_size: float = 0.2, random_state: int = 42,
+                           stratify: bool = False, reload_model: bool = True,
+                           history_rows: int = INCREMENTAL_HISTORY_ROWS) -> dict:
+    """ Update the iris model with the rows appended since its last training.
+
+        New trees are added to the forest with `warm_start`. They are fitted
+        on the new rows and on a sample of at most `history_rows` older rows,
+        and their number is proportional to the share of new rows, so the
+        training time depends on the number of new rows rather than on the
+        size of the dataset. A `test_size` share of the new rows is held out
+        to score the model before and after, and, like the rows held out by
+        the previous trainings, is never part of the history sample. The
+        model is fully retrained instead when it has no metadata, when the
+        already trained rows changed, when a species is missing from the rows
+        of the new trees or when the forest grew INCREMENTAL_MAX_GROWTH times
+        larger than a full training.
+
+    Args:
+        test_size (float): Proportion of the new rows held out, or of the
+            dataset when the model is fully retrained
+        random_state (int): Seed of the split and of the history sample
+        stratify (bool): Keep the species proportions in both sets, when the
+            model is fully retrained
+        reload_model (bool): Swap the new model in the model holder of this
+            process
+        history_rows (int): Maximum number of older rows the new trees see
+
+    Returns:
+        dict: The path to the saved model, the training mode ("full",
+            "incremental" or "unchanged") and its metrics
+    """
+    from sklearn.metrics import accuracy_score
+
+    def full_training(reason: str) -> dict:
+        result = train_and_evaluate_iris(test_size, random_state, stratify, reload_model)
+        result["reason"] = reason
+        return result
+
+    metadata = read_model_metadata(model_holder.path)
+    if metadata is None or not model_holder.path.exists():
+        return full_training("The model has no training metadata")
+    if "test_rows" not in metadata:
+        return full_training("The model has no record of its held-out rows")
+
+    iris = get_processed_iris()
+    trained_rows = metadata["dataset_rows"]
+    if len(iris) < trained_rows or dataset_fingerprint(iris, trained_rows) != metadata["dataset_fingerprint"]:
+        return full_training("The rows the model was trained on changed")
+
+    new_rows = iris.iloc[trained_rows:]
+    if new_rows.empty:
+        return {"model_path": str(model_holder.path), "mode": "unchanged",
+                "metrics": {"new_rows": 0, "trees_added": 0}}
+
+    # Work on a copy of the artifact, the model in the holder keeps serving
+    model = joblib.load(model_holder.path)
+    features = feature_columns(iris)
+    if list(getattr(model, "feature_names_in_", [])) != features:
+        return full_training("The model was trained on other features")
+    base_estimators = metadata["base_estimators"]
+    trees_added = min(base_estimators, math.ceil(
+        base_estimators * len(new_rows) / max(trained_rows, 1)))
+    if len(model.estimators_) + trees_added > base_estimators * INCREMENTAL_MAX_GROWTH:
+        return full_training("The forest reached its maximum size")
+
+    rng = np.random.default_rng(random_state + len(metadata["lineage"]))
+    new_positions = rng.permutation(np.arange(trained_rows, len(iris)))
+    n_eval = int(len(new_positions) * test_size)
+    eval_positions = np.sort(new_positions[:n_eval])
+    fit_positions = np.sort(new_positions[n_eval:])
+    # The history is drawn from the rows the model was fitted on only
+    history_pool = np.setdiff1d(np.arange(trained_rows), metadata["test_rows"])
+    history = np.sort(rng.choice(history_pool, size=min(history_rows, len(history_pool)),
+                                 replace=False))
+    rows = iris.iloc[np.concatenate([history, fit_positions])]
+    X, y = rows[features], rows["species"]
+    if set(map(str, y.unique())) != set(map(str, model.classes_)):
+        return full_training("The species of the new trees do not match the model")
+
+    eval_rows = iris.iloc[eval_positions]
+    X_eval, y_eval = eval_rows[features], eval_rows["species"]
+    accuracy_before = accuracy_score(y_eval, model.predict(X_eval)) if len(X_eval) else None
+
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees_added)
+    start = time.perf_counter()
+    model.fit(X, y)
+    fit_seconds = time.perf_counter() - start
+    model.set_params(warm_start=False)
+
+    metadata = training_metadata(
+        iris, model, "incremental", len(rows), fit_seconds, trees_added=trees_added,
+        previous=metadata, test_rows=sorted([*metadata["test_rows"], *map(int, eval_positions)]))
+    model_path = save_iris_model(model, metadata, X_eval, y_eval)
+    if reload_model:
+        model_holder.reload()
+    return {
+        "model_path": model_path,
+        "mode": "incremental",
+        "metrics": {
+            "new_rows": len(new_rows),
+            "train_rows": len(rows),
+            "eval_rows": len(eval_rows),
+            "trees_added": trees_added,
+            "trees": len(model.estimators_),
+            "new_rows_accuracy_before": accuracy_before,
+            "new_rows_accuracy_after": (accuracy_score(y_eval, model.predict(X_eval))
+                                        if len(X_eval) else None),
+            "fit_seconds": fit_seconds,
+        },
+    }
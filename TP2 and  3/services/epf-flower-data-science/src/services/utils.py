@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from typing import Iterator, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.schemas.iris import OutputFormat
+from src.services.lazy import LazyModule
+
+pd = LazyModule("pandas")
+
+STREAM_CHUNK_SIZE = 1000
+
+MEDIA_TYPES = {
+    OutputFormat.ndjson: "application/x-ndjson",
+    OutputFormat.csv: "text/csv",
+}
+
+
+def select_rows(df: pd.DataFrame, columns: Optional[str] = None,
+                offset: int = 0, limit: Optional[int] = None) -> pd.DataFrame:
+    """ Project and paginate a DataFrame without copying the selected rows.
+
+    Args:
+        df (pd.DataFrame): The dataset
+        columns (str, optional): Comma-separated list of the columns to keep
+        offset (int): Index of the first row to return
+        limit (int, optional): Maximum number of rows to return
+
+    Raises:
+        HTTPException: Unknown column requested
+
+    Returns:
+        pd.DataFrame: The selected rows and columns
+    """
+    if columns:
+        selected = [column.strip() for column in columns.split(",") if column.strip()]
+        unknown = [column for column in selected if column not in df.columns]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown columns: {', '.join(unknown)}")
+        df = df[selected]
+    stop = None if limit is None else offset + limit
+    return df.iloc[offset:stop]
+
+
+def iter_dataframe(df: pd.DataFrame, output_format: OutputFormat,
+                   chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """ Serialize a DataFrame chunk by chunk as NDJSON or CSV.
+        Only one chunk is converted at a time so memory use does not depend on
+        the size of the dataset.
+
+    Args:
+        df (pd.DataFrame): The dataset
+        output_format (OutputFormat): ndjson or csv
+        chunk_size (int): Number of rows serialized per chunk
+
+    Yields:
+        str: The serialized chunks
+    """
+    if output_format == OutputFormat.csv:
+        yield df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        if output_format == OutputFormat.csv:
+            yield chunk.to_csv(index=False, header=False)
+        else:
+            # Older pandas versions do not end the last line with a newline
+            yield chunk.to_json(orient="records", lines=True).rstrip("\n") + "\n"
+
+
+def dataframe_response(df: pd.DataFrame, output_format: OutputFormat = OutputFormat.json,
+                       columns: Optional[str] = None, offset: int = 0,
+                       limit: Optional[int] = None):
+    """ Build the response of a dataset route.
+
+    Args:
+        df (pd.DataFrame): The dataset
+        output_format (OutputFormat): json, ndjson or csv
+        columns (str, optional): Comma-separated list of the columns to keep
+        offset (int): Index of the first row to return
+        limit (int, optional): Maximum number of rows to return
+
+    Returns:
+        JSONResponse | StreamingResponse: The selected rows, as a JSON list or
+        streamed in chunks. The total number of rows is sent in the
+        X-Total-Count header.
+    """
+    headers = {"X-Total-Count": str(len(df))}
+    page = select_rows(df, columns=columns, offset=offset, limit=limit)
+    if output_format == OutputFormat.json:
+        return JSONResponse(
+            content=page.to_dict(orient='records'),
+            status_code=status.HTTP_200_OK,
+            headers=headers
+        )
+    return StreamingResponse(
+        iter_dataframe(page, output_format),
+        media_type=MEDIA_TYPES[output_format],
+        headers=headers
+    )
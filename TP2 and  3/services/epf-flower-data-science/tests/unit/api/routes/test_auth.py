@@ -1,5 +1,6 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch, MagicMock
+import httpx
 from src.schemas.firebase import FirebaseUser
 from src.services.firebase import get_users, verify_firebase_token, set_role, get_role
 from firebase_admin import auth
@@ -124,14 +125,13 @@ class TestFirebaseRoutes:
         assert response.status_code == 401
         assert response.json() == {"detail": "Invalid Firebase token"}
 
-    @patch("requests.post")
+    @patch("src.services.identity_toolkit.IdentityToolkitClient.sign_up", new_callable=AsyncMock)
     @patch("src.api.routes.authentication.set_role")
-    def test_register_user(self, mock_set_role: MagicMock, mock_post: MagicMock, client: TestClient):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
+    def test_register_user(self, mock_set_role: MagicMock, mock_sign_up: AsyncMock, client: TestClient):
+        mock_sign_up.return_value = httpx.Response(200, json={
             "localId": "user_id_123",
             "email": "test@example.com"
-        }
+        })
 
         response = client.post("/register", json={
             "email": "test@example.com",
@@ -148,12 +148,12 @@ class TestFirebaseRoutes:
             "role": "admin"
         }
 
-    @patch("requests.post")
-    def test_login_user_valid(self, mock_post: MagicMock, client: TestClient):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
+    @patch("src.services.identity_toolkit.IdentityToolkitClient.sign_in_with_password",
+           new_callable=AsyncMock)
+    def test_login_user_valid(self, mock_sign_in: AsyncMock, client: TestClient):
+        mock_sign_in.return_value = httpx.Response(200, json={
             "idToken": "test_token"
-        }
+        })
 
         response = client.post("/token", data={
             "username": "test@example.com",
@@ -166,12 +166,12 @@ class TestFirebaseRoutes:
             "token_type": "bearer"
         }
 
-    @patch("requests.post")
-    def test_login_user_invalid(self, mock_post: MagicMock, client: TestClient):
-        mock_post.return_value.status_code = 400
-        mock_post.return_value.json.return_value = {
+    @patch("src.services.identity_toolkit.IdentityToolkitClient.sign_in_with_password",
+           new_callable=AsyncMock)
+    def test_login_user_invalid(self, mock_sign_in: AsyncMock, client: TestClient):
+        mock_sign_in.return_value = httpx.Response(400, json={
             "error": {"message": "INVALID_PASSWORD"}
-        }
+        })
 
         response = client.post("/token", data={
             "username": "test@example.com",
@@ -183,6 +183,46 @@ class TestFirebaseRoutes:
             "detail": "Login failed: INVALID_PASSWORD"
         }
 
+    def test_login_against_identity_toolkit_stand_in(self):
+        from main import get_application
+        from benchmarks.fakes import create_identity_toolkit_app
+        from src.services.identity_toolkit import IdentityToolkitClient
+
+        app = get_application()
+        app.state.identity_toolkit = IdentityToolkitClient(
+            base_url="http://identity-toolkit", transport=httpx.ASGITransport(
+                app=create_identity_toolkit_app({"test@example.com": "password123"})))
+        client = TestClient(app, base_url="http://testserver")
+
+        response = client.post("/token", data={
+            "username": "test@example.com",
+            "password": "password123"
+        })
+
+        assert response.status_code == 200
+        assert response.json()["access_token"]
+
+    def test_identity_toolkit_timeout(self):
+        from main import get_application
+        from src.services.identity_toolkit import IdentityToolkitClient
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ReadTimeout("timeout", request=request)
+
+        app = get_application()
+        app.state.identity_toolkit = IdentityToolkitClient(
+            base_url="http://identity-toolkit", max_retries=0,
+            transport=httpx.MockTransport(handler))
+        client = TestClient(app, base_url="http://testserver")
+
+        login = client.post("/token", data={"username": "test@example.com",
+                                            "password": "password123"})
+        register = client.post("/register", json={"email": "test@example.com",
+                                                   "password": "password123"})
+
+        assert login.status_code == register.status_code == 504
+        assert login.json() == {"detail": "The identity provider did not answer in time"}
+
 
 if __name__ == "__main__":
     unittest.main()
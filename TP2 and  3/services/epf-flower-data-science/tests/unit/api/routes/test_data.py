@@ -108,3 +108,17 @@ class TestDataRoute:
                 "name": "test3",
                 "url": "https://test3.fr/"
             }
+
+    def test_delete_dataset_200(self, client, mocked_configs_file):
+        with patch("src.services.data.JSON_CONFIG_PATH", new=mocked_configs_file):
+            response = client.delete("/dataset/test1")
+            assert response.status_code == 200
+            assert response.json() == {
+                "message": "Dataset test1 was successfully deleted"}
+            assert client.get("/dataset/test1").status_code == 404
+
+    def test_delete_dataset_404(self, client, mocked_configs_file):
+        with patch("src.services.data.JSON_CONFIG_PATH", new=mocked_configs_file):
+            response = client.delete("/dataset/test3")
+            assert response.status_code == 404
+            assert response.json() == {"detail": "Dataset not found: test3"}
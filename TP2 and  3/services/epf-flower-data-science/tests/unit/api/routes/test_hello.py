@@ -30,3 +30,12 @@ class TestHelloRoute:
         assert response.json() == {
             "message": "Hello testuser, from fastapi test route !"
         }
+
+    def test_rate_limit(self, client):
+        responses = [client.get("/hello/testuser") for _ in range(6)]
+
+        assert [response.status_code for response in responses] == [200] * 5 + [429]
+        assert responses[-1].json() == {"error": "Rate limit exceeded: 5/minute"}
+        assert int(responses[-1].headers["Retry-After"]) >= 1
+        assert client.app.state.rate_limiter.stats()["routes"]["GET /hello/{name}"] == {
+            "limit": "5/minute", "allowed": 5, "rejected": 1}
@@ -0,0 +1,182 @@
+import io
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+IRIS_CSV = """Id,SepalLengthCm,SepalWidthCm,PetalLengthCm,PetalWidthCm,Species
+1,5.1,3.5,1.4,0.2,Iris-setosa
+2,4.9,3.0,1.4,0.2,Iris-setosa
+3,7.0,3.2,4.7,1.4,Iris-versicolor
+4,6.4,3.2,4.5,1.5,Iris-versicolor
+5,6.3,3.3,6.0,2.5,Iris-virginica
+"""
+
+
+class TestIrisRoute:
+
+    @pytest.fixture
+    def client(self) -> TestClient:
+        """
+        Test client for integration tests
+        """
+        from main import get_application
+
+        app = get_application()
+        return TestClient(app, base_url="http://testserver")
+
+    @pytest.fixture
+    def data_dir(self, tmp_path: Path) -> Path:
+        (tmp_path / "iris.csv").write_text(IRIS_CSV)
+        with patch("src.services.data.DATA_FILE_PATH", new=tmp_path):
+            yield tmp_path
+
+    def test_load_all_rows(self, client, data_dir):
+        response = client.get("/iris/load")
+        assert response.status_code == 200
+        assert len(response.json()) == 5
+        assert response.headers["X-Total-Count"] == "5"
+
+    def test_load_paginated(self, client, data_dir):
+        response = client.get(
+            "/iris/load", params={"offset": 1, "limit": 2, "columns": "Id,Species"})
+        assert response.status_code == 200
+        assert response.json() == [
+            {"Id": 2, "Species": "Iris-setosa"},
+            {"Id": 3, "Species": "Iris-versicolor"},
+        ]
+
+    def test_load_unknown_column(self, client, data_dir):
+        response = client.get("/iris/load", params={"columns": "Id,color"})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Unknown columns: color"}
+
+    def test_process_ndjson(self, client, data_dir):
+        response = client.get(
+            "/iris/process", params={"format": "ndjson", "columns": "species"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith(
+            "application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert rows == [{"species": "setosa"}, {"species": "setosa"},
+                        {"species": "versicolor"}, {"species": "versicolor"},
+                        {"species": "virginica"}]
+
+    def test_process_csv(self, client, data_dir):
+        response = client.get(
+            "/iris/process", params={"format": "csv", "limit": 1, "columns": "id,species"})
+        assert response.status_code == 200
+        assert response.text == "id,species\n1,setosa\n"
+
+    def test_split_default(self, client, data_dir):
+        from sklearn.model_selection import train_test_split
+        from src.services.data import get_processed_iris
+
+        response = client.get("/iris/split")
+        assert response.status_code == 200
+
+        iris = get_processed_iris()
+        _, _, y_train, y_test = train_test_split(
+            iris.drop(columns="species"), iris["species"], test_size=0.2, random_state=42)
+        assert response.json()["y_train"] == y_train.to_list()
+        assert response.json()["y_test"] == y_test.to_list()
+
+    def test_split_parameters(self, client, data_dir):
+        response = client.get(
+            "/iris/split", params={"test_size": 0.4, "random_state": 0})
+        assert response.status_code == 200
+        assert len(response.json()["X_train"]) == 3
+        assert len(response.json()["X_test"]) == 2
+        assert "species" not in response.json()["X_train"][0]
+        assert "id" not in response.json()["X_train"][0]
+
+    def test_split_invalid_test_size(self, client, data_dir):
+        response = client.get("/iris/split", params={"test_size": 1.5})
+        assert response.status_code == 422
+
+    def test_split_is_cached(self, client, data_dir):
+        client.get("/iris/split", params={"random_state": 7})
+        before = client.get("/iris/cache").json()["splits"]
+
+        client.get("/iris/split", params={"random_state": 7})
+        after = client.get("/iris/cache").json()["splits"]
+
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+
+    def test_predict_measurements(self, client, data_dir, tmp_path):
+        from src.services.model_store import ModelHolder
+        from src.services.train import train_and_evaluate_iris
+
+        holder = ModelHolder(tmp_path / "iris_model.joblib", mode="raw")
+        config = {"n_estimators": 5, "random_state": 0}
+        with patch("src.services.train.model_holder", new=holder), \
+                patch("src.services.predict.model_holder", new=holder), \
+                patch("src.services.train.load_model_config", return_value=config):
+            train_and_evaluate_iris(test_size=0.4, reload_model=False)
+            measurements = client.post("/iris/predict", json={"rows": [[5.1, 3.5, 1.4, 0.2]]})
+            with_id = client.post("/iris/predict", json={"rows": [[1, 5.1, 3.5, 1.4, 0.2]]})
+
+        assert holder.get().feature_names_in_.tolist() == [
+            "sepal_length", "sepal_width", "petal_length", "petal_width"]
+        assert measurements.status_code == 200
+        assert len(measurements.json()["predicted_labels"]) == 1
+        assert with_id.status_code == 422
+
+    def test_predict_with_model_trained_on_id(self, client, tmp_path):
+        import pandas as pd
+        from sklearn.tree import DecisionTreeClassifier
+        from src.services.data import IRIS_FEATURES
+        from src.services.model_store import ModelHolder, save_model
+
+        iris = pd.read_csv(io.StringIO(IRIS_CSV))
+        X = iris.drop(columns="Species").set_axis(["id", *IRIS_FEATURES], axis=1)
+        save_model(DecisionTreeClassifier().fit(X, iris["Species"]), tmp_path / "iris_model.joblib")
+        holder = ModelHolder(tmp_path / "iris_model.joblib", mode="raw", features=IRIS_FEATURES)
+        with patch("src.services.predict.model_holder", new=holder), \
+                patch("src.api.routes.iris.model_holder", new=holder):
+            predict = client.post("/iris/predict", json={"rows": [[5.1, 3.5, 1.4, 0.2]]})
+            model = client.get("/iris/model")
+
+        assert predict.status_code == 503
+        assert predict.json()["detail"].startswith("The model artifact was trained on id, sepal_length")
+        assert model.status_code == 503
+
+    def test_sweep_without_candidates(self, client):
+        with patch("src.api.routes.iris.expand_space", return_value=[]), \
+                patch("src.api.routes.iris.training_jobs.submit") as submit:
+            response = client.post("/iris/sweep", json={"space": {"max_depth": [3]}})
+            empty = client.post("/iris/sweep", json={"space": {"max_depth": []}})
+
+        assert response.status_code == empty.status_code == 422
+        assert response.json() == {"detail": "The search space holds no candidate"}
+        submit.assert_not_called()
+
+    def test_model_artifacts_not_found(self, client, tmp_path):
+        from src.services.model_store import ModelHolder
+
+        holder = ModelHolder(tmp_path / "model.joblib")
+        with patch("src.api.routes.iris.model_holder", new=holder):
+            response = client.get("/iris/model/artifacts")
+        assert response.status_code == 404
+
+    def test_train_routes(self, client):
+        operations = client.get("/openapi.json").json()["paths"]["/iris/train"]
+
+        assert operations["post"]["operationId"] == "train_iris"
+        assert operations["get"]["operationId"] == "train_iris_get"
+        assert operations["get"]["deprecated"] is True
+        assert "deprecated" not in operations["post"]
+
+        job = {"job_id": "abc", "state": "queued"}
+        with patch("src.api.routes.iris.training_jobs.submit", return_value=job) as submit:
+            posted = client.post("/iris/train?test_size=0.3")
+            got = client.get("/iris/train?incremental=true")
+
+        assert posted.status_code == got.status_code == 202
+        assert posted.json() == {"job_id": "abc", "state": "queued",
+                                 "status_url": "/iris/train/abc"}
+        assert submit.call_args_list[0].kwargs["params"]["test_size"] == 0.3
+        assert submit.call_args_list[1].args[1].__name__ == "train_incremental_iris"
@@ -3,6 +3,7 @@ from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, patch
 from src.services.firestore import Parameters
 from pydantic import ValidationError
+from fastapi import HTTPException
 
 
 class TestParametersSchema:
@@ -152,3 +153,43 @@ class TestParametersRoute:
             "/parameters", json=mock_parameters)
         assert response.status_code == 200
         assert response.json() == mock_parameters
+
+    @pytest.mark.asyncio
+    @patch("src.services.firestore.FirestoreClient.get")
+    async def test_get_parameters_cached(self, mock_get: MagicMock, client: TestClient):
+        """Test that repeated GET requests to /parameters read Firestore once."""
+        mock_get.return_value = Parameters(n_estimators=100)
+
+        for _ in range(3):
+            response = client.get("/parameters")
+            assert response.status_code == 200
+            assert response.json() == {"n_estimators": 100}
+        mock_get.assert_called_once()
+        assert client.get("/parameters/cache").json()["hits"] == 2
+
+    @pytest.mark.asyncio
+    @patch("src.services.firestore.FirestoreClient.put")
+    async def test_put_parameters_not_found(self, mock_put: MagicMock, client: TestClient):
+        """Test PUT request to /parameters when the document does not exist."""
+        mock_put.side_effect = HTTPException(status_code=404, detail="No document found")
+
+        response = client.put("/parameters", json={"n_estimators": 100})
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    @patch("src.services.firestore.FirestoreClient.put_many")
+    async def test_put_parameters_batch(self, mock_put_many: MagicMock, client: TestClient):
+        """Test PUT request to /parameters/batch."""
+        mock_put_many.return_value = ["iris", "penguins"]
+
+        response = client.put("/parameters/batch", json={"documents": {
+            "iris": {"n_estimators": 100}, "penguins": {"criterion": "entropy"}}})
+        assert response.status_code == 200
+        assert response.json() == {"documents": ["iris", "penguins"]}
+        _, documents = mock_put_many.call_args.args
+        assert documents["penguins"].to_dict() == {"criterion": "entropy"}
+
+    def test_put_parameters_batch_empty(self, client: TestClient):
+        """Test PUT request to /parameters/batch without documents."""
+        response = client.put("/parameters/batch", json={"documents": {}})
+        assert response.status_code == 422
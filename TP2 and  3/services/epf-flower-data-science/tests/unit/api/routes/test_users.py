@@ -0,0 +1,161 @@
+import json
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.schemas.firebase import FirebaseUser
+from src.services.firebase import UsersSnapshot, iter_users, list_users_page, users_snapshot
+
+ADMIN = FirebaseUser(email="admin@example.com", user_id="admin", role="admin")
+
+
+def _user(i: int, role: Optional[str] = "default") -> MagicMock:
+    user = MagicMock()
+    user.email = f"user{i}@example.com"
+    user.uid = f"uid{i}"
+    user.custom_claims = {"role": role} if role else None
+    return user
+
+
+class FakeUserPages:
+    """ Stand-in for auth.list_users over a fixed list of users """
+
+    def __init__(self, count: int):
+        self.users = [_user(i) for i in range(count)]
+        self.calls = []
+
+    def __call__(self, page_token: Optional[str] = None, max_results: int = 1000) -> MagicMock:
+        self.calls.append((page_token, max_results))
+        start = int(page_token or 0)
+        page = MagicMock()
+        page.users = self.users[start:start + max_results]
+        page.next_page_token = (str(start + max_results)
+                                if start + max_results < len(self.users) else "")
+        return page
+
+
+class FailingUserPages(FakeUserPages):
+    """ Pages that fail from the page starting at `fail_at` """
+
+    def __init__(self, count: int, fail_at: int):
+        super().__init__(count)
+        self.fail_at = fail_at
+
+    def __call__(self, page_token: Optional[str] = None, max_results: int = 1000) -> MagicMock:
+        if int(page_token or 0) >= self.fail_at:
+            raise ConnectionError("Firebase is unreachable")
+        return super().__call__(page_token, max_results)
+
+
+class TestUsersListing:
+
+    def test_list_users_page(self):
+        pages = FakeUserPages(5)
+        with patch("src.services.firebase.auth.list_users", new=pages):
+            users, next_page_token = list_users_page(page_size=2)
+            last_users, last_token = list_users_page(page_token="4", page_size=2)
+
+        assert [user.user_id for user in users] == ["uid0", "uid1"]
+        assert next_page_token == "2"
+        assert [user.user_id for user in last_users] == ["uid4"]
+        assert last_token is None
+
+    def test_user_without_role(self):
+        pages = FakeUserPages(0)
+        pages.users = [_user(0, role=None)]
+        with patch("src.services.firebase.auth.list_users", new=pages):
+            users, _ = list_users_page()
+
+        assert users[0].role == "default"
+
+    def test_iter_users_fetches_all_pages(self):
+        pages = FakeUserPages(7)
+        with patch("src.services.firebase.auth.list_users", new=pages):
+            users = list(iter_users(page_size=3))
+
+        assert [user.user_id for user in users] == [f"uid{i}" for i in range(7)]
+        assert pages.calls == [(None, 3), ("3", 3), ("6", 3)]
+
+    def test_snapshot_is_shared(self):
+        pages = FakeUserPages(3)
+        snapshot = UsersSnapshot(ttl=60)
+        with patch("src.services.firebase.auth.list_users", new=pages):
+            first, _ = snapshot.get()
+            second, age = snapshot.get()
+
+        assert second is first
+        assert len(pages.calls) == 1
+        assert age >= 0
+
+
+class TestUsersRoute:
+
+    @pytest.fixture
+    def client(self) -> TestClient:
+        from main import get_application
+
+        users_snapshot.clear()
+        with patch("src.api.routes.authentication.verify_firebase_token", return_value=ADMIN):
+            yield TestClient(get_application(), base_url="http://testserver",
+                             headers={"Authorization": "Bearer token"})
+
+    def test_page(self, client):
+        with patch("src.services.firebase.auth.list_users", new=FakeUserPages(5)):
+            response = client.get("/users", params={"page_size": 2, "page_token": "2"})
+
+        assert response.status_code == 200
+        assert [user["user_id"] for user in response.json()] == ["uid2", "uid3"]
+        assert response.headers["X-Next-Page-Token"] == "4"
+
+    def test_last_page_has_no_token(self, client):
+        with patch("src.services.firebase.auth.list_users", new=FakeUserPages(5)):
+            response = client.get("/users", params={"page_size": 2, "page_token": "4"})
+
+        assert len(response.json()) == 1
+        assert "X-Next-Page-Token" not in response.headers
+
+    def test_ndjson_stream(self, client):
+        with patch("src.services.firebase.auth.list_users", new=FakeUserPages(5)):
+            response = client.get("/users", params={"format": "ndjson", "page_size": 2})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        users = [json.loads(line) for line in response.text.splitlines()]
+        assert users[0] == {"email": "user0@example.com", "user_id": "uid0", "role": "default"}
+        assert len(users) == 5
+
+    def test_ndjson_stream_ends_with_the_error_of_a_later_page(self, client):
+        with patch("src.services.firebase.auth.list_users", new=FailingUserPages(5, fail_at=2)):
+            response = client.get("/users", params={"format": "ndjson", "page_size": 2})
+
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert response.status_code == 200
+        assert [record["user_id"] for record in records[:2]] == ["uid0", "uid1"]
+        assert records[-1] == {
+            "error": "The listing of the users stopped: Firebase is unreachable"}
+
+    def test_ndjson_first_page_error_gets_an_error_status(self, client):
+        client = TestClient(client.app, base_url="http://testserver",
+                            headers={"Authorization": "Bearer token"},
+                            raise_server_exceptions=False)
+        with patch("src.services.firebase.auth.list_users", new=FailingUserPages(5, fail_at=0)):
+            response = client.get("/users", params={"format": "ndjson", "page_size": 2})
+
+        assert response.status_code == 500
+
+    def test_snapshot(self, client):
+        pages = FakeUserPages(3)
+        with patch("src.services.firebase.auth.list_users", new=pages):
+            first = client.get("/users", params={"snapshot": True})
+            second = client.get("/users", params={"snapshot": True})
+
+        assert first.json() == second.json()
+        assert len(first.json()) == 3
+        assert len(pages.calls) == 1
+        assert "X-Snapshot-Age" in second.headers
+
+    def test_invalid_page_size(self, client):
+        response = client.get("/users", params={"page_size": 5000})
+        assert response.status_code == 422
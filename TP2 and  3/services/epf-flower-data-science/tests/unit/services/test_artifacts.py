@@ -0,0 +1,82 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from src.services.model_store import ModelHolder, artifact_path, read_manifest, save_model
+from src.services.predict import FlatForest
+from src.services.train import save_artifacts
+
+FEATURES = ["id", "sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+
+@pytest.fixture(scope="module")
+def dataset() -> tuple[pd.DataFrame, np.ndarray]:
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(400, 5)), columns=FEATURES)
+    y = np.select([X["petal_length"] > 0.5, X["sepal_width"] > 0],
+                  ["virginica", "versicolor"], "setosa")
+    return X, y
+
+
+@pytest.fixture
+def model_path(tmp_path: Path, dataset) -> Path:
+    X, y = dataset
+    model = RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0).fit(X[:300], y[:300])
+    path = tmp_path / "model.joblib"
+    save_model(model, path)
+    save_artifacts(model, path, X[300:], y[300:])
+    return path
+
+
+class TestArtifacts:
+
+    def test_manifest(self, model_path):
+        manifest = read_manifest(model_path)
+
+        assert manifest["artifact"] == "model.joblib"
+        assert manifest["evaluation_rows"] == 100
+        artifacts = manifest["artifacts"]
+        for mode in ["raw", "zlib", "quantized"]:
+            assert Path(artifacts[mode]["path"]) == artifact_path(model_path, mode)
+            assert artifacts[mode]["size_bytes"] == artifact_path(model_path, mode).stat().st_size
+            assert artifacts[mode]["load_seconds"] > 0
+        assert artifacts["raw"]["accuracy_delta"] == 0
+        assert artifacts["zlib"]["accuracy_delta"] == 0
+        assert abs(artifacts["quantized"]["accuracy_delta"]) <= 0.02
+        assert artifacts["zlib"]["size_bytes"] < artifacts["raw"]["size_bytes"]
+        assert artifacts["quantized"]["size_bytes"] < artifacts["raw"]["size_bytes"]
+
+    @pytest.mark.skipif(importlib.util.find_spec("lz4") is not None,
+                        reason="lz4 is installed")
+    def test_lz4_without_package(self, model_path):
+        assert read_manifest(model_path)["artifacts"]["lz4"] == {
+            "error": "The lz4 package is not installed"}
+
+    def test_quantized_forest(self, model_path, dataset):
+        X, _ = dataset
+        with np.load(artifact_path(model_path, "quantized")) as arrays:
+            assert arrays["threshold"].dtype == np.float32
+            assert arrays["left"].dtype == np.uint16
+            assert arrays["feature"].dtype == np.uint8
+
+        quantized = FlatForest.load(artifact_path(model_path, "quantized"))
+        exact = FlatForest.from_model(ModelHolder(model_path).get())
+        np.testing.assert_allclose(
+            quantized.predict_proba(X[300:]), exact.predict_proba(X[300:]), atol=1e-6)
+
+    def test_holder_serves_variant(self, model_path):
+        holder = ModelHolder(model_path, mode="quantized")
+
+        assert isinstance(holder.get(), FlatForest)
+        assert holder.info()["path"] == str(artifact_path(model_path, "quantized"))
+
+    def test_holder_falls_back_to_raw(self, model_path):
+        artifact_path(model_path, "zlib").unlink()
+        holder = ModelHolder(model_path, mode="zlib")
+
+        assert isinstance(holder.get(), RandomForestClassifier)
+        assert holder.info()["path"] == str(model_path)
@@ -0,0 +1,71 @@
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from sklearn.ensemble import RandomForestClassifier
+
+from src.services.model_store import ModelHolder, save_model
+from src.services.predict import MicroBatcher, predict_rows
+
+FEATURES = ["id", "sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+
+@pytest.fixture
+def model_holder(tmp_path: Path):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(60, 5)), columns=FEATURES)
+    y = np.where(X["petal_length"] > 0, "virginica", "setosa")
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    save_model(model, tmp_path / "model.joblib")
+    holder = ModelHolder(tmp_path / "model.joblib")
+    with patch("src.services.predict.model_holder", new=holder):
+        yield holder
+
+
+class TestMicroBatcher:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_a_batch(self, model_holder):
+        batcher = MicroBatcher(window=0.05, max_batch_rows=1000)
+        rows = np.random.default_rng(1).normal(size=(10, 5))
+
+        results = await asyncio.gather(
+            *[predict_rows([row.tolist()], batcher) for row in rows])
+
+        expected = model_holder.get().predict(pd.DataFrame(rows, columns=FEATURES))
+        assert [result["predicted_labels"][0] for result in results] == expected.tolist()
+        assert {result["batch_requests"] for result in results} == {10}
+        assert batcher.stats()["batches"] == 1
+        assert batcher.stats()["mean_batch_rows"] == 10
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_flushed_early(self, model_holder):
+        batcher = MicroBatcher(window=10, max_batch_rows=4)
+        rows = np.zeros((2, 5)).tolist()
+
+        results = await asyncio.wait_for(
+            asyncio.gather(predict_rows(rows, batcher), predict_rows(rows, batcher)), timeout=5)
+
+        assert [result["batch_rows"] for result in results] == [4, 4]
+
+    @pytest.mark.asyncio
+    async def test_wrong_number_of_features(self, model_holder):
+        with pytest.raises(HTTPException) as exc_info:
+            await predict_rows([[1.0, 2.0]], MicroBatcher())
+
+        assert exc_info.value.status_code == 422
+        assert "5 values" in exc_info.value.detail
+
+    def test_batcher_follows_the_event_loop(self, model_holder):
+        batcher = MicroBatcher(window=0.01)
+
+        first = asyncio.run(predict_rows([[0.0] * 5], batcher))
+        second = asyncio.run(predict_rows([[0.0] * 5], batcher))
+
+        assert first["predicted_labels"] == second["predicted_labels"]
+        assert batcher.stats()["batches"] == 2
+        assert batcher._tasks == set()
@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.services import cleaning
+from src.services.cleaning import load_columnar, load_or_build_columnar
+
+IRIS_CSV = """Id,SepalLengthCm,SepalWidthCm,PetalLengthCm,PetalWidthCm,Species
+1,5.1,3.5,1.4,0.2,Iris-setosa
+2,7.0,3.2,4.7,1.4,Iris-versicolor
+3,6.3,3.3,6.0,2.5,Iris-virginica
+"""
+
+
+class TestColumnarDataset:
+
+    @pytest.fixture
+    def source(self, tmp_path: Path) -> Path:
+        source = tmp_path / "iris.csv"
+        source.write_text(IRIS_CSV)
+        return source
+
+    def test_build_and_load(self, source, tmp_path):
+        directory = tmp_path / "iris.processed"
+
+        df = load_or_build_columnar(source, directory)
+
+        assert list(df.columns) == ["id", "sepal_length", "sepal_width",
+                                    "petal_length", "petal_width", "species"]
+        assert df["species"].tolist() == ["setosa", "versicolor", "virginica"]
+        assert str(df["species"].dtype) == "category"
+        assert df["sepal_length"].tolist() == [5.1, 7.0, 6.3]
+        assert isinstance(np.load(directory / "1.npy", mmap_mode="r"), np.memmap)
+
+    def test_load_reuses_cache(self, source, tmp_path):
+        directory = tmp_path / "iris.processed"
+        load_or_build_columnar(source, directory)
+
+        with patch("src.services.cleaning.save_columnar") as mock_save:
+            load_or_build_columnar(source, directory)
+
+        mock_save.assert_not_called()
+
+    def test_rebuilt_when_source_changes(self, source, tmp_path):
+        directory = tmp_path / "iris.processed"
+        load_or_build_columnar(source, directory)
+
+        source.write_text(IRIS_CSV + "4,5.0,3.0,1.6,0.2,Iris-setosa\n")
+        stat = source.stat()
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        with pytest.raises(FileNotFoundError):
+            load_columnar(directory, source)
+        assert len(load_or_build_columnar(source, directory)) == 4
+
+    def test_rebuilt_when_cleaning_version_changes(self, source, tmp_path):
+        directory = tmp_path / "iris.processed"
+        load_or_build_columnar(source, directory)
+
+        with patch.object(cleaning, "CLEANING_VERSION", cleaning.CLEANING_VERSION + 1):
+            with pytest.raises(FileNotFoundError):
+                load_columnar(directory, source)
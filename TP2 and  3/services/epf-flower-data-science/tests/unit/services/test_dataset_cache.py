@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from src.services.cache import DatasetCache
+
+
+class TestDatasetCache:
+
+    @pytest.fixture
+    def csv_file(self, tmp_path: Path) -> Path:
+        csv_file = tmp_path / "iris.csv"
+        csv_file.write_text("Id,Species\n1,Iris-setosa\n2,Iris-virginica\n")
+        return csv_file
+
+    def test_read_csv_is_parsed_once(self, csv_file):
+        cache = DatasetCache()
+
+        first = cache.read_csv(csv_file)
+        second = cache.read_csv(csv_file)
+
+        assert first is second
+        assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    def test_read_csv_invalidated_on_change(self, csv_file):
+        cache = DatasetCache()
+        cache.read_csv(csv_file)
+
+        csv_file.write_text(
+            "Id,Species\n1,Iris-setosa\n2,Iris-virginica\n3,Iris-setosa\n")
+        stat = csv_file.stat()
+        # Make sure the mtime moves even on filesystems with a coarse clock
+        os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        df = cache.read_csv(csv_file)
+
+        assert len(df) == 3
+        assert cache.stats()["misses"] == 2
+
+    def test_read_csv_missing_file(self, tmp_path):
+        cache = DatasetCache()
+
+        with pytest.raises(FileNotFoundError):
+            cache.read_csv(tmp_path / "missing.csv")
+
+    def test_invalidate(self, csv_file):
+        cache = DatasetCache()
+        cache.read_csv(csv_file)
+
+        cache.invalidate(csv_file)
+        cache.read_csv(csv_file)
+
+        assert cache.stats() == {"hits": 0, "misses": 2, "entries": 1}
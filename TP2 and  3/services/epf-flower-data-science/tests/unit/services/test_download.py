@@ -0,0 +1,115 @@
+import hashlib
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import HTTPException
+
+from src.services.download import download_file
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 17)
+
+
+class LargeFileHandler(BaseHTTPRequestHandler):
+    """ Serve PAYLOAD with Range support. The first `drops` responses are cut
+        in the middle of the body to simulate a dropped connection.
+    """
+    drops = 0
+    ranges = []
+
+    def do_GET(self):
+        start = 0
+        range_header = self.headers.get("Range")
+        type(self).ranges.append(range_header)
+        if range_header:
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if type(self).drops:
+            type(self).drops -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadFile:
+
+    @pytest.fixture
+    def server_url(self):
+        LargeFileHandler.drops = 0
+        LargeFileHandler.ranges = []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), LargeFileHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_port}/iris.zip"
+        server.shutdown()
+        server.server_close()
+
+    @pytest.mark.asyncio
+    async def test_download_file(self, server_url, tmp_path):
+        sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+        path = await download_file(server_url, tmp_path / "iris.zip",
+                                   sha256=sha256, chunk_size=64 * 1024)
+
+        assert path.read_bytes() == PAYLOAD
+        assert not (tmp_path / "iris.zip.part").exists()
+
+    @pytest.mark.asyncio
+    async def test_download_file_resumes(self, server_url, tmp_path):
+        LargeFileHandler.drops = 1
+
+        path = await download_file(server_url, tmp_path / "iris.zip",
+                                   chunk_size=64 * 1024)
+
+        assert path.read_bytes() == PAYLOAD
+        assert LargeFileHandler.ranges[0] is None
+        assert LargeFileHandler.ranges[1].startswith("bytes=")
+        assert LargeFileHandler.ranges[1] != "bytes=0-"
+
+    @pytest.mark.asyncio
+    async def test_download_file_gives_up(self, server_url, tmp_path):
+        LargeFileHandler.drops = 10
+
+        with pytest.raises(HTTPException) as exc_info:
+            await download_file(server_url, tmp_path / "iris.zip",
+                                max_retries=1, chunk_size=64 * 1024)
+
+        assert exc_info.value.status_code == 502
+        assert not (tmp_path / "iris.zip").exists()
+
+    @pytest.mark.asyncio
+    async def test_download_file_checksum_mismatch(self, server_url, tmp_path):
+        with pytest.raises(HTTPException) as exc_info:
+            await download_file(server_url, tmp_path / "iris.zip", sha256="0" * 64)
+
+        assert exc_info.value.status_code == 502
+        assert "Checksum mismatch" in exc_info.value.detail
+        assert not (tmp_path / "iris.zip").exists()
+        assert not (tmp_path / "iris.zip.part").exists()
+
+    @pytest.mark.asyncio
+    async def test_download_file_invalid_url(self, tmp_path):
+        with pytest.raises(HTTPException) as exc_info:
+            await download_file("ftp://example.com/iris.zip", tmp_path / "iris.zip")
+
+        assert exc_info.value.status_code == 400
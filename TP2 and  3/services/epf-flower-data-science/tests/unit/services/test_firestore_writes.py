@@ -0,0 +1,97 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from src.schemas.parameters import Parameters
+from benchmarks.fakes import FakeFirestore
+from src.services.firestore import FirestoreClient
+
+FULL_DOCUMENT = {
+    "n_estimators": 100, "max_depth": 10, "min_samples_split": 2, "min_samples_leaf": 1,
+    "max_features": "sqrt", "max_leaf_nodes": 20, "criterion": "gini",
+}
+
+
+def _document(db: FakeFirestore, document_id: str = "parameters") -> dict:
+    return db.collection("parameters").document(document_id).get().to_dict()
+
+
+class TestFirestoreWrites:
+
+    def test_put_merges_known_fields(self):
+        db = FakeFirestore({("parameters", "parameters"): FULL_DOCUMENT})
+        client = FirestoreClient(db=db)
+
+        updated, status_code = client.put("parameters", "parameters", Parameters(n_estimators=5))
+
+        assert status_code == 201
+        assert updated == {**FULL_DOCUMENT, "n_estimators": 5}
+        assert _document(db) == {**FULL_DOCUMENT, "n_estimators": 5}
+        assert db.commits == 1
+
+    def test_put_replaces_partial_document(self):
+        db = FakeFirestore({("parameters", "parameters"): {"n_estimators": 100, "other": 1}})
+        client = FirestoreClient(db=db)
+
+        updated, status_code = client.put("parameters", "parameters", Parameters(max_depth=3))
+
+        assert status_code == 200
+        assert updated == {"max_depth": 3}
+        assert _document(db) == {"max_depth": 3}
+
+    def test_put_missing_document(self):
+        client = FirestoreClient(db=FakeFirestore())
+
+        with pytest.raises(HTTPException) as e:
+            client.put("parameters", "parameters", Parameters(n_estimators=5))
+        assert e.value.status_code == 404
+
+    def test_put_retries_on_conflict(self):
+        db = FakeFirestore({("parameters", "parameters"): FULL_DOCUMENT})
+        client = FirestoreClient(db=db)
+        reference = db.collection("parameters").document("parameters")
+        original_get = type(reference).get
+        concurrent_writes = []
+
+        def get(self, transaction=None, **kwargs):
+            snapshot = original_get(self, transaction=transaction, **kwargs)
+            if transaction is not None and not concurrent_writes:
+                # Another writer commits between the read and the commit
+                concurrent_writes.append(1)
+                original_set(self, {**FULL_DOCUMENT, "max_depth": 4})
+            return snapshot
+
+        original_set = type(reference).set
+        with patch.object(type(reference), "get", get):
+            updated, _ = client.put("parameters", "parameters", Parameters(n_estimators=5))
+
+        assert updated == {**FULL_DOCUMENT, "max_depth": 4, "n_estimators": 5}
+        assert _document(db) == updated
+        assert client.stats()["put"]["conflicts"] == 1
+        assert client.stats()["put"]["calls"] == 1
+
+    def test_put_many_in_one_commit(self):
+        db = FakeFirestore({("parameters", "iris"): {"n_estimators": 100, "max_depth": 3}})
+        client = FirestoreClient(db=db)
+
+        written = client.put_many("parameters", {
+            "iris": Parameters(n_estimators=10),
+            "penguins": Parameters(criterion="entropy"),
+        })
+
+        assert written == ["iris", "penguins"]
+        assert db.commits == 1
+        assert _document(db, "iris") == {"n_estimators": 10, "max_depth": 3}
+        assert _document(db, "penguins") == {"criterion": "entropy"}
+        assert client.stats()["put_many"]["documents"] == 2
+
+    def test_put_many_splits_large_batches(self):
+        db = FakeFirestore()
+        client = FirestoreClient(db=db)
+
+        with patch("src.services.firestore.BATCH_MAX_WRITES", new=2):
+            client.put_many("parameters", {str(i): Parameters(n_estimators=i + 1) for i in range(5)})
+
+        assert db.commits == 3
+        assert _document(db, "4") == {"n_estimators": 5}
@@ -0,0 +1,86 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from src.services.model_store import ModelHolder, flat_forest_path
+from src.services.predict import FlatForest, get_flat_forest
+from src.services.train import save_flat_forest, save_iris_model
+
+FEATURES = ["id", "sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+
+@pytest.fixture(scope="module")
+def model() -> RandomForestClassifier:
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, 5)), columns=FEATURES)
+    y = np.select([X["petal_length"] > 0.5, X["sepal_width"] > 0],
+                  ["virginica", "versicolor"], "setosa")
+    return RandomForestClassifier(n_estimators=30, max_depth=8, random_state=0).fit(X, y)
+
+
+class TestFlatForest:
+
+    @pytest.mark.parametrize("rows", [1, 32, 1024])
+    def test_same_outputs_as_sklearn(self, model, rows):
+        X = np.random.default_rng(rows).normal(size=(rows, 5))
+        forest = FlatForest.from_model(model)
+
+        expected = model.predict_proba(pd.DataFrame(X, columns=FEATURES))
+        np.testing.assert_allclose(forest.predict_proba(X), expected, atol=1e-12)
+        assert forest.predict(X).tolist() == model.classes_[expected.argmax(axis=1)].tolist()
+
+    def test_thresholds_compared_in_float32(self, model):
+        forest = FlatForest.from_model(model)
+        # Values on both sides of the float32 rounding of a threshold
+        node = int(np.flatnonzero(forest.children[::2] != np.arange(len(forest.feature)))[0])
+        threshold = forest.threshold[node]
+        X = np.zeros((3, 5))
+        X[:, forest.feature[node]] = [threshold, np.nextafter(threshold, np.inf),
+                                      np.nextafter(threshold, -np.inf)]
+
+        expected = model.predict_proba(pd.DataFrame(X, columns=FEATURES))
+        np.testing.assert_allclose(forest.predict_proba(X), expected, atol=1e-12)
+
+    def test_save_and_load(self, model, tmp_path: Path):
+        path = save_flat_forest(model, tmp_path / "model.forest.npz")
+        forest = FlatForest.load(path)
+
+        X = np.random.default_rng(2).normal(size=(50, 5))
+        np.testing.assert_allclose(
+            forest.predict_proba(X), FlatForest.from_model(model).predict_proba(X))
+        assert forest.classes_.tolist() == model.classes_.tolist()
+        assert forest.feature_names_in_.tolist() == FEATURES
+
+
+class TestExportedFlatForest:
+
+    @pytest.fixture
+    def holder(self, model, tmp_path: Path) -> ModelHolder:
+        holder = ModelHolder(tmp_path / "iris_model.joblib", mode="raw")
+        with patch("src.services.train.model_holder", new=holder), \
+                patch("src.services.predict.model_holder", new=holder), \
+                patch("src.services.train.save_artifacts"):
+            save_iris_model(model, {}, None, None)
+            yield holder
+
+    def test_export_of_the_loaded_version_is_served(self, holder):
+        with patch.object(FlatForest, "from_model", side_effect=AssertionError):
+            forest = get_flat_forest()
+
+        assert forest.model_version == holder.current().version
+        X = np.random.default_rng(3).normal(size=(20, 5))
+        np.testing.assert_allclose(
+            forest.predict_proba(X), holder.get().predict_proba(pd.DataFrame(X, columns=FEATURES)))
+
+    def test_stale_export_is_not_served(self, model, holder):
+        save_flat_forest(model, flat_forest_path(holder.path), model_version="stale")
+
+        with patch.object(FlatForest, "from_model", wraps=FlatForest.from_model) as from_model:
+            forest = get_flat_forest()
+
+        from_model.assert_called_once()
+        assert forest.model_version is None
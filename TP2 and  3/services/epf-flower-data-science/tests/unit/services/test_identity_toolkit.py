@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.fakes import create_identity_toolkit_app
+from src.services.identity_toolkit import IdentityToolkitClient
+
+
+def _client(app=None, handler=None, **kwargs) -> IdentityToolkitClient:
+    transport = httpx.ASGITransport(app=app) if app is not None else httpx.MockTransport(handler)
+    return IdentityToolkitClient(base_url="http://identity-toolkit", api_key="key",
+                                 transport=transport, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch("src.services.identity_toolkit.RETRY_BACKOFF", new=0):
+        yield
+
+
+class TestIdentityToolkitClient:
+
+    @pytest.mark.asyncio
+    async def test_sign_up_and_sign_in(self):
+        client = _client(create_identity_toolkit_app())
+
+        signed_up = await client.sign_up("test@example.com", "password123")
+        signed_in = await client.sign_in_with_password("test@example.com", "password123")
+        wrong_password = await client.sign_in_with_password("test@example.com", "nope")
+        await client.aclose()
+
+        assert signed_up.status_code == 200
+        assert signed_in.json()["localId"] == signed_up.json()["localId"]
+        assert signed_in.json()["idToken"]
+        assert wrong_password.status_code == 400
+        assert wrong_password.json()["error"]["message"] == "INVALID_PASSWORD"
+
+    @pytest.mark.asyncio
+    async def test_existing_email(self):
+        client = _client(create_identity_toolkit_app({"test@example.com": "password123"}))
+
+        response = await client.sign_up("test@example.com", "password123")
+
+        assert response.json()["error"]["message"] == "EMAIL_EXISTS"
+
+    @pytest.mark.asyncio
+    async def test_reuses_one_connection_pool(self):
+        client = _client(create_identity_toolkit_app({"test@example.com": "password123"}))
+
+        await asyncio.gather(*[client.sign_in_with_password("test@example.com", "password123")
+                               for _ in range(5)])
+
+        assert client._get_client() is client._get_client()
+        assert client.stats() == {"requests": 5, "retries": 0}
+
+    @pytest.mark.asyncio
+    async def test_sign_in_retries_server_errors(self):
+        statuses = iter([503, 500, 200])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert request.url.params["key"] == "key"
+            return httpx.Response(next(statuses), json={"idToken": "token"})
+
+        client = _client(handler=handler, max_retries=2)
+        response = await client.sign_in_with_password("test@example.com", "password123")
+
+        assert response.status_code == 200
+        assert client.stats() == {"requests": 3, "retries": 2}
+
+    @pytest.mark.asyncio
+    async def test_sign_in_gives_up(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ReadTimeout("timeout", request=request)
+
+        client = _client(handler=handler, max_retries=1)
+        with pytest.raises(HTTPException) as exc_info:
+            await client.sign_in_with_password("test@example.com", "password123")
+        assert exc_info.value.status_code == 504
+        assert isinstance(exc_info.value.__cause__, httpx.ReadTimeout)
+        assert client.stats()["requests"] == 2
+
+    @pytest.mark.asyncio
+    async def test_unreachable(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("refused", request=request)
+
+        client = _client(handler=handler, max_retries=1)
+        with pytest.raises(HTTPException) as exc_info:
+            await client.sign_up("test@example.com", "password123")
+        assert exc_info.value.status_code == 502
+        assert client.stats()["requests"] == 2
+
+    @pytest.mark.asyncio
+    async def test_sign_up_is_not_retried_once_sent(self):
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if len(calls) == 1:
+                raise httpx.ConnectError("refused", request=request)
+            if len(calls) == 2:
+                raise httpx.ReadTimeout("timeout", request=request)
+            return httpx.Response(200, json={})
+
+        client = _client(handler=handler, max_retries=3)
+        with pytest.raises(HTTPException) as exc_info:
+            await client.sign_up("test@example.com", "password123")
+        assert exc_info.value.status_code == 504
+        assert len(calls) == 2
+
+    def test_client_of_a_previous_loop_is_closed(self):
+        client = _client(create_identity_toolkit_app({"test@example.com": "password123"}))
+
+        async def sign_in() -> httpx.AsyncClient:
+            await client.sign_in_with_password("test@example.com", "password123")
+            await asyncio.sleep(0)
+            return client._client
+
+        first = asyncio.run(sign_in())
+        second = asyncio.run(sign_in())
+
+        assert second is not first
+        assert first.is_closed
+        assert not second.is_closed
+        assert client._closing == set()
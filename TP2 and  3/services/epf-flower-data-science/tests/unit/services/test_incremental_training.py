@@ -0,0 +1,150 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.services.model_store import ModelHolder, read_model_metadata
+from src.services.train import train_and_evaluate_iris, train_incremental_iris
+
+
+def _iris(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    species = np.array(["setosa", "versicolor", "virginica"])[np.arange(rows) % 3]
+    centers = {"setosa": 1.0, "versicolor": 4.0, "virginica": 6.0}
+    petal_length = np.array([centers[s] for s in species]) + rng.normal(0, 0.3, rows)
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "sepal_length": rng.normal(5.8, 0.5, rows),
+        "sepal_width": rng.normal(3.0, 0.4, rows),
+        "petal_length": petal_length,
+        "petal_width": petal_length / 3,
+        "species": species,
+    })
+
+
+class TestIncrementalTraining:
+
+    @pytest.fixture
+    def holder(self, tmp_path: Path) -> ModelHolder:
+        holder = ModelHolder(tmp_path / "iris_model.joblib")
+        config = {"n_estimators": 20, "max_depth": 5, "random_state": 0}
+        with patch("src.services.train.model_holder", new=holder), \
+                patch("src.services.train.load_model_config", return_value=config):
+            yield holder
+
+    def _train(self, iris: pd.DataFrame, function=train_incremental_iris) -> dict:
+        with patch("src.services.train.get_processed_iris", return_value=iris):
+            return function(reload_model=False)
+
+    def test_full_training_without_metadata(self, holder):
+        result = self._train(_iris(300))
+
+        assert result["mode"] == "full"
+        metadata = read_model_metadata(holder.path)
+        assert metadata["dataset_rows"] == 300
+        assert metadata["base_estimators"] == 20
+        assert [entry["mode"] for entry in metadata["lineage"]] == ["full"]
+
+    def test_adds_trees_for_appended_rows(self, holder):
+        iris = _iris(330)
+        self._train(iris.iloc[:300], train_and_evaluate_iris)
+
+        result = self._train(iris)
+
+        assert result["mode"] == "incremental"
+        assert result["metrics"]["new_rows"] == 30
+        assert result["metrics"]["trees_added"] == 2
+        assert result["metrics"]["trees"] == 22
+        assert result["metrics"]["new_rows_accuracy_after"] >= 0.9
+        assert holder.get().n_estimators == 22
+        assert not holder.get().warm_start
+
+        metadata = read_model_metadata(holder.path)
+        assert metadata["dataset_rows"] == 330
+        assert [entry["mode"] for entry in metadata["lineage"]] == ["incremental", "full"]
+        assert metadata["lineage"][0]["train_rows"] <= 300 + 30
+
+    def test_history_sample_is_bounded(self, holder):
+        iris = _iris(330)
+        self._train(iris.iloc[:300], train_and_evaluate_iris)
+
+        with patch("src.services.train.get_processed_iris", return_value=iris):
+            result = train_incremental_iris(reload_model=False, history_rows=50)
+
+        # 50 older rows and the 24 new rows that are not held out
+        assert result["metrics"]["train_rows"] == 74
+
+    def test_held_out_rows_are_never_trained_on(self, holder):
+        iris = _iris(330)
+        self._train(iris.iloc[:300], train_and_evaluate_iris)
+        test_rows = read_model_metadata(holder.path)["test_rows"]
+
+        result = self._train(iris)
+
+        metadata = read_model_metadata(holder.path)
+        # All of the 240 rows of the full training, and 24 of the 30 new rows
+        assert len(test_rows) == 60
+        assert result["metrics"]["train_rows"] == 240 + 24
+        assert result["metrics"]["eval_rows"] == 6
+        assert set(test_rows) < set(metadata["test_rows"])
+        new_test_rows = set(metadata["test_rows"]) - set(test_rows)
+        assert len(new_test_rows) == 6 and min(new_test_rows) >= 300
+
+    def test_full_training_without_held_out_rows(self, holder):
+        iris = _iris(330)
+        self._train(iris.iloc[:300], train_and_evaluate_iris)
+        metadata = read_model_metadata(holder.path)
+        del metadata["test_rows"]
+        holder.path.with_name("iris_model.meta.json").write_text(json.dumps(metadata))
+
+        result = self._train(iris)
+
+        assert result["mode"] == "full"
+        assert result["reason"] == "The model has no record of its held-out rows"
+
+    def test_full_training_of_a_model_trained_on_the_id(self, holder):
+        iris = _iris(330)
+        self._train(iris.iloc[:300], train_and_evaluate_iris)
+        model = holder.get()
+        model.fit(iris.iloc[:300].drop(columns="species"), iris["species"].iloc[:300])
+        joblib.dump(model, holder.path)
+
+        result = self._train(iris)
+
+        assert result["mode"] == "full"
+        assert result["reason"] == "The model was trained on other features"
+        assert "id" not in joblib.load(holder.path).feature_names_in_
+
+    def test_unchanged_dataset(self, holder):
+        iris = _iris(300)
+        self._train(iris, train_and_evaluate_iris)
+
+        result = self._train(iris)
+
+        assert result["mode"] == "unchanged"
+        assert len(read_model_metadata(holder.path)["lineage"]) == 1
+
+    def test_full_refit_when_trained_rows_changed(self, holder):
+        iris = _iris(330)
+        self._train(iris.iloc[:300], train_and_evaluate_iris)
+
+        edited = iris.copy()
+        edited.loc[0, "sepal_length"] += 1
+        result = self._train(edited)
+
+        assert result["mode"] == "full"
+        assert result["reason"] == "The rows the model was trained on changed"
+
+    def test_full_refit_when_forest_too_large(self, holder):
+        iris = _iris(600)
+        self._train(iris.iloc[:100], train_and_evaluate_iris)
+
+        with patch("src.services.train.INCREMENTAL_MAX_GROWTH", new=1):
+            result = self._train(iris)
+
+        assert result["mode"] == "full"
+        assert holder.get().n_estimators == 20
@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+from src.services.jobs import JobManager, active_jobs, prune_jobs, write_job
+
+release = threading.Event()
+
+
+def _train(value: int) -> dict:
+    release.wait(timeout=5)
+    if value < 0:
+        raise ValueError("negative value")
+    return {"value": value * 2}
+
+
+def _double(value: int) -> dict:
+    if value < 0:
+        raise ValueError("negative value")
+    return {"value": value * 2}
+
+
+class TestJobManager:
+
+    @pytest.fixture
+    def manager(self, tmp_path: Path):
+        release.clear()
+        manager = JobManager(tmp_path / "jobs", max_jobs=1, max_queued=1,
+                             executor_factory=lambda workers: ThreadPoolExecutor(workers))
+        yield manager
+        release.set()
+        manager.shutdown()
+
+    def test_job_lifecycle(self, manager):
+        results = []
+        job = manager.submit("training", _train, {"value": 21}, on_success=results.append)
+        assert manager.get(job["job_id"])["state"] in ("queued", "running")
+
+        release.set()
+        manager.shutdown()
+
+        record = manager.get(job["job_id"])
+        assert record["state"] == "succeeded"
+        assert record["result"] == {"value": 42}
+        assert record["run_seconds"] >= 0
+        assert results == [{"value": 42}]
+
+    def test_job_failure(self, manager):
+        release.set()
+        job = manager.submit("training", _train, {"value": -1})
+        manager.shutdown()
+
+        record = manager.get(job["job_id"])
+        assert record["state"] == "failed"
+        assert record["error"] == "ValueError: negative value"
+
+    def test_concurrency_limit(self, manager):
+        manager.submit("training", _train, {"value": 1})
+        manager.submit("training", _train, {"value": 2})
+
+        with pytest.raises(HTTPException) as exc_info:
+            manager.submit("training", _train, {"value": 3})
+
+        assert exc_info.value.status_code == 429
+
+    def test_shutdown_fails_queued_jobs(self, manager):
+        running = manager.submit("training", _train, {"value": 1})
+        queued = manager.submit("training", _train, {"value": 2})
+        # Let the running job finish once the shutdown cancelled the queue
+        threading.Timer(0.2, release.set).start()
+        manager.shutdown()
+
+        assert manager.get(running["job_id"])["state"] == "succeeded"
+        record = manager.get(queued["job_id"])
+        assert record["state"] == "failed"
+        assert record["error"].startswith("Cancelled")
+        assert active_jobs(manager.jobs_dir) == []
+
+    def test_unknown_job(self, manager):
+        with pytest.raises(HTTPException) as exc_info:
+            manager.get("unknown")
+
+        assert exc_info.value.status_code == 404
+
+    def test_finished_records_are_pruned(self, tmp_path: Path):
+        jobs_dir = tmp_path / "jobs"
+        for i, state in enumerate(["succeeded", "failed", "running", "succeeded", "queued"]):
+            write_job(jobs_dir, {"job_id": f"job{i}", "state": state,
+                                 "submitted_at": i, "finished_at": i})
+
+        assert prune_jobs(jobs_dir, keep=1) == 2
+        assert sorted(path.stem for path in jobs_dir.glob("*.json")) == ["job2", "job3", "job4"]
+
+    def test_submit_prunes_records(self, tmp_path: Path):
+        manager = JobManager(tmp_path / "jobs", keep=2,
+                             executor_factory=lambda workers: ThreadPoolExecutor(workers))
+        release.set()
+        jobs = []
+        for value in range(4):
+            jobs.append(manager.submit("training", _train, {"value": value}))
+            manager.shutdown()
+
+        assert sorted(path.stem for path in manager.jobs_dir.glob("*.json")) == sorted(
+            job["job_id"] for job in jobs[1:])
+
+
+class TestProcessPool:
+
+    def test_jobs_run_in_worker_processes(self, tmp_path: Path):
+        manager = JobManager(tmp_path / "jobs", max_jobs=1, max_queued=1)
+        results = []
+
+        succeeded = manager.submit("training", _double, {"value": 21}, on_success=results.append)
+        failed = manager.submit("training", _double, {"value": -1})
+        manager.shutdown()
+
+        record = manager.get(succeeded["job_id"])
+        assert record["state"] == "succeeded"
+        assert record["result"] == {"value": 42}
+        assert results == [{"value": 42}]
+        record = manager.get(failed["job_id"])
+        assert record["state"] == "failed"
+        assert record["error"] == "ValueError: negative value"
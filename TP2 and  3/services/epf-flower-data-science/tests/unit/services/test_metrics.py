@@ -0,0 +1,113 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.services.metrics import FIREBASE_CALL_DURATION, UNMATCHED_ROUTE, timed
+
+SERVICE_ROOT = Path(__file__).resolve().parents[3]
+
+WORKER = """
+from src.services.metrics import CACHE_REQUESTS, REQUESTS_IN_PROGRESS
+CACHE_REQUESTS.labels(cache="dataset", result="hit").inc(%d)
+REQUESTS_IN_PROGRESS.labels(method="GET", route="/hello/{name}").inc()
+"""
+
+SCRAPE = """
+from src.services.metrics import render
+print(render()[0].decode())
+"""
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _run(code: str, env: dict) -> str:
+    return subprocess.run([sys.executable, "-c", code], cwd=SERVICE_ROOT, env=env,
+                          capture_output=True, text=True, check=True).stdout
+
+
+class TestMetrics:
+    @pytest.fixture
+    def client(self) -> TestClient:
+        from main import get_application
+
+        return TestClient(get_application(), base_url="http://testserver")
+
+    def test_requests_by_route_template(self, client):
+        labels = {"method": "GET", "route": "/hello/{name}"}
+        before = _sample("http_requests_total", status="200", **labels)
+        count_before = _sample("http_request_duration_seconds_count", **labels)
+
+        client.get("/hello/alice")
+        client.get("/hello/bob")
+
+        assert _sample("http_requests_total", status="200", **labels) == before + 2
+        assert _sample("http_request_duration_seconds_count", **labels) == count_before + 2
+        assert _sample("http_requests_in_progress", **labels) == 0
+
+    def test_unmatched_paths_share_a_label(self, client):
+        labels = {"method": "GET", "route": UNMATCHED_ROUTE, "status": "404"}
+        before = _sample("http_requests_total", **labels)
+
+        client.get("/nowhere/1")
+        client.get("/nowhere/2")
+
+        assert _sample("http_requests_total", **labels) == before + 2
+
+    def test_rate_limit_rejections(self, client):
+        labels = {"method": "GET", "route": "/hello/{name}"}
+        before = _sample("rate_limit_rejections_total", **labels)
+
+        responses = [client.get("/hello/carol") for _ in range(6)]
+
+        assert responses[-1].status_code == 429
+        assert _sample("rate_limit_rejections_total", **labels) == before + 1
+        assert _sample("http_requests_total", status="429", **labels) >= 1
+
+    def test_rate_limit_rejections_of_unmatched_paths(self, client):
+        labels = {"method": "GET", "route": UNMATCHED_ROUTE}
+        before = _sample("rate_limit_rejections_total", **labels)
+
+        responses = [client.get("/nowhere/limited") for _ in range(6)]
+
+        assert responses[-1].status_code == 429
+        assert _sample("rate_limit_rejections_total", **labels) == before + 1
+        assert _sample("rate_limit_rejections_total", method="GET", route="/nowhere/limited") == 0
+
+    def test_metrics_route(self, client):
+        client.get("/hello/dave")
+        # Scrapes are not rate limited
+        responses = [client.get("/metrics") for _ in range(6)]
+
+        assert [response.status_code for response in responses] == [200] * 6
+        assert responses[-1].headers["content-type"].startswith("text/plain")
+        assert 'http_requests_total{method="GET",route="/hello/{name}",status="200"}' \
+            in responses[-1].text
+        assert "/metrics" not in client.get("/openapi.json").json()["paths"]
+
+    def test_timed(self):
+        before = _sample("firebase_call_duration_seconds_count", operation="test")
+
+        with timed(FIREBASE_CALL_DURATION, operation="test") as timer:
+            pass
+
+        assert timer.seconds >= 0
+        assert _sample("firebase_call_duration_seconds_count", operation="test") == before + 1
+
+    def test_workers_are_summed(self, tmp_path):
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        _run(WORKER % 2, env)
+        _run(WORKER % 3, env)
+
+        scraped = _run(SCRAPE, env)
+
+        assert 'cache_requests_total{cache="dataset",result="hit"} 5.0' in scraped
+        # The gauges of the processes that exited are still counted until
+        # gunicorn marks them dead
+        assert 'http_requests_in_progress{method="GET",route="/hello/{name}"} 2.0' in scraped
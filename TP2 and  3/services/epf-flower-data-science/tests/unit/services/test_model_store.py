@@ -0,0 +1,146 @@
+import os
+from pathlib import Path
+from typing import Optional
+from unittest.mock import patch
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+from sklearn.tree import DecisionTreeClassifier
+
+from src.services.model_store import (
+    ModelHolder, artifact_version, file_stamp, read_model_metadata, save_model)
+
+
+def _fit(depth: int, columns: Optional[list[str]] = None) -> DecisionTreeClassifier:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(50, 3))
+    y = (X[:, 0] > 0).astype(int)
+    if columns is not None:
+        X = pd.DataFrame(X, columns=columns)
+    return DecisionTreeClassifier(max_depth=depth, random_state=0).fit(X, y)
+
+
+class TestModelHolder:
+
+    @pytest.fixture
+    def model_path(self, tmp_path: Path) -> Path:
+        model_path = tmp_path / "model.joblib"
+        save_model(_fit(1), model_path)
+        return model_path
+
+    def test_loads_once(self, model_path):
+        holder = ModelHolder(model_path)
+
+        with patch("src.services.model_store.joblib.load", wraps=joblib.load) as mock_load:
+            first = holder.get()
+            second = holder.get()
+
+        assert first is second
+        mock_load.assert_called_once()
+        assert holder.info()["load_seconds"] >= 0
+
+    def test_swaps_new_artifact(self, model_path):
+        holder = ModelHolder(model_path)
+        old_version = holder.info()["version"]
+
+        save_model(_fit(3), model_path)
+        with patch("src.services.model_store.MODEL_RELOAD_INTERVAL", new=0):
+            model = holder.get()
+
+        assert model.max_depth == 3
+        assert holder.info()["version"] != old_version
+
+    def test_version_matches_the_loaded_artifact(self, model_path):
+        holder = ModelHolder(model_path)
+        load = joblib.load
+        replaced = []
+
+        def load_then_replace(*args, **kwargs):
+            model = load(*args, **kwargs)
+            if not replaced:
+                # Another process writes a new model during the first load
+                replaced.append(True)
+                save_model(_fit(3), model_path)
+            return model
+
+        with patch("src.services.model_store.joblib.load", side_effect=load_then_replace), \
+                patch.object(Path, "read_bytes", side_effect=AssertionError("artifact read")):
+            loaded = holder.current()
+
+        assert loaded.model.max_depth == 3
+        assert loaded.version == artifact_version(file_stamp(model_path))
+        assert not holder.is_stale()
+
+    def test_metadata_is_replaced_after_the_artifact(self, model_path):
+        replaced = []
+        replace = os.replace
+
+        def record_replace(src, dst):
+            replaced.append(Path(dst).name)
+            replace(src, dst)
+
+        with patch("src.services.model_store.os.replace", side_effect=record_replace):
+            save_model(_fit(3), model_path, metadata={"dataset_rows": 10})
+
+        assert replaced == ["model.joblib", "model.meta.json"]
+        assert read_model_metadata(model_path) == {"dataset_rows": 10}
+        assert sorted(path.name for path in model_path.parent.iterdir()) == [
+            "model.joblib", "model.meta.json"]
+
+    def test_metadata_is_kept_when_the_artifact_fails(self, model_path):
+        save_model(_fit(1), model_path, metadata={"dataset_rows": 10})
+
+        with patch("src.services.model_store.joblib.dump", side_effect=OSError("disk full")), \
+                pytest.raises(OSError):
+            save_model(_fit(3), model_path, metadata={"dataset_rows": 20})
+
+        assert read_model_metadata(model_path) == {"dataset_rows": 10}
+        assert len(list(model_path.parent.iterdir())) == 2
+
+    def test_keeps_model_when_artifact_removed(self, model_path):
+        holder = ModelHolder(model_path)
+        model = holder.get()
+
+        os.remove(model_path)
+        with patch("src.services.model_store.MODEL_RELOAD_INTERVAL", new=0):
+            assert holder.get() is model
+
+    def test_rejects_model_trained_on_other_features(self, model_path):
+        holder = ModelHolder(model_path, features=["a", "b"])
+
+        with patch("src.services.model_store.joblib.load", wraps=joblib.load) as mock_load:
+            for _ in range(2):
+                with pytest.raises(HTTPException) as exc_info:
+                    holder.get()
+        # The rejected artifact is not loaded again until it changes
+        mock_load.assert_called_once()
+        assert exc_info.value.status_code == 503
+        assert "trained on 3 features instead of a, b" in exc_info.value.detail
+
+        save_model(_fit(1, columns=["id", "a", "b"]), model_path)
+        with pytest.raises(HTTPException) as exc_info:
+            holder.get()
+        assert "trained on id, a, b instead of a, b" in exc_info.value.detail
+
+    def test_keeps_model_when_artifact_rejected(self, model_path):
+        save_model(_fit(1, columns=["a", "b", "c"]), model_path)
+        holder = ModelHolder(model_path, features=["a", "b", "c"])
+        model = holder.get()
+
+        save_model(_fit(3, columns=["id", "a", "b"]), model_path)
+        with patch("src.services.model_store.MODEL_RELOAD_INTERVAL", new=0):
+            assert holder.get() is model
+
+    def test_mmap_mode(self, model_path):
+        holder = ModelHolder(model_path, mmap_mode="r")
+
+        assert holder.get().max_depth == 1
+        assert holder.info()["mmap_mode"] == "r"
+
+    def test_save_model_is_atomic(self, model_path):
+        save_model(_fit(2), model_path)
+
+        assert [path.name for path in model_path.parent.iterdir()] == ["model.joblib"]
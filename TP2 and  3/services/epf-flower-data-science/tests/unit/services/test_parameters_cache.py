@@ -0,0 +1,134 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from src.schemas.parameters import Parameters
+from benchmarks.fakes import FakeFirestore, FakeWatch
+from src.services.firestore import FirestoreClient, ParametersCache
+
+KEY = ("parameters", "parameters")
+
+
+@pytest.fixture
+def db() -> FakeFirestore:
+    return FakeFirestore({KEY: {"n_estimators": 100, "criterion": "gini"}})
+
+
+def _cache(db: FakeFirestore, **kwargs) -> ParametersCache:
+    return ParametersCache(client_factory=lambda: FirestoreClient(db=db), **kwargs)
+
+
+class TestParametersCache:
+
+    def test_serves_from_memory(self, db):
+        cache = _cache(db, ttl=60)
+
+        first = cache.get(*KEY)
+        second = cache.get(*KEY)
+
+        assert first.to_dict() == {"n_estimators": 100, "criterion": "gini"}
+        assert second is first
+        assert db.reads == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_reads_again_after_ttl(self, db):
+        cache = _cache(db, ttl=60)
+        cache.get(*KEY)
+        db.collection(KEY[0]).document(KEY[1]).set({"n_estimators": 50})
+
+        assert cache.get(*KEY).n_estimators == 100
+        with patch("src.services.firestore.time.monotonic", return_value=1e12):
+            assert cache.get(*KEY).n_estimators == 50
+
+    def test_creates_one_client(self, db):
+        factory_calls = []
+
+        def factory():
+            factory_calls.append(1)
+            return FirestoreClient(db=db)
+
+        cache = ParametersCache(client_factory=factory, ttl=0)
+        cache.get(*KEY)
+        cache.get(*KEY)
+
+        assert len(factory_calls) == 1
+        assert db.reads == 2
+
+    def test_concurrent_misses_read_once(self, db):
+        cache = _cache(db, ttl=60)
+        threads = [threading.Thread(target=cache.get, args=KEY) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert db.reads == 1
+
+    def test_write_through(self, db):
+        cache = _cache(db, ttl=60)
+        cache.get(*KEY)
+
+        cache.put(*KEY, Parameters(n_estimators=10))
+
+        assert cache.get(*KEY).n_estimators == 10
+        assert db.reads == 2
+
+    def test_missing_document_is_not_cached(self):
+        cache = _cache(FakeFirestore(), ttl=60)
+
+        for _ in range(2):
+            with pytest.raises(FileExistsError):
+                cache.get(*KEY)
+        assert cache.stats()["misses"] == 2
+
+    def test_listener_pushes_updates(self, db):
+        cache = _cache(db, ttl=0, mode="listen")
+        assert cache.get(*KEY).n_estimators == 100
+
+        db.collection(KEY[0]).document(KEY[1]).set({"n_estimators": 7})
+
+        assert cache.get(*KEY).n_estimators == 7
+        assert cache.stats()["listeners"] == 1
+        assert cache.stats()["misses"] == 1
+
+        cache.close()
+        db.collection(KEY[0]).document(KEY[1]).set({"n_estimators": 8})
+        assert cache.stats()["listeners"] == 0
+
+    def test_listener_on_deleted_document_is_kept(self, db):
+        cache = _cache(db, ttl=60, mode="listen")
+        cache.get(*KEY)
+        db.collection(KEY[0]).document(KEY[1]).delete()
+
+        for _ in range(2):
+            with pytest.raises(FileExistsError):
+                cache.get(*KEY)
+
+        assert cache.stats()["listeners"] == 1
+        assert len(db._listeners[KEY]) == 1
+        db.collection(KEY[0]).document(KEY[1]).set({"n_estimators": 3})
+        assert cache.get(*KEY).n_estimators == 3
+
+    def test_listener_without_snapshot_is_dropped(self, db):
+        cache = _cache(db, ttl=60, mode="listen")
+        reference = db.collection(KEY[0]).document(KEY[1])
+
+        with patch.object(type(reference), "on_snapshot",
+                          lambda self, callback: FakeWatch(db, KEY, callback)), \
+                patch("src.services.firestore.SNAPSHOT_TIMEOUT", new=0.01):
+            assert cache.get(*KEY).n_estimators == 100
+
+        assert cache.stats()["listeners"] == 0
+
+    def test_listener_error_falls_back_to_reads(self, db):
+        cache = _cache(db, ttl=60, mode="listen")
+        assert cache.get(*KEY).n_estimators == 100
+
+        db.collection(KEY[0]).document(KEY[1]).set({"n_estimators": "not a number"})
+
+        assert cache.stats()["listeners"] == 0
+        assert cache.peek(*KEY) is None
+        db.collection(KEY[0]).document(KEY[1]).set({"n_estimators": 9})
+        assert cache.get(*KEY).n_estimators == 9
@@ -0,0 +1,121 @@
+import cProfile
+import pstats
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from src.schemas.firebase import FirebaseUser
+from src.services.profiling import ProfileStore, profiling_requested
+
+ADMIN = FirebaseUser(email="admin@example.com", user_id="admin", role="admin")
+USER = FirebaseUser(email="user@example.com", user_id="user", role="default")
+AUTHORIZATION = {"Authorization": "Bearer token"}
+
+
+def _profiler() -> cProfile.Profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    sum(range(1000))
+    profiler.disable()
+    return profiler
+
+
+def _scope(headers=(), query_string=b"") -> dict:
+    return {"headers": list(headers), "query_string": query_string}
+
+
+class TestProfileStore:
+
+    def test_keeps_the_latest_profiles(self, tmp_path):
+        store = ProfileStore(tmp_path, max_files=3)
+        ids = []
+        for i in range(5):
+            ids.append(store.new_id())
+            store.save(ids[-1], _profiler(), {"method": "GET", "path": f"/{i}"})
+
+        assert [profile["id"] for profile in store.list()] == ids[:1:-1]
+        assert store.list()[0]["path"] == "/4"
+        assert len(list(tmp_path.iterdir())) == 6
+        assert pstats.Stats(str(store.path(ids[-1]))).total_calls > 0
+
+    def test_unknown_profiles(self, tmp_path):
+        store = ProfileStore(tmp_path)
+
+        for profile_id in ["20260101T000000000000-00000000", "../secret", "x"]:
+            with pytest.raises(HTTPException) as error:
+                store.path(profile_id)
+            assert error.value.status_code == 404
+
+    def test_report(self, tmp_path):
+        store = ProfileStore(tmp_path)
+        profile_id = store.new_id()
+        store.save(profile_id, _profiler(), {})
+
+        assert "function calls" in store.report(profile_id)
+
+    def test_profiling_requested(self):
+        assert not profiling_requested(_scope())
+        assert not profiling_requested(_scope(query_string=b"test_size=0.2"))
+        assert profiling_requested(_scope([(b"x-profile", b"1")]))
+        assert not profiling_requested(_scope([(b"x-profile", b"0")], b"profile=1"))
+        assert profiling_requested(_scope(query_string=b"test_size=0.2&profile=true"))
+        assert profiling_requested(_scope(query_string=b"profile"))
+        assert not profiling_requested(_scope(query_string=b"profile=false"))
+
+
+class TestProfilingRoutes:
+    @pytest.fixture
+    def client(self, tmp_path) -> TestClient:
+        from main import get_application
+
+        app = get_application()
+        app.state.rate_limiter.enabled = False
+        app.state.profile_store.directory = tmp_path
+        return TestClient(app, base_url="http://testserver")
+
+    def test_requests_are_not_profiled_by_default(self, client):
+        response = client.get("/hello/alice")
+
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert client.app.state.profile_store.list() == []
+
+    def test_profile_a_request(self, client):
+        with patch("src.api.routes.authentication.verify_firebase_token", return_value=ADMIN):
+            response = client.get("/iris/predict/stats",
+                                  headers={**AUTHORIZATION, "X-Profile": "1"})
+            profile_id = response.headers["x-profile-id"]
+            profiles = client.get("/profiles", headers=AUTHORIZATION).json()
+            download = client.get(f"/profiles/{profile_id}", headers=AUTHORIZATION)
+            report = client.get(f"/profiles/{profile_id}?format=text&sort=tottime",
+                                headers=AUTHORIZATION)
+
+        assert response.status_code == 200
+        assert [(p["id"], p["method"], p["path"], p["status"]) for p in profiles] == [
+            (profile_id, "GET", "/iris/predict/stats", 200)]
+        assert download.status_code == 200
+        path = client.app.state.profile_store.path(profile_id)
+        assert download.content == path.read_bytes()
+        assert "get_batching_stats" in {name for _, _, name in pstats.Stats(str(path)).stats}
+        assert report.status_code == 200
+        assert "function calls" in report.text
+
+    def test_query_flag(self, client):
+        with patch("src.api.routes.authentication.verify_firebase_token", return_value=ADMIN):
+            response = client.get("/hello/alice?profile=1", headers=AUTHORIZATION)
+
+        assert "x-profile-id" in response.headers
+
+    def test_admins_only(self, client):
+        without_token = client.get("/hello/alice", headers={"X-Profile": "1"})
+        with patch("src.api.routes.authentication.verify_firebase_token", return_value=USER):
+            not_admin = client.get("/hello/alice", headers={**AUTHORIZATION, "X-Profile": "1"})
+            listing = client.get("/profiles", headers=AUTHORIZATION)
+
+        assert without_token.status_code == 401
+        assert not_admin.status_code == 401
+        assert not_admin.json() == {"detail": "Unauthorized access"}
+        assert listing.status_code == 401
+        assert client.app.state.profile_store.list() == []
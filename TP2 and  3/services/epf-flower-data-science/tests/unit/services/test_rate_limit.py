@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import threading
+from unittest.mock import patch
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from src.services.rate_limit import (
+    MemoryStorage, RateLimiter, RateLimitMiddleware, SQLiteStorage, server_workers,
+    sliding_window_hit, storage_from_uri)
+
+
+def _hits(path: str, count: int, queue) -> None:
+    storage = SQLiteStorage(path)
+    queue.put(sum(storage.hit("GET /hello/{name}:1.2.3.4", 10, 60)[0] for _ in range(count)))
+
+
+class TestSlidingWindow:
+
+    def test_allows_up_to_the_limit(self):
+        state, results = None, []
+        for _ in range(4):
+            state, allowed, remaining, _ = sliding_window_hit(state, 3, 60, now=600.0)
+            results.append((allowed, remaining))
+
+        assert results == [(True, 2), (True, 1), (True, 0), (False, 0)]
+
+    def test_previous_window_is_weighted(self):
+        state = (10, 0, 4)
+        # A quarter into the next window, 3 of the 4 previous requests count
+        state, allowed, remaining, _ = sliding_window_hit(state, 4, 60, now=675.0)
+        assert (state, allowed, remaining) == ((11, 4, 1), True, 0)
+
+        state, allowed, _, retry_after = sliding_window_hit(state, 4, 60, now=675.0)
+        assert not allowed
+        # A request is free again once the previous window weighs 4 * 0.5
+        assert retry_after == pytest.approx(15.0)
+
+    def test_counters_expire(self):
+        state, allowed, remaining, _ = sliding_window_hit((10, 5, 5), 5, 60, now=900.0)
+
+        assert (state, allowed, remaining) == ((15, 0, 1), True, 4)
+
+
+class TestStorages:
+
+    @pytest.mark.parametrize("storage_factory", [
+        MemoryStorage, lambda: SQLiteStorage(":memory:")])
+    def test_keys_are_counted_apart(self, storage_factory):
+        storage = storage_factory()
+
+        first = [storage.hit("a", 2, 60)[0] for _ in range(3)]
+        second = storage.hit("b", 2, 60)[0]
+        storage.reset()
+
+        assert first == [True, True, False]
+        assert second
+        assert storage.hit("a", 2, 60)[0]
+
+    def test_sqlite_counters_are_shared_by_processes(self, tmp_path):
+        path = str(tmp_path / "rate_limits.db")
+        SQLiteStorage(path)
+        queue = multiprocessing.get_context("spawn").Queue()
+        processes = [multiprocessing.get_context("spawn").Process(target=_hits, args=(path, 8, queue))
+                     for _ in range(3)]
+        for process in processes:
+            process.start()
+        allowed = sum(queue.get(timeout=60) for _ in processes)
+        for process in processes:
+            process.join()
+
+        assert allowed == 10
+
+    def test_storage_from_uri(self, tmp_path):
+        assert isinstance(storage_from_uri("memory://"), MemoryStorage)
+        storage = storage_from_uri(f"sqlite:///{tmp_path}/rate_limits.db")
+        assert storage.path == f"{tmp_path}/rate_limits.db"
+        with pytest.raises(ValueError):
+            storage_from_uri("redis://localhost:6379")
+
+
+class TestRateLimiter:
+
+    def test_route_limits(self):
+        limiter = RateLimiter(default="1/minute", limits={
+            "/iris/predict": "3/second", "GET /docs": "none"})
+
+        assert limiter.limit_for("POST", "/iris/predict") == "3/second"
+        assert limiter.limit_for("GET", "/docs") is None
+        assert limiter.limit_for("POST", "/docs") == "1/minute"
+
+    def test_stats(self):
+        limiter = RateLimiter(default="2/minute", limits={})
+        for _ in range(3):
+            limiter.hit("GET", "/hello/{name}", "1.2.3.4")
+        limiter.hit("GET", "/hello/{name}", "5.6.7.8")
+
+        stats = limiter.stats()
+        assert stats["allowed"] == 3
+        assert stats["rejected"] == 1
+        assert stats["routes"]["GET /hello/{name}"] == {
+            "limit": "2/minute", "allowed": 3, "rejected": 1}
+
+    def test_disabled(self):
+        limiter = RateLimiter(default="1/minute", enabled=False)
+
+        assert all(limiter.hit("GET", "/", "1.2.3.4")[0] for _ in range(3))
+
+    def test_server_workers(self):
+        assert server_workers(["gunicorn", "main:app", "-w", "4"]) == 4
+        assert server_workers(["gunicorn", "main:app", "-w4"]) == 4
+        assert server_workers(["uvicorn", "main:app", "--workers=3"]) == 3
+        with patch.dict("os.environ", {"WEB_CONCURRENCY": "2"}):
+            assert server_workers(["uvicorn", "main:app"]) == 2
+        with patch.dict("os.environ", {"WEB_CONCURRENCY": ""}):
+            assert server_workers(["uvicorn", "main:app"]) == 1
+
+    def test_warns_when_workers_count_apart(self, caplog):
+        with caplog.at_level(logging.WARNING, logger="src.services.rate_limit"), \
+                patch("src.services.rate_limit.server_workers", return_value=4):
+            RateLimiter("memory://")
+            RateLimiter("memory://", enabled=False)
+
+        assert len(caplog.records) == 1
+        assert "4 times the limits" in caplog.records[0].getMessage()
+
+    @pytest.mark.asyncio
+    async def test_sqlite_hits_run_off_the_event_loop(self, tmp_path):
+        limiter = RateLimiter(f"sqlite:///{tmp_path}/rate_limits.db", default="1/minute")
+        hit = limiter.hit
+        threads = []
+
+        def record_thread(*args):
+            threads.append(threading.get_ident())
+            return hit(*args)
+
+        limiter.hit = record_thread
+        app = Starlette(routes=[Route("/", lambda request: PlainTextResponse("ok"))])
+        middleware = RateLimitMiddleware(app, limiter)
+        scope = {"type": "http", "method": "GET", "path": "/", "raw_path": b"/",
+                 "root_path": "", "query_string": b"", "headers": [], "scheme": "http",
+                 "server": ("testserver", 80), "client": ("1.2.3.4", 1), "app": app}
+        statuses = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await middleware(scope, receive, send)
+        await middleware(scope, receive, send)
+
+        assert statuses == [200, 429]
+        assert threading.get_ident() not in threads
@@ -0,0 +1,65 @@
+import json
+import multiprocessing
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src.services.registry import DatasetRegistry
+
+
+def _add_datasets(path: Path, worker: int, count: int) -> None:
+    registry = DatasetRegistry(path)
+    for i in range(count):
+        name = f"w{worker}d{i}"
+        registry.update(lambda datasets: datasets.__setitem__(
+            name, {"name": name, "url": "https://test.fr/"}))
+
+
+class TestDatasetRegistry:
+
+    @pytest.fixture
+    def config_file(self, tmp_path: Path) -> Path:
+        config_file = tmp_path / "urls_config.json"
+        config_file.write_text(json.dumps(
+            {"test1": {"name": "test1", "url": "https://test1.fr/"}}))
+        return config_file
+
+    def test_reads_are_served_from_memory(self, config_file):
+        registry = DatasetRegistry(config_file)
+        registry.get_all()
+
+        with patch("builtins.open", side_effect=AssertionError("file read")):
+            assert registry.get("test1") == {"name": "test1", "url": "https://test1.fr/"}
+
+    def test_picks_up_changes_from_other_workers(self, config_file):
+        worker_1 = DatasetRegistry(config_file)
+        worker_2 = DatasetRegistry(config_file)
+        worker_1.get_all()
+
+        worker_2.update(lambda datasets: datasets.pop("test1"))
+
+        with patch("src.services.registry.REGISTRY_REFRESH_INTERVAL", new=0):
+            assert worker_1.get_all() == {}
+
+    def test_update_keeps_the_file_mode(self, config_file):
+        config_file.chmod(0o664)
+
+        DatasetRegistry(config_file).update(lambda datasets: datasets.pop("test1"))
+
+        assert config_file.stat().st_mode & 0o777 == 0o664
+
+    def test_concurrent_updates_are_not_lost(self, config_file):
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=_add_datasets, args=(config_file, worker, 10))
+                     for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        datasets = json.loads(config_file.read_text())
+        assert len(datasets) == 1 + 4 * 10
+        # No temporary file is left behind, only the config and its lock file
+        assert sorted(path.name for path in config_file.parent.iterdir()) == [
+            "urls_config.json", "urls_config.json.lock"]
@@ -0,0 +1,172 @@
+import gc
+import os
+import runpy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from src.services.jobs import JobManager, active_jobs
+from src.services.model_store import ModelHolder, save_model
+from src.services.serving import ArtifactWatcher, preload, worker_count
+
+SERVICE_ROOT = Path(__file__).resolve().parents[3]
+
+
+def _fit(depth: int) -> DecisionTreeClassifier:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(50, 3))
+    y = (X[:, 0] > 0).astype(int)
+    return DecisionTreeClassifier(max_depth=depth, random_state=0).fit(X, y)
+
+
+release = threading.Event()
+
+
+def _save_and_wait(path: str) -> dict:
+    save_model(_fit(3), Path(path))
+    release.wait(timeout=5)
+    return {}
+
+
+class TestServing:
+
+    def test_worker_count(self):
+        with patch.dict(os.environ, {"WEB_CONCURRENCY": "3"}):
+            assert worker_count() == 3
+        with patch.dict(os.environ, {"WEB_CONCURRENCY": ""}):
+            assert worker_count() >= 1
+
+    def test_preload_freezes_loaded_objects(self):
+        with patch("src.services.serving.model_holder") as mock_holder, \
+                patch("src.services.predict.get_flat_forest") as mock_flat_forest, \
+                patch("src.services.data.get_processed_iris", side_effect=FileNotFoundError):
+            preload()
+        try:
+            mock_holder.current.assert_called_once()
+            mock_flat_forest.assert_called_once()
+            assert gc.get_freeze_count() > 0
+        finally:
+            gc.unfreeze()
+
+    def test_watcher_reloads_new_artifact(self, tmp_path: Path):
+        model_path = tmp_path / "model.joblib"
+        save_model(_fit(1), model_path)
+        holder = ModelHolder(model_path)
+        first = holder.current()
+        on_change = MagicMock()
+        watcher = ArtifactWatcher(on_change, holder=holder, busy=lambda: False)
+
+        assert not watcher.check()
+        save_model(_fit(3), model_path)
+        assert watcher.check()
+        # The watcher thread only requests the reload, once
+        assert not watcher.check()
+        on_change.assert_called_once()
+        assert holder.current() is first
+
+        assert watcher.apply()
+        assert not watcher.apply()
+        assert holder.current() is not first
+        assert watcher.reloads == 1
+
+    def test_watcher_waits_for_training_jobs(self, tmp_path: Path):
+        model_path = tmp_path / "model.joblib"
+        save_model(_fit(1), model_path)
+        holder = ModelHolder(model_path)
+        holder.current()
+        manager = JobManager(tmp_path / "jobs", max_jobs=1,
+                             executor_factory=lambda workers: ThreadPoolExecutor(workers))
+        release.clear()
+        on_change = MagicMock()
+        watcher = ArtifactWatcher(on_change, holder=holder,
+                                  busy=lambda: bool(active_jobs(manager.jobs_dir)))
+
+        # The job saves the new model, then goes on with its work
+        job = manager.submit("training", _save_and_wait, {"path": str(model_path)})
+        while not holder.is_stale():
+            time.sleep(0.01)
+        assert not watcher.check()
+        assert not watcher.check()
+
+        release.set()
+        manager.shutdown()
+        assert manager.get(job["job_id"])["state"] == "succeeded"
+        assert watcher.check()
+        on_change.assert_called_once()
+        assert watcher.apply()
+
+    def test_watcher_reloads_after_max_defer(self, tmp_path: Path):
+        model_path = tmp_path / "model.joblib"
+        save_model(_fit(1), model_path)
+        holder = ModelHolder(model_path)
+        holder.current()
+        watcher = ArtifactWatcher(MagicMock(), holder=holder, busy=lambda: True, max_defer=0)
+
+        save_model(_fit(3), model_path)
+
+        assert watcher.check()
+
+    def test_watcher_skips_a_broken_artifact(self, tmp_path: Path):
+        model_path = tmp_path / "model.joblib"
+        save_model(_fit(1), model_path)
+        holder = ModelHolder(model_path)
+        first = holder.current()
+        on_change = MagicMock()
+        watcher = ArtifactWatcher(on_change, holder=holder, busy=lambda: False)
+
+        model_path.write_bytes(b"not a model")
+        assert watcher.check()
+        assert not watcher.apply()
+        # The master keeps its model and is not sent a HUP for the same file
+        assert holder.current() is first
+        assert not watcher.check()
+
+        save_model(_fit(3), model_path)
+        assert watcher.check()
+        assert watcher.apply()
+        assert on_change.call_count == 2
+
+    def test_gunicorn_config(self):
+        with patch.dict(os.environ, {"WEB_CONCURRENCY": "2"}):
+            config = runpy.run_path(str(SERVICE_ROOT / "gunicorn.conf.py"))
+            assert os.environ["RATE_LIMIT_STORAGE_URI"].startswith("sqlite:///")
+
+        assert config["workers"] == 2
+        assert config["preload_app"]
+        assert config["worker_class"] == "uvicorn.workers.UvicornWorker"
+
+    def test_gunicorn_config_reloads_the_model_on_hup(self):
+        config = runpy.run_path(str(SERVICE_ROOT / "gunicorn.conf.py"))
+        server = MagicMock()
+
+        config["on_reload"](server)
+
+        server.artifact_watcher.apply.assert_called_once_with()
+
+    def test_gunicorn_config_without_preload(self):
+        with patch.dict(os.environ, {"GUNICORN_PRELOAD": "0"}):
+            os.environ.pop("MODEL_RELOAD_INTERVAL", None)
+            config = runpy.run_path(str(SERVICE_ROOT / "gunicorn.conf.py"))
+            # The workers watch the model artifact themselves
+            assert "MODEL_RELOAD_INTERVAL" not in os.environ
+
+        assert not config["preload_app"]
+
+    def test_gunicorn_config_clears_the_metrics_once(self, tmp_path):
+        stale = tmp_path / "counter_1.db"
+        stale.touch()
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}):
+            os.environ.pop("METRICS_DIR_CLEARED_BY", None)
+            runpy.run_path(str(SERVICE_ROOT / "gunicorn.conf.py"))
+            assert not stale.exists()
+
+            # A HUP runs the file again in the same master
+            live = tmp_path / "counter_2.db"
+            live.touch()
+            runpy.run_path(str(SERVICE_ROOT / "gunicorn.conf.py"))
+            assert live.exists()
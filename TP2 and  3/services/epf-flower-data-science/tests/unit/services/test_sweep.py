@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from src.schemas.parameters import SweepRange, SweepRequest
+from src.services.sweep import expand_space, halving_rounds, successive_halving
+
+
+class TestSweep:
+
+    def test_expand_space(self):
+        candidates = expand_space(
+            {"n_estimators": SweepRange(min=10, max=30, step=10),
+             "criterion": ["gini", "entropy"]},
+            max_candidates=100, random_state=0)
+
+        assert len(candidates) == 6
+        assert {"n_estimators": 20, "criterion": "entropy"} in candidates
+
+    def test_expand_space_sampled(self):
+        candidates = expand_space(
+            {"n_estimators": SweepRange(min=1, max=100)}, max_candidates=10, random_state=0)
+
+        assert len(candidates) == 10
+        assert len({candidate["n_estimators"] for candidate in candidates}) == 10
+
+    def test_expand_space_large_grid(self):
+        space = {"n_estimators": SweepRange(min=1, max=999),
+                 "max_depth": SweepRange(min=1, max=999),
+                 "min_samples_leaf": SweepRange(min=1, max=999)}
+
+        # A billion candidates: drawn without building the grid
+        candidates = expand_space(space, max_candidates=50, random_state=0)
+
+        assert len(candidates) == 50
+        assert len({tuple(candidate.values()) for candidate in candidates}) == 50
+        assert all(1 <= candidate["max_depth"] <= 999 for candidate in candidates)
+
+    def test_sweep_space_is_bounded(self):
+        with pytest.raises(ValidationError):
+            SweepRange(min=1, max=100_000)
+        with pytest.raises(ValidationError):
+            SweepRange(min=10, max=1)
+        assert len(SweepRange(min=0, max=9990, step=10)) == 1000
+        with pytest.raises(ValidationError):
+            SweepRequest(space={"n_estimators": list(range(1001))})
+        with pytest.raises(ValidationError) as exc_info:
+            SweepRequest(space={"n_estimators": {"min": 1, "max": 300},
+                                "max_depth": {"min": 1, "max": 300},
+                                "min_samples_leaf": {"min": 1, "max": 30}})
+        assert "2700000 candidates" in str(exc_info.value)
+
+    def test_sweep_space_values_are_not_empty(self):
+        with pytest.raises(ValidationError) as exc_info:
+            SweepRequest(space={"max_depth": []})
+        assert "at least one value" in str(exc_info.value)
+
+        with pytest.raises(ValidationError) as exc_info:
+            SweepRequest(space={"max_depth": SweepRange.construct(min=5, max=1, step=1)})
+        assert "max is below min" in str(exc_info.value)
+
+    def test_halving_rounds(self):
+        assert halving_rounds(1, 3) == 0
+        assert halving_rounds(3, 3) == 1
+        assert halving_rounds(4, 3) == 2
+        assert halving_rounds(125, 5) == 3
+        assert halving_rounds(126, 5) == 4
+
+    def test_expand_space_invalid_candidate(self):
+        with pytest.raises(ValueError) as exc_info:
+            expand_space({"min_samples_split": [1, 2]}, max_candidates=10, random_state=0)
+
+        assert "Invalid candidate" in str(exc_info.value)
+
+    def test_successive_halving(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(200, 4))
+        y = np.where(X[:, 0] + X[:, 1] > 0, "a", "b").astype(object)
+        candidates = [{"n_estimators": 5, "max_depth": depth} for depth in (1, 2, 4, 8)]
+        candidates.append({"n_estimators": 5, "max_features": "invalid"})
+
+        leaderboard = successive_halving(
+            candidates, X[:150], y[:150], X[150:], y[150:],
+            eta=2, min_rows=20, random_state=0, max_workers=2)
+
+        assert len(leaderboard) == 5
+        assert leaderboard[0]["rows"] == 150
+        assert leaderboard[0]["score"] > 0.8
+        assert leaderboard[-1]["score"] is None
+        assert leaderboard[-1]["error"]
+        assert [entry["rows"] for entry in leaderboard].count(150) == 1
@@ -0,0 +1,186 @@
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from src.schemas.firebase import FirebaseUser
+from src.services.firebase import (
+    CertificateRefresher, TokenCache, initialize_firebase, token_cache, verify_firebase_token)
+
+CLAIMS = {"email": "test@example.com", "user_id": "user_id_123", "role": "admin"}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+def _user(user_id: str = "user_id_123") -> FirebaseUser:
+    return FirebaseUser(email="test@example.com", user_id=user_id, role="admin")
+
+
+class TestTokenCache:
+
+    @patch("src.services.firebase.auth.verify_id_token")
+    def test_verified_token_is_cached(self, mock_verify_id_token: MagicMock):
+        mock_verify_id_token.return_value = {**CLAIMS, "exp": time.time() + 3600}
+
+        first = verify_firebase_token("token")
+        second = verify_firebase_token("token")
+
+        assert second == first
+        mock_verify_id_token.assert_called_once_with("token")
+        assert token_cache.stats()["hits"] == 1
+
+    @patch("src.services.firebase.auth.verify_id_token")
+    def test_token_without_exp_is_not_cached(self, mock_verify_id_token: MagicMock):
+        mock_verify_id_token.return_value = CLAIMS
+
+        verify_firebase_token("token")
+        verify_firebase_token("token")
+
+        assert mock_verify_id_token.call_count == 2
+        assert token_cache.stats()["entries"] == 0
+
+    def test_expired_token_is_dropped(self):
+        cache = TokenCache()
+        cache.put("token", _user(), time.time() + 60)
+
+        with patch("src.services.firebase.time.time", return_value=time.time() + 61):
+            assert cache.get("token") is None
+        assert cache.stats()["expired"] == 1
+        assert cache.stats()["entries"] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TokenCache(max_entries=2)
+        expires_at = time.time() + 60
+        cache.put("a", _user("a"), expires_at)
+        cache.put("b", _user("b"), expires_at)
+        cache.get("a")
+        cache.put("c", _user("c"), expires_at)
+
+        assert cache.get("b") is None
+        assert cache.get("a").user_id == "a"
+        assert cache.get("c").user_id == "c"
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["hit_rate"] == pytest.approx(3 / 4)
+
+    def test_keys_are_digests(self):
+        cache = TokenCache()
+        cache.put("secret-token", _user(), time.time() + 60)
+
+        assert "secret-token" not in cache._entries
+        assert len(next(iter(cache._entries))) == 64
+
+
+def _signing_key() -> tuple[bytes, str]:
+    """ Return a private key and a self-signed certificate of its public key """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    now = datetime.now(timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+                   .public_key(key.public_key()).serial_number(1)
+                   .not_valid_before(now - timedelta(days=1))
+                   .not_valid_after(now + timedelta(days=1))
+                   .sign(key, hashes.SHA256()))
+    private_key = key.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    return private_key, certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def _token(private_key: bytes, expires_in: float = 3600, **claims) -> str:
+    from google.auth import crypt, jwt
+
+    now = int(time.time())
+    payload = {"iss": "https://securetoken.google.com/project", "aud": "project",
+               "sub": "user_id_123", "iat": now - 60, "exp": int(now + expires_in),
+               **CLAIMS, **claims}
+    return jwt.encode(crypt.RSASigner.from_string(private_key, "kid"), payload).decode()
+
+
+def _refresher(certificates: dict, status_code: int = 200, **kwargs) -> CertificateRefresher:
+    transport = httpx.MockTransport(lambda request: httpx.Response(status_code, json=certificates))
+    return CertificateRefresher(transport=transport, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def signing_key() -> tuple[bytes, str]:
+    return _signing_key()
+
+
+@patch("firebase_admin.get_app", return_value=SimpleNamespace(project_id="project"))
+class TestCertificateRefresher:
+
+    def test_refresh_downloads_certificates(self, mock_get_app: MagicMock, signing_key):
+        refresher = _refresher({"kid": signing_key[1]})
+
+        refresher.refresh()
+
+        assert refresher.certificates == {"kid": signing_key[1]}
+        assert refresher.stats()["refreshes"] == 1
+        assert refresher.stats()["certificates"] == 1
+
+    @patch("src.services.firebase.auth.verify_id_token")
+    def test_token_is_verified_in_memory(self, mock_verify_id_token: MagicMock,
+                                         mock_get_app: MagicMock, signing_key):
+        refresher = _refresher({"kid": signing_key[1]})
+        refresher.refresh()
+
+        with patch("src.services.firebase.cert_refresher", refresher):
+            user = verify_firebase_token(_token(signing_key[0]))
+            with pytest.raises(HTTPException) as expired:
+                verify_firebase_token(_token(signing_key[0], expires_in=-3600))
+            with pytest.raises(HTTPException) as other_project:
+                verify_firebase_token(_token(signing_key[0], iss="https://securetoken.google.com/other"))
+
+        assert user == _user()
+        assert expired.value.status_code == 401
+        assert other_project.value.status_code == 401
+        mock_verify_id_token.assert_not_called()
+
+    @patch("src.services.firebase.auth.verify_id_token")
+    def test_unknown_key_is_verified_by_firebase(self, mock_verify_id_token: MagicMock,
+                                                 mock_get_app: MagicMock, signing_key):
+        mock_verify_id_token.return_value = CLAIMS
+        refresher = _refresher({"other-kid": signing_key[1]})
+        refresher.refresh()
+        token = _token(signing_key[0])
+
+        with patch("src.services.firebase.cert_refresher", refresher):
+            assert verify_firebase_token(token) == _user()
+        mock_verify_id_token.assert_called_once_with(token)
+
+    def test_background_thread_retries_failures(self, mock_get_app: MagicMock):
+        refresher = _refresher({}, status_code=500, interval=0.01)
+
+        refresher.start()
+        deadline = time.monotonic() + 5
+        while refresher.failures < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        refresher.stop()
+
+        assert refresher.failures >= 2
+        assert refresher.refreshes == 0
+
+    def test_starts_once_firebase_is_initialized(self, mock_get_app: MagicMock):
+        with patch("src.services.firebase.cert_refresher") as refresher, \
+                patch("src.services.firebase.FirebaseClient", side_effect=ValueError("no credentials")):
+            initialize_firebase()
+            refresher.start.assert_not_called()
+
+        with patch("src.services.firebase.cert_refresher") as refresher, \
+                patch("src.services.firebase.FirebaseClient"):
+            initialize_firebase()
+            refresher.start.assert_called_once_with()
@@ -0,0 +1,78 @@
+import asyncio
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from src.services.data import Dataset, get_iris_web, iter_zip_csv, read_zip_csv
+
+
+class TestIterZipCsv:
+
+    @pytest.fixture
+    def archive(self, tmp_path: Path) -> Path:
+        rows = "\n".join(f"{i},{i * 0.5}" for i in range(25))
+        archive_path = tmp_path / "iris.zip"
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("README.txt", "not a csv")
+            z.writestr("database.sqlite", b"\0" * 1024)
+            z.writestr("Iris.csv", "Id,SepalLengthCm\n" + rows + "\n")
+            z.writestr("other.csv", "a\n1\n")
+        return archive_path
+
+    def test_iter_zip_csv_chunks(self, archive):
+        chunks = list(iter_zip_csv(archive, chunksize=10))
+
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        assert list(chunks[0].columns) == ["Id", "SepalLengthCm"]
+        assert chunks[-1]["Id"].iloc[-1] == 24
+
+    def test_iter_zip_csv_member(self, archive):
+        chunks = list(iter_zip_csv(archive, member="other.csv"))
+
+        assert chunks[0].to_dict(orient="records") == [{"a": 1}]
+
+    def test_iter_zip_csv_no_csv(self, tmp_path):
+        archive_path = tmp_path / "empty.zip"
+        with zipfile.ZipFile(archive_path, "w") as z:
+            z.writestr("README.txt", "not a csv")
+
+        with pytest.raises(HTTPException) as exc_info:
+            list(iter_zip_csv(archive_path))
+
+        assert exc_info.value.status_code == 404
+
+    def test_read_zip_csv(self, archive):
+        with zipfile.ZipFile(archive) as z, z.open("Iris.csv") as csv_file:
+            expected = pd.read_csv(csv_file)
+
+        pd.testing.assert_frame_equal(read_zip_csv(archive, chunksize=10), expected)
+
+    def test_read_zip_csv_header_only(self, tmp_path):
+        archive_path = tmp_path / "header.zip"
+        with zipfile.ZipFile(archive_path, "w") as z:
+            z.writestr("Iris.csv", "Id,SepalLengthCm\n")
+
+        frame = read_zip_csv(archive_path)
+
+        assert list(frame.columns) == ["Id", "SepalLengthCm"]
+        assert len(frame) == 0
+
+    def test_get_iris_web_from_a_running_loop(self, archive):
+        async def download_file(url: str, output_file: Path) -> Path:
+            output_file.write_bytes(archive.read_bytes())
+            return output_file
+
+        async def handler() -> pd.DataFrame:
+            return get_iris_web()
+
+        with patch("src.services.data.get_dataset_infos",
+                   return_value=Dataset(name="iris", url="https://test.fr/iris.zip")), \
+                patch("src.services.data.download_file", new=download_file):
+            iris = asyncio.run(handler())
+
+        assert len(iris) == 25
+        assert list(iris.columns) == ["Id", "SepalLengthCm"]
@@ -0,0 +1,46 @@
+import runpy
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.services import data, firebase
+
+BENCHMARK = Path(__file__).resolve().parents[2] / "benchmarks" / "load_test.py"
+
+
+@pytest.fixture(scope="module")
+def load_test() -> dict:
+    return runpy.run_path(str(BENCHMARK))
+
+
+def _results(**routes) -> dict:
+    return {"routes": {name: {"throughput_rps": 100.0, "p50_ms": 5.0, "p95_ms": 10.0,
+                              "p99_ms": 20.0, "rss_kb": 100_000, "errors": 0, **metrics}
+                       for name, metrics in routes.items()}}
+
+
+class TestLoadBenchmark:
+
+    def test_every_scenario_runs_offline(self, load_test, tmp_path):
+        # The offline app replaces these, they are restored after the test
+        with patch.object(data, "DATA_FILE_PATH", new=data.DATA_FILE_PATH), \
+                patch.object(data, "JSON_CONFIG_PATH", new=data.JSON_CONFIG_PATH), \
+                patch.object(firebase, "auth", new=firebase.auth):
+            app, token = load_test["create_offline_app"](tmp_path, rows=30, users=5)
+            client = TestClient(app, base_url="http://testserver")
+
+            for name, scenario in load_test["SCENARIOS"].items():
+                response = client.request(**load_test["request_kwargs"](scenario, token))
+                assert response.status_code < 400, (name, response.text)
+
+    def test_compare_flags_regressions(self, load_test):
+        baseline = _results(predict={}, users={})
+        current = _results(predict={"p95_ms": 10.5, "throughput_rps": 95.0},
+                           users={"p99_ms": 40.0, "errors": 2})
+
+        regressions = load_test["compare"](baseline, current, 0.15)
+
+        assert [(r["route"], r["metric"]) for r in regressions] == [
+            ("users", "p99_ms"), ("users", "errors")]
@@ -0,0 +1,39 @@
+import os
+import runpy
+from pathlib import Path
+
+import pytest
+
+BENCHMARK = Path(__file__).resolve().parents[2] / "benchmarks" / "startup_time.py"
+
+
+@pytest.fixture(scope="module")
+def startup_time() -> dict:
+    return runpy.run_path(str(BENCHMARK))
+
+
+class TestStartupTime:
+
+    def test_heavy_dependencies_are_not_imported(self, startup_time):
+        result = startup_time["measure_startup"]()
+
+        assert result["heavy_modules"] == []
+
+    # The time depends on the machine and its load: measured on demand only
+    @pytest.mark.skipif(not os.getenv("STARTUP_BENCHMARK"),
+                        reason="Set STARTUP_BENCHMARK=1 to check the startup budget")
+    def test_startup_budget(self, startup_time):
+        result = startup_time["measure_startup"]()
+
+        assert result["seconds"] < startup_time["STARTUP_BUDGET"]
+
+    def test_parse_importtime(self, startup_time):
+        imports = startup_time["parse_importtime"](
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   numpy.core\n"
+            "import time:       300 |        420 | numpy\n")
+
+        assert imports == [
+            {"module": "numpy.core", "depth": 1, "self_ms": 0.12, "cumulative_ms": 0.12},
+            {"module": "numpy", "depth": 0, "self_ms": 0.3, "cumulative_ms": 0.42},
+        ]